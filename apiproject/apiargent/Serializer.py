@@ -1,4 +1,12 @@
-from rest_framework import serializers
+import decimal
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import QuerySet
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+
 from .models import Account, Log
 
 class AccountSerializer(serializers.ModelSerializer):
@@ -25,4 +33,96 @@ class LogSerializer(serializers.ModelSerializer):
             "cible",
             "libele",
         ]
-        read_only_fields = ['date_action']
\ No newline at end of file
+        read_only_fields = ['date_action']
+
+class ValuesSerializer:
+    """
+    Sérialisation en lecture seule à partir de ``.values_list()``, sans
+    instancier de modèles ni parcourir les champs DRF ligne par ligne.
+
+    Les convertisseurs sont calculés une fois à partir des champs du
+    ``ModelSerializer`` et donnent exactement la même sortie que lui.
+    """
+
+    def __init__(self, serializer_class):
+        self.fields = list(serializer_class().fields.items())
+        for name, field in self.fields:
+            if '.' in field.source or field.source == '*':
+                raise ValueError(f"Champ {name} non pris en charge par ValuesSerializer")
+        self.names = [name for name, _ in self.fields]
+        self.columns = [field.source for _, field in self.fields]
+        # Attributs des instances correspondant aux colonnes (account -> account_id)
+        opts = serializer_class.Meta.model._meta
+        self.attnames = [opts.get_field(column).attname for column in self.columns]
+
+    def values(self, queryset, *extra):
+        # Tuples nommés : la pagination par curseur lit date_action et id sur la dernière ligne.
+        # Les colonnes ``extra`` (ex. version) suivent les champs et sont ignorées à la sérialisation.
+        return queryset.values_list(*self.columns, *extra, named=True)
+
+    def converters(self):
+        # Fuseau courant lu à chaque appel, comme DateTimeField.enforce_timezone
+        tz = timezone.get_current_timezone() if settings.USE_TZ else None
+        return [_converter(field, tz) for _, field in self.fields]
+
+    def to_representation(self, row, converters=None):
+        converters = converters or self.converters()
+        return {name: (None if value is None else convert(value) if convert else value)
+                for name, convert, value in zip(self.names, converters, row)}
+
+    def serialize(self, rows):
+        """Liste de dictionnaires pour des lignes issues de ``values()`` (ou ``values()`` appliqué à un queryset)."""
+        if isinstance(rows, QuerySet):
+            rows = self.values(rows)
+        names = self.names
+        converters = self.converters()
+        if not any(converters):
+            return [dict(zip(names, row)) for row in rows]
+        return [
+            {name: (None if value is None else convert(value) if convert else value)
+             for name, convert, value in zip(names, converters, row)}
+            for row in rows
+        ]
+
+    def serialize_instances(self, instances):
+        """Même sortie pour des instances déjà en mémoire (ex. logs créés par ``bulk_create``)."""
+        attnames = self.attnames
+        return self.serialize([[getattr(instance, attname) for attname in attnames] for instance in instances])
+
+
+def _converter(field, tz):
+    """Fonction de conversion d'une valeur non nulle, ou None si la valeur est déjà celle de DRF."""
+    if isinstance(field, serializers.DecimalField):
+        coerce_to_string = getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+        if coerce_to_string and not field.localize and not field.normalize_output and field.decimal_places is not None:
+            quantum = Decimal('.1') ** field.decimal_places
+            context = decimal.getcontext().copy()
+            if field.max_digits is not None:
+                context.prec = field.max_digits
+            rounding = field.rounding
+            return lambda value: '{:f}'.format(value.quantize(quantum, rounding, context))
+
+    elif isinstance(field, serializers.DateTimeField):
+        output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+        if output_format is not None and output_format.lower() == ISO_8601 and not hasattr(field, 'timezone') and tz is not None:
+            def convert_datetime(value):
+                if timezone.is_naive(value):
+                    return field.to_representation(value)
+                value = value.astimezone(tz).isoformat()
+                if value.endswith('+00:00'):
+                    value = value[:-6] + 'Z'
+                return value
+            return convert_datetime
+
+    elif isinstance(field, (serializers.IntegerField, serializers.CharField, serializers.ChoiceField, serializers.ReadOnlyField)):
+        return None
+
+    elif isinstance(field, serializers.PrimaryKeyRelatedField) and field.pk_field is None:
+        # values_list() renvoie déjà la clé primaire de l'objet lié
+        return None
+
+    return field.to_representation
+
+
+account_values_serializer = ValuesSerializer(AccountSerializer)
+log_values_serializer = ValuesSerializer(LogSerializer)
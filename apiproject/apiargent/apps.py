@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ApiargentConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apiargent'
+
+    def ready(self):
+        from . import signals  # noqa: F401
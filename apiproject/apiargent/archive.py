@@ -0,0 +1,123 @@
+import heapq
+from collections import defaultdict
+from decimal import Decimal
+from itertools import islice
+
+from django.db import transaction
+
+from .models import CREDIT_ACTIONS, ArchivedLog, BalanceCheckpoint, Log, SettlementJob
+from .response_cache import PENDING_ACTIONS, invalidate
+
+# Nombre de logs déplacés par transaction
+ARCHIVE_CHUNK_SIZE = 1000
+
+ARCHIVED_FIELDS = ('id', 'account_id', 'action', 'montant', 'date_action', 'date_valeur', 'cible_id', 'libele', 'refuse', 'origine_id')
+
+
+def archive_logs(cutoff, chunk_size=ARCHIVE_CHUNK_SIZE, max_chunks=None):
+    """
+    Déplace vers ``ArchivedLog`` les logs réglés (validés ou refusés) dont la
+    date d'action est antérieure à ``cutoff``, par transactions de
+    ``chunk_size`` logs au plus.
+
+    Chaque paquet est copié, ajouté aux points de contrôle des comptes puis
+    supprimé dans la même transaction : une interruption ne laisse ni doublon
+    ni trou, et une nouvelle exécution reprend simplement là où la précédente
+    s'est arrêtée. Les logs en attente restent dans la table courante.
+    Le log reçu d'un virement archivé est archivé dans le même paquet.
+
+    La suppression se fait en une requête, sans charger les logs ni envoyer
+    un signal par log : les liens vers les logs supprimés (demandes de
+    règlement, ``origine``) sont traités avant, le cache est invalidé une
+    fois par paquet. Retourne le nombre de logs archivés.
+    """
+    archived = 0
+    chunks = 0
+    while max_chunks is None or chunks < max_chunks:
+        with transaction.atomic():
+            logs = list(
+                Log.objects.select_for_update()
+                .filter(date_valeur__isnull=False, date_action__lt=cutoff)
+                .order_by('id')[:chunk_size]
+            )
+            if not logs:
+                break
+            pks = [log.pk for log in logs]
+            transfers = [log.pk for log in logs if log.action == 'virement_envoye']
+            if transfers:
+                logs += (
+                    Log.objects.select_for_update()
+                    .filter(origine__in=transfers, date_valeur__isnull=False)
+                    .exclude(pk__in=pks)
+                )
+                pks = [log.pk for log in logs]
+            ArchivedLog.objects.bulk_create(
+                [ArchivedLog(**{field: getattr(log, field) for field in ARCHIVED_FIELDS}) for log in logs]
+            )
+            update_checkpoints(logs)
+            SettlementJob.objects.filter(log_id__in=pks).delete()
+            # Log resté dans la table qui référence un log archivé (log reçu encore en attente) : le lien n'existe plus qu'en archive
+            Log.objects.filter(origine__in=pks).exclude(pk__in=pks).update(origine=None)
+            Log.objects.filter(pk__in=pks)._raw_delete(Log.objects.db)
+            invalidate(PENDING_ACTIONS)
+        archived += len(logs)
+        chunks += 1
+    return archived
+
+
+def update_checkpoints(logs):
+    """Ajoute les logs archivés (nombre, mouvements validés, date la plus récente) au point de contrôle de leur compte."""
+    counts = defaultdict(int)
+    totals = defaultdict(Decimal)
+    latest = {}
+    for log in logs:
+        counts[log.account_id] += 1
+        if not log.refuse:
+            totals[log.account_id] += log.montant if log.action in CREDIT_ACTIONS else -log.montant
+        if log.account_id not in latest or log.date_action > latest[log.account_id]:
+            latest[log.account_id] = log.date_action
+
+    existing = BalanceCheckpoint.objects.select_for_update().filter(account_id__in=counts).order_by('account_id')
+    checkpoints = {checkpoint.account_id: checkpoint for checkpoint in existing}
+    created = []
+    for account_id, count in counts.items():
+        checkpoint = checkpoints.get(account_id)
+        if checkpoint is None:
+            created.append(BalanceCheckpoint(
+                account_id=account_id,
+                archived_until=latest[account_id],
+                archived_count=count,
+                archived_total=totals[account_id],
+            ))
+            continue
+        checkpoint.archived_count += count
+        checkpoint.archived_total += totals[account_id]
+        checkpoint.archived_until = max(checkpoint.archived_until, latest[account_id])
+    BalanceCheckpoint.objects.bulk_create(created)
+    BalanceCheckpoint.objects.bulk_update(checkpoints.values(), ['archived_count', 'archived_total', 'archived_until'])
+
+
+def get_checkpoint(account):
+    """Point de contrôle du compte (lu avec le compte par ``AccountLoader``), ou None sans historique archivé."""
+    try:
+        return account.checkpoint
+    except BalanceCheckpoint.DoesNotExist:
+        return None
+
+
+def merge_history(hot_rows, archived, limit=None, archived_until=None):
+    """
+    Complète des logs courants, triés du plus récent au plus ancien sur
+    (date_action, id), par les logs archivés du même ordre (``archived`` :
+    queryset ou liste). Toutes les lignes archivées étant antérieures ou
+    égales à ``archived_until``, l'archive n'est lue que si elle peut
+    apparaître dans les ``limit`` premières lignes.
+    """
+    if archived_until is None:
+        return list(hot_rows[:limit]) if limit is not None else list(hot_rows)
+    if limit is not None and len(hot_rows) >= limit and hot_rows[limit - 1].date_action > archived_until:
+        return list(hot_rows[:limit])
+    if limit is not None:
+        archived = archived[:limit]
+    merged = heapq.merge(hot_rows, archived, key=lambda row: (row.date_action, row.id), reverse=True)
+    return list(islice(merged, limit))
@@ -0,0 +1,12 @@
+from django.urls import path
+
+from . import async_views
+
+# Routes servies par des vues asynchrones sous ASGI ; elles masquent les
+# routes synchrones de même chemin définies dans urls.py.
+urlpatterns = [
+    path('api/', async_views.account_list, name='account-list'),
+    path("api/<int:id>/", async_views.account_detail, name='account-detail'),
+    path("api/list/", async_views.user_accounts, name='user-accounts'),
+    path("api/pending-actions/events/", async_views.pending_events, name='pending-events'),
+]
@@ -0,0 +1,171 @@
+"""
+Vues asynchrones servies par le point d'entrée ASGI (voir apiproject/asgi_urls.py).
+
+Elles reprennent le comportement des vues DRF en lecture les plus sollicitées
+(liste des comptes, détail d'un compte, comptes de l'utilisateur) mais
+authentifient le token sans bloquer la boucle d'événements et lisent la base
+avec l'ORM asynchrone : un appel lent à l'API d'authentification n'occupe plus
+un worker entier. Le flux des actions en attente (voir events.py) y est
+également servi : une connexion ouverte ne coûte qu'une tâche en attente.
+"""
+import json
+
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+from rest_framework import exceptions, status
+from .Serializer import AccountSerializer, account_values_serializer
+from .authentication import authenticate_async
+from .conditional import account_versions, is_not_modified, make_etag
+from .events import broker, format_sse
+from .models import Account
+from .renderers import FastJSONRenderer
+from .streaming import serialize_aiter, streaming_response
+from .views import account_list_filter
+
+# Intervalle des commentaires keep-alive du flux SSE (secondes)
+EVENTS_HEARTBEAT = getattr(settings, 'EVENTS_HEARTBEAT', 15)
+# Durée maximale d'une connexion SSE ; le client se reconnecte avec Last-Event-ID
+EVENTS_STREAM_MAX_AGE = getattr(settings, 'EVENTS_STREAM_MAX_AGE', 300)
+# Attente maximale d'une requête en long-poll (secondes)
+EVENTS_LONG_POLL_TIMEOUT = getattr(settings, 'EVENTS_LONG_POLL_TIMEOUT', 25)
+# Délai de reconnexion conseillé aux clients SSE (millisecondes)
+EVENTS_RETRY = 3000
+
+
+def json_response(data, status_code=status.HTTP_200_OK, etag=None):
+    # Même rendu que Response(...) avec le JSONRenderer de DRF
+    response = HttpResponse(FastJSONRenderer().render(data), content_type='application/json', status=status_code)
+    if etag:
+        response['ETag'] = etag
+    return response
+
+
+def not_modified(etag):
+    response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+    response['ETag'] = etag
+    return response
+
+
+async def authenticate(request, required=True):
+    """Retourne (utilisateur, None) ou (None, réponse d'erreur) avec les codes des vues DRF."""
+    try:
+        result = await authenticate_async(request)
+    except exceptions.AuthenticationFailed as e:
+        return None, json_response({'detail': e.detail}, status.HTTP_403_FORBIDDEN)
+    if result is None:
+        if required:
+            return None, json_response({'detail': exceptions.NotAuthenticated.default_detail}, status.HTTP_403_FORBIDDEN)
+        return None, None
+    return result[0], None
+
+
+def permission_denied():
+    return json_response({'detail': exceptions.PermissionDenied.default_detail}, status.HTTP_403_FORBIDDEN)
+
+
+@require_GET
+async def account_list(request):
+    _, error = await authenticate(request, required=False)
+    if error:
+        return error
+
+    try:
+        accounts, limit = account_list_filter(request.GET)
+    except ValueError:
+        return json_response({"res": "Invalid filter or paging parameters"}, status.HTTP_400_BAD_REQUEST)
+
+    stream = request.GET.get("stream")
+    if stream in ('json', 'ndjson'):
+        return streaming_response(serialize_aiter(accounts, AccountSerializer, limit=limit), fmt=stream)
+
+    if limit is not None:
+        accounts = accounts[:limit]
+
+    rows = [row async for row in account_values_serializer.values(accounts)]
+    return json_response(account_values_serializer.serialize(rows))
+
+
+@require_GET
+async def account_detail(request, id):
+    user, error = await authenticate(request)
+    if error:
+        return error
+
+    account = await Account.objects.filter(pk=id).afirst()
+    # Comme PermissionSelfAccountOrBanquier : un compte introuvable est refusé
+    if account is None or not (user.id == account.user_id or user.role in ('banquier', 'administrateur')):
+        return permission_denied()
+
+    etag = make_etag(request, account.version)
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+    return json_response(AccountSerializer(account).data, etag=etag)
+
+
+@require_GET
+async def user_accounts(request):
+    user, error = await authenticate(request)
+    if error:
+        return error
+
+    accounts = account_values_serializer.values(Account.objects.filter(user_id=user.id), 'version')
+    rows = [row async for row in accounts]
+    etag = make_etag(request, account_versions(rows))
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+    return json_response(account_values_serializer.serialize(rows), etag=etag)
+
+
+async def iter_events(cursor, max_age=EVENTS_STREAM_MAX_AGE, heartbeat=EVENTS_HEARTBEAT):
+    """Flux SSE des événements postérieurs à ``cursor``, avec un commentaire keep-alive en l'absence d'événement."""
+    yield f"retry: {EVENTS_RETRY}\n\n"
+    await broker.subscribe()
+    try:
+        deadline = broker.loop.time() + max_age
+        while (remaining := deadline - broker.loop.time()) > 0:
+            events = await broker.wait(cursor, min(heartbeat, remaining))
+            if not events:
+                yield ": keep-alive\n\n"
+                continue
+            for event in events:
+                yield format_sse(event)
+            cursor = events[-1].id
+    finally:
+        broker.unsubscribe()
+
+
+@require_GET
+async def pending_events(request):
+    """
+    Événements des actions en attente (``created``, ``validated``,
+    ``declined``, ``reset``) en Server-Sent Events, ou en long-poll JSON avec
+    ``?mode=poll``. La reprise se fait depuis l'en-tête ``Last-Event-ID`` ou
+    ``?last_event_id=`` ; sans identifiant, seuls les nouveaux événements sont envoyés.
+    """
+    user, error = await authenticate(request)
+    if error:
+        return error
+    if user.role not in ('banquier', 'administrateur'):
+        return permission_denied()
+
+    last_event_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+    try:
+        cursor = int(last_event_id) if last_event_id else await broker.current_id()
+        timeout = min(float(request.GET.get('timeout', EVENTS_LONG_POLL_TIMEOUT)), EVENTS_LONG_POLL_TIMEOUT)
+    except ValueError:
+        return json_response({"res": "Invalid event id or timeout"}, status.HTTP_400_BAD_REQUEST)
+
+    if request.GET.get('mode') == 'poll':
+        async with broker.subscription():
+            events = await broker.wait(cursor, timeout)
+        return json_response({
+            'last_event_id': events[-1].id if events else cursor,
+            'events': [{'id': event.id, 'event': event.kind, 'data': json.loads(event.data)} for event in events],
+        })
+
+    response = StreamingHttpResponse(iter_events(cursor), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Empêche nginx de remettre le flux en tampon
+    response['X-Accel-Buffering'] = 'no'
+    return response
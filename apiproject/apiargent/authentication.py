@@ -1,54 +1,278 @@
+import asyncio
+import os
+import threading
+import time
+import weakref
+
+import httpx
 import requests
 import logging
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.core.cache import cache
+from requests.adapters import HTTPAdapter
 from rest_framework import authentication, exceptions
 
+from .metrics import AUTH_API_DURATION, record_auth, registry
+
 logger = logging.getLogger(__name__)
 
+# Durée pendant laquelle un token validé est considéré comme frais (secondes)
+AUTH_CACHE_TTL = getattr(settings, 'AUTH_CACHE_TTL', 300)
+# Durée supplémentaire pendant laquelle un token expiré est servi pendant son rafraîchissement
+AUTH_CACHE_STALE_TTL = getattr(settings, 'AUTH_CACHE_STALE_TTL', 60)
+# Durée de mise en cache d'un refus (401) de l'API d'authentification
+AUTH_NEGATIVE_CACHE_TTL = getattr(settings, 'AUTH_NEGATIVE_CACHE_TTL', 30)
+AUTH_API_TIMEOUT = getattr(settings, 'AUTH_API_TIMEOUT', 5)
+AUTH_API_POOL_SIZE = getattr(settings, 'AUTH_API_POOL_SIZE', 10)
+
+INVALID_TOKEN = 'invalid'
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Session HTTP (keep-alive) partagée par le processus, recréée après un fork."""
+    global _session, _session_pid
+    pid = os.getpid()
+    if _session is None or _session_pid != pid:
+        with _session_lock:
+            if _session is None or _session_pid != pid:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=AUTH_API_POOL_SIZE)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                _session, _session_pid = session, pid
+    return _session
+
+
+class _InFlight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def single_flight(key, func):
+    """
+    Exécute ``func`` une seule fois par clé à un instant donné : les appels
+    concurrents sur la même clé attendent le résultat du premier.
+    """
+    with _inflight_lock:
+        call = _inflight.get(key)
+        leader = call is None
+        if leader:
+            call = _inflight[key] = _InFlight()
+
+    if not leader:
+        call.done.wait(AUTH_API_TIMEOUT + 1)
+        if call.error is not None:
+            raise call.error
+        if not call.done.is_set():
+            raise exceptions.AuthenticationFailed('Délai dépassé lors de la validation du token')
+        return call.result
+
+    try:
+        call.result = func()
+        return call.result
+    except Exception as e:
+        call.error = e
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+        call.done.set()
+
+
+def cache_key_for(token):
+    return f"auth_token_{token}"
+
+
+def cache_user(token, user_data):
+    entry = {'user': user_data, 'fresh_until': time.time() + AUTH_CACHE_TTL}
+    cache.set(cache_key_for(token), entry, timeout=AUTH_CACHE_TTL + AUTH_CACHE_STALE_TTL)
+
+
+def build_user(user_data):
+    return type('User', (), {
+        **user_data,
+        'is_authenticated': True,
+        'is_active': True,
+        '__str__': lambda self: str(self.user_id if hasattr(self, 'user_id') else 'Unknown')
+    })
+
+
+def validate_remote(token):
+    """Valide le token auprès de l'API d'authentification et met le résultat en cache."""
+    start = time.perf_counter()
+    try:
+        headers = {'Authorization': f'Token {token}'}
+        response = get_session().post(
+            settings.AUTH_API_URL,
+            headers=headers,
+            timeout=AUTH_API_TIMEOUT
+        )
+    except requests.RequestException as e:
+        raise exceptions.AuthenticationFailed(f'Erreur de connexion à l\'API: {str(e)}')
+    finally:
+        registry.observe(AUTH_API_DURATION, (), time.perf_counter() - start)
+
+    return handle_validation_response(token, response)
+
+
+def handle_validation_response(token, response):
+    """Met en cache la réponse de l'API d'authentification (requests ou httpx) et retourne l'utilisateur."""
+    if response.status_code == 200:
+        user_data = response.json()
+        cache_user(token, user_data)
+        return user_data
+    elif response.status_code == 401:
+        cache.set(cache_key_for(token), INVALID_TOKEN, timeout=AUTH_NEGATIVE_CACHE_TTL)
+        raise exceptions.AuthenticationFailed('Token expiré ou invalide')
+    else:
+        raise exceptions.AuthenticationFailed(f'Erreur d\'authentification: {response.status_code}')
+
+
+def _refresh_in_background(token):
+    def refresh():
+        try:
+            single_flight(token, lambda: validate_remote(token))
+        except exceptions.AuthenticationFailed as e:
+            logger.info("Rafraîchissement du token impossible: %s", e.detail)
+        except Exception:
+            logger.exception("Erreur lors du rafraîchissement du token")
+
+    threading.Thread(target=refresh, daemon=True).start()
+
+
+def get_token(request):
+    auth_header = request.META.get('HTTP_AUTHORIZATION')
+    if not auth_header:
+        return None
+
+    parts = auth_header.split()
+    if len(parts) != 2 or parts[0].lower() not in ('token', 'bearer'):
+        return None
+    return parts[1]
+
+
+# Chemin asynchrone (ASGI) : mêmes règles de cache, client HTTP non bloquant
+
+_async_clients = weakref.WeakKeyDictionary()
+_async_inflight = {}
+
+
+def get_async_client():
+    """Client httpx (keep-alive) propre à la boucle d'événements courante."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.is_closed:
+        limits = httpx.Limits(max_connections=AUTH_API_POOL_SIZE, max_keepalive_connections=AUTH_API_POOL_SIZE)
+        client = _async_clients[loop] = httpx.AsyncClient(limits=limits, timeout=AUTH_API_TIMEOUT)
+    return client
+
+
+async def validate_remote_async(token):
+    start = time.perf_counter()
+    try:
+        response = await get_async_client().post(
+            settings.AUTH_API_URL,
+            headers={'Authorization': f'Token {token}'},
+        )
+    except httpx.HTTPError as e:
+        raise exceptions.AuthenticationFailed(f'Erreur de connexion à l\'API: {str(e)}')
+    finally:
+        registry.observe(AUTH_API_DURATION, (), time.perf_counter() - start)
+
+    # Écriture du cache hors de la boucle d'événements
+    return await sync_to_async(handle_validation_response, thread_sensitive=False)(token, response)
+
+
+def single_flight_async(token):
+    """Tâche de validation partagée par toutes les coroutines qui attendent le même token."""
+    key = (asyncio.get_running_loop(), token)
+    task = _async_inflight.get(key)
+    if task is None:
+        task = _async_inflight[key] = asyncio.ensure_future(validate_remote_async(token))
+        task.add_done_callback(lambda _: _async_inflight.pop(key, None))
+    return task
+
+
+def _log_refresh_result(task):
+    if task.cancelled():
+        return
+    error = task.exception()
+    if isinstance(error, exceptions.AuthenticationFailed):
+        logger.info("Rafraîchissement du token impossible: %s", error.detail)
+    elif error is not None:
+        logger.error("Erreur lors du rafraîchissement du token", exc_info=error)
+
+
+async def authenticate_async(request):
+    """
+    Équivalent asynchrone de ``ExternalTokenAuthentication.authenticate`` pour
+    les vues ASGI : retourne ``(user, token)``, ``None`` sans en-tête, ou lève
+    ``AuthenticationFailed``. Ni l'appel à l'API d'authentification ni les
+    accès au cache ne bloquent la boucle d'événements.
+    """
+    token = get_token(request)
+    if token is None:
+        return None
+
+    entry = await cache.aget(cache_key_for(token))
+
+    if entry == INVALID_TOKEN:
+        record_auth(request, 'negative')
+        raise exceptions.AuthenticationFailed('Token expiré ou invalide')
+
+    if entry:
+        if entry['fresh_until'] <= time.time():
+            record_auth(request, 'stale')
+            if (asyncio.get_running_loop(), token) not in _async_inflight:
+                single_flight_async(token).add_done_callback(_log_refresh_result)
+        else:
+            record_auth(request, 'hit')
+        return (build_user(entry['user']), token)
+
+    start = time.perf_counter()
+    try:
+        user_data = await asyncio.shield(single_flight_async(token))
+    finally:
+        record_auth(request, 'miss', time.perf_counter() - start)
+    return (build_user(user_data), token)
+
+
 class ExternalTokenAuthentication(authentication.BaseAuthentication):
     def authenticate(self, request):
-        auth_header = request.META.get('HTTP_AUTHORIZATION')
-        if not auth_header:
+        token = get_token(request)
+        if token is None:
             return None
 
-        parts = auth_header.split()
-        if len(parts) != 2 or parts[0].lower() not in ('token', 'bearer'):
-            return None
+        entry = cache.get(cache_key_for(token))
 
-        token = parts[1]
-        cache_key = f"auth_token_{token}"
-        user_data = cache.get(cache_key)
+        if entry == INVALID_TOKEN:
+            record_auth(request, 'negative')
+            raise exceptions.AuthenticationFailed('Token expiré ou invalide')
 
-        if user_data:
-            user = type('User', (), {
-                **user_data,
-                'is_authenticated': True,
-                'is_active': True,
-                '__str__': lambda self: str(self.user_id if hasattr(self, 'user_id') else 'Unknown')
-            })
-            return (user, token)
+        if entry:
+            # Token expiré mais encore servable : on répond tout de suite et on rafraîchit en arrière-plan
+            if entry['fresh_until'] <= time.time():
+                record_auth(request, 'stale')
+                if token not in _inflight:
+                    _refresh_in_background(token)
+            else:
+                record_auth(request, 'hit')
+            return (build_user(entry['user']), token)
 
+        start = time.perf_counter()
         try:
-            headers = {'Authorization': f'Token {token}'}
-            response = requests.post(
-                settings.AUTH_API_URL,
-                headers=headers,
-                timeout=5
-            )
-            if response.status_code == 200:
-                user_data = response.json()
-                cache.set(cache_key, user_data, timeout=300)  # 5 minutes
-                user = type('User', (), {
-                    **user_data,
-                    'is_authenticated': True,
-                    'is_active': True,
-                    '__str__': lambda self: str(self.user_id if hasattr(self, 'user_id') else 'Unknown')
-                })
-                return (user, token)
-            elif response.status_code == 401:
-                raise exceptions.AuthenticationFailed('Token expiré ou invalide')
-            else:
-                raise exceptions.AuthenticationFailed(f'Erreur d\'authentification: {response.status_code}')
-        except requests.RequestException as e:
-            raise exceptions.AuthenticationFailed(f'Erreur de connexion à l\'API: {str(e)}')
\ No newline at end of file
+            user_data = single_flight(token, lambda: validate_remote(token))
+        finally:
+            record_auth(request, 'miss', time.perf_counter() - start)
+        return (build_user(user_data), token)
@@ -0,0 +1,240 @@
+"""
+Import et export en masse des comptes, des logs, des logs archivés et des
+points de reprise d'archive (CSV ou NDJSON).
+
+Les lignes sont lues et écrites en flux : l'export parcourt la table par
+paquets ordonnés sur la clé primaire, l'import valide chaque ligne puis
+l'insère avec ``bulk_create`` par transactions de taille fixe. Les ids, les
+liens (``account_id``, ``cible_id``, ``origine_id``) et les dates sont
+conservés tels quels ; les comptes doivent donc être importés avant les autres
+tables, et un log envoyé avant le log reçu qui le référence (ordre des ids).
+"""
+import csv
+import json
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.management.color import no_style
+from django.db import connection, models, transaction
+from django.utils import timezone
+
+from .models import Account, ArchivedLog, BalanceCheckpoint, Log
+from .response_cache import CREATED_ACCOUNTS, PENDING_ACTIONS, invalidate
+
+# Colonnes exportées et importées, dans l'ordre des fichiers (clé primaire en premier)
+MODEL_COLUMNS = {
+    'account': (Account, ('id', 'user_id', 'solde', 'debit_en_attente', 'date_creation', 'type_compte', 'statut', 'version')),
+    'log': (Log, ('id', 'account_id', 'action', 'montant', 'date_action', 'date_valeur', 'cible_id', 'libele', 'refuse', 'origine_id')),
+    'archived_log': (ArchivedLog, ('id', 'account_id', 'action', 'montant', 'date_action', 'date_valeur', 'cible_id',
+                                   'libele', 'refuse', 'origine_id', 'date_archivage')),
+    'balance_checkpoint': (BalanceCheckpoint, ('account_id', 'archived_until', 'archived_count', 'archived_total', 'date_maj')),
+}
+FORMATS = ('csv', 'ndjson')
+# Libellé des erreurs de lien, par modèle référencé
+REFERENCE_LABELS = {Account: 'compte inconnu', Log: 'log inconnu'}
+
+# Lignes lues par requête à l'export
+DUMP_CHUNK_SIZE = 5000
+# Lignes par INSERT et par transaction à l'import
+INSERT_BATCH_SIZE = 1000
+TRANSACTION_SIZE = 20000
+
+
+class InvalidRow(ValueError):
+    def __init__(self, line, message):
+        super().__init__(f"ligne {line} : {message}")
+        self.line = line
+
+
+def guess_format(path, default='csv'):
+    """Format d'après l'extension du fichier (.csv, .ndjson, .jsonl)."""
+    if path.endswith(('.ndjson', '.jsonl')):
+        return 'ndjson'
+    if path.endswith('.csv'):
+        return 'csv'
+    return default
+
+
+def _dump_value(value):
+    if isinstance(value, Decimal):
+        return '{:f}'.format(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def iter_dump(name, chunk_size=DUMP_CHUNK_SIZE):
+    """Lignes de la table ``name`` (dictionnaires), lues par paquets ordonnés sur la clé primaire."""
+    model, columns = MODEL_COLUMNS[name]
+    queryset = model.objects.order_by('pk').values_list(*columns)
+    last_id = None
+    while True:
+        chunk = queryset if last_id is None else queryset.filter(pk__gt=last_id)
+        rows = list(chunk[:chunk_size])
+        for row in rows:
+            yield {column: _dump_value(value) for column, value in zip(columns, row)}
+        if len(rows) < chunk_size:
+            return
+        last_id = rows[-1][0]
+
+
+def iter_file(stream, fmt):
+    """(numéro de ligne, dictionnaire ou texte JSON) pour chaque ligne d'un fichier CSV ou NDJSON."""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            # Un champ vide d'un CSV est une valeur nulle
+            yield reader.line_num, {key: (value if value != '' else None) for key, value in row.items()}
+        return
+    # Les lignes NDJSON sont décodées par RowParser : une ligne mal formée est une ligne invalide comme une autre
+    for line_number, line in enumerate(stream, 1):
+        if line.strip():
+            yield line_number, line
+
+
+class RowParser:
+    """Conversion et validation d'une ligne en instance, sans requête (les liens sont vérifiés par paquet)."""
+
+    def __init__(self, name):
+        self.model, self.columns = MODEL_COLUMNS[name]
+        self.fields = [self.model._meta.get_field(column) for column in self.columns]
+        # Liens vérifiés à l'import, par modèle référencé (ArchivedLog.origine n'a pas de contrainte en base)
+        self.foreign_keys = {}
+        for field in self.fields:
+            if isinstance(field, models.ForeignKey) and field.db_constraint:
+                self.foreign_keys.setdefault(field.related_model, []).append(field.attname)
+        self.default_timezone = timezone.get_default_timezone() if settings.USE_TZ else None
+
+    def parse(self, line, row):
+        if isinstance(row, str):
+            try:
+                row = json.loads(row)
+            except ValueError as e:
+                raise InvalidRow(line, f"JSON invalide ({e})")
+        if not isinstance(row, dict):
+            raise InvalidRow(line, "objet JSON attendu")
+        missing = [column for column in self.columns if column not in row]
+        if missing:
+            raise InvalidRow(line, f"colonne(s) manquante(s) : {', '.join(missing)}")
+        values = {}
+        for field in self.fields:
+            value = row[field.attname]
+            try:
+                if isinstance(field, models.ForeignKey):
+                    value = None if value is None else int(value)
+                    if value is None and not field.null:
+                        raise ValidationError("valeur obligatoire")
+                else:
+                    value = field.clean(value, None)
+            except (TypeError, ValueError, ValidationError) as e:
+                messages = e.messages if isinstance(e, ValidationError) else [str(e)]
+                raise InvalidRow(line, f"{field.attname} : {' '.join(messages)}")
+            if isinstance(value, datetime) and self.default_timezone and timezone.is_naive(value):
+                value = timezone.make_aware(value, self.default_timezone)
+            values[field.attname] = value
+        return self.model(**values)
+
+
+@contextmanager
+def preserve_dates(model):
+    """Désactive ``auto_now_add`` et ``auto_now`` pendant l'import : les dates des fichiers sont conservées."""
+    flags = [(field, flag) for field in model._meta.concrete_fields
+             for flag in ('auto_now_add', 'auto_now') if getattr(field, flag, False)]
+    for field, flag in flags:
+        setattr(field, flag, False)
+    try:
+        yield
+    finally:
+        for field, flag in flags:
+            setattr(field, flag, True)
+
+
+def import_rows(name, rows, insert_batch_size=INSERT_BATCH_SIZE, transaction_size=TRANSACTION_SIZE,
+                skip_invalid=False, ignore_conflicts=False, progress=None):
+    """
+    Valide et insère les lignes ``rows`` ((numéro, dictionnaire)) dans la table ``name``.
+
+    Les instances sont insérées par ``bulk_create`` (``insert_batch_size``
+    lignes par INSERT) dans une transaction par paquet de ``transaction_size``
+    lignes, au lieu d'un commit par ligne. Les comptes (et les logs envoyés)
+    référencés par les lignes d'un paquet sont vérifiés en une requête. Une ligne invalide lève
+    ``InvalidRow`` (les paquets précédents restent importés), ou est ignorée
+    avec ``skip_invalid``. ``progress(stats)`` est appelé après chaque paquet.
+    Retourne {'imported', 'invalid', 'errors', 'seconds'} ; avec
+    ``ignore_conflicts``, ``imported`` compte aussi les ids déjà présents.
+    """
+    parser = RowParser(name)
+    stats = {'imported': 0, 'invalid': 0, 'errors': [], 'seconds': 0.0}
+    started = time.monotonic()
+
+    def reject(error):
+        if not skip_invalid:
+            raise error
+        stats['invalid'] += 1
+        # Quelques exemples suffisent au rapport
+        if len(stats['errors']) < 20:
+            stats['errors'].append(str(error))
+
+    def existing_ids(model, attnames, batch):
+        referenced = {getattr(obj, attname) for _, obj in batch for attname in attnames} - {None}
+        existing = set()
+        if model is parser.model:
+            # Lien vers une ligne du même paquet (log reçu et son log envoyé)
+            existing = referenced & {obj.pk for _, obj in batch}
+        referenced = sorted(referenced - existing)
+        for start in range(0, len(referenced), INSERT_BATCH_SIZE):
+            existing.update(model.objects.filter(pk__in=referenced[start:start + INSERT_BATCH_SIZE])
+                            .values_list('pk', flat=True))
+        return existing
+
+    def flush(batch):
+        for model, attnames in parser.foreign_keys.items():
+            existing = existing_ids(model, attnames, batch)
+            valid = []
+            for line, obj in batch:
+                unknown = [attname for attname in attnames
+                           if getattr(obj, attname) is not None and getattr(obj, attname) not in existing]
+                if unknown:
+                    reject(InvalidRow(line, f"{REFERENCE_LABELS[model]} ({', '.join(unknown)})"))
+                else:
+                    valid.append((line, obj))
+            batch = valid
+        with transaction.atomic():
+            parser.model.objects.bulk_create([obj for _, obj in batch], batch_size=insert_batch_size,
+                                             ignore_conflicts=ignore_conflicts)
+        stats['imported'] += len(batch)
+        stats['seconds'] = time.monotonic() - started
+        if progress:
+            progress(stats)
+
+    batch = []
+    with preserve_dates(parser.model):
+        for line, row in rows:
+            try:
+                batch.append((line, parser.parse(line, row)))
+            except InvalidRow as error:
+                reject(error)
+            if len(batch) >= transaction_size:
+                flush(batch)
+                batch = []
+        if batch:
+            flush(batch)
+    reset_sequences(parser.model)
+    # bulk_create n'envoie pas de signal post_save
+    invalidate(PENDING_ACTIONS, CREATED_ACCOUNTS)
+    stats['seconds'] = time.monotonic() - started
+    return stats
+
+
+def reset_sequences(model):
+    """Recale la séquence des ids après un import d'ids explicites (PostgreSQL ; sans effet sur MySQL et SQLite)."""
+    statements = connection.ops.sequence_reset_sql(no_style(), [model])
+    if statements:
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+
@@ -0,0 +1,242 @@
+import atexit
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import weakref
+
+from asgiref.sync import sync_to_async
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+# Instances dont les compteurs en attente sont écrits à l'arrêt du processus
+_instances = weakref.WeakSet()
+
+
+class SQLiteCache(BaseCache):
+    """
+    Cache partagé par tous les processus d'une même machine, stocké dans un
+    fichier SQLite (mode WAL).
+
+    Contrairement à LocMemCache, un token validé par un worker gunicorn est
+    immédiatement visible par les autres. Les entrées expirent selon leur TTL
+    et les moins récemment lues sont évincées au-delà de ``MAX_ENTRIES``.
+    Les compteurs de hits/misses sont partagés et lisibles via ``stats()``.
+
+    Une lecture n'écrit rien : les hits/misses sont comptés dans le processus
+    et la date de lecture (ordre d'éviction) n'est rafraîchie que si elle a
+    plus de ``touch_resolution`` secondes. Les deux sont écrits en une
+    transaction au plus tôt toutes les ``flush_interval`` secondes (fin de
+    requête, éviction, ``stats()`` et arrêt du processus).
+
+    Exemple::
+
+        CACHES = {
+            'default': {
+                'BACKEND': 'apiargent.cache.SQLiteCache',
+                'LOCATION': '/tmp/apiargent_cache.sqlite3',
+                'OPTIONS': {'MAX_ENTRIES': 50000},
+            }
+        }
+    """
+    # Nombre d'écritures entre deux vérifications de la taille du cache
+    cull_check_interval = 100
+    # Intervalle minimal (secondes) entre deux écritures des compteurs et dates de lecture
+    flush_interval = 5.0
+    # Précision (secondes) de la date de lecture utilisée pour l'éviction LRU
+    touch_resolution = 60.0
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._path = location
+        self._local = threading.local()
+        self._sets = 0
+        self._schema_ready = False
+        self._lock = threading.Lock()
+        self._lookups = {'hits': 0, 'misses': 0}
+        self._touched = {}
+        self._last_flush = time.monotonic()
+        _instances.add(self)
+
+    def _connection(self):
+        pid = os.getpid()
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != pid:
+            conn = sqlite3.connect(self._path, timeout=5, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            if not self._schema_ready:
+                conn.executescript(
+                    'CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL, accessed REAL NOT NULL);'
+                    'CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed);'
+                    'CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL);'
+                    "INSERT OR IGNORE INTO stats VALUES ('hits', 0), ('misses', 0), ('evictions', 0);"
+                )
+                self._schema_ready = True
+            self._local.conn, self._local.pid = conn, pid
+        return conn
+
+    def _bump(self, conn, name, amount=1):
+        conn.execute('UPDATE stats SET value = value + ? WHERE name = ?', (amount, name))
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        conn = self._connection()
+        now = time.time()
+        row = conn.execute('SELECT value, expires, accessed FROM cache WHERE key = ?', (key,)).fetchone()
+        hit = row is not None and (row[1] is None or row[1] > now)
+        with self._lock:
+            self._lookups['hits' if hit else 'misses'] += 1
+            if hit and now - row[2] >= self.touch_resolution:
+                self._touched[key] = now
+        if not hit:
+            return default
+        return pickle.loads(row[0])
+
+    def flush(self, force=False):
+        """
+        Écrit les hits/misses comptés par ce processus et les dates de lecture
+        en attente, si ``flush_interval`` est écoulé (ou ``force``).
+        """
+        if not force and time.monotonic() - self._last_flush < self.flush_interval:
+            return
+        with self._lock:
+            lookups, touched = self._lookups, self._touched
+            self._lookups, self._touched = {'hits': 0, 'misses': 0}, {}
+            self._last_flush = time.monotonic()
+        if not any(lookups.values()) and not touched:
+            return
+        conn = self._connection()
+        with conn:
+            for name, amount in lookups.items():
+                if amount:
+                    self._bump(conn, name, amount)
+            conn.executemany('UPDATE cache SET accessed = ? WHERE key = ?', [(t, key) for key, t in touched.items()])
+
+    def _write(self, key, value, timeout, mode):
+        conn = self._connection()
+        now = time.time()
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with conn:
+            if mode == 'add':
+                cursor = conn.execute(
+                    'INSERT INTO cache VALUES (?, ?, ?, ?) ON CONFLICT (key) DO UPDATE SET '
+                    'value = excluded.value, expires = excluded.expires, accessed = excluded.accessed '
+                    'WHERE cache.expires IS NOT NULL AND cache.expires <= ?',
+                    (key, data, self.get_backend_timeout(timeout), now, now),
+                )
+                written = cursor.rowcount > 0
+            else:
+                conn.execute('INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)', (key, data, self.get_backend_timeout(timeout), now))
+                written = True
+        self._sets += 1
+        if self._sets % self.cull_check_interval == 0:
+            self._cull(conn)
+        return written
+
+    def _cull(self, conn):
+        # Dates de lecture à jour avant de choisir les entrées à évincer
+        self.flush(force=True)
+        with conn:
+            conn.execute('DELETE FROM cache WHERE expires IS NOT NULL AND expires <= ?', (time.time(),))
+            count = conn.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+            if count > self._max_entries:
+                # Éviction LRU : on supprime les entrées les moins récemment lues
+                evicted = count - self._max_entries + self._max_entries // self._cull_frequency
+                conn.execute(
+                    'DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed LIMIT ?)',
+                    (evicted,),
+                )
+                self._bump(conn, 'evictions', evicted)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        self._write(key, value, timeout, 'set')
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self._write(key, value, timeout, 'add')
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        conn = self._connection()
+        with conn:
+            cursor = conn.execute(
+                'UPDATE cache SET expires = ? WHERE key = ? AND (expires IS NULL OR expires > ?)',
+                (self.get_backend_timeout(timeout), key, time.time()),
+            )
+        return cursor.rowcount > 0
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        conn = self._connection()
+        with conn:
+            cursor = conn.execute('DELETE FROM cache WHERE key = ?', (key,))
+        return cursor.rowcount > 0
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        row = self._connection().execute(
+            'SELECT 1 FROM cache WHERE key = ? AND (expires IS NULL OR expires > ?)', (key, time.time())
+        ).fetchone()
+        return row is not None
+
+    # Versions asynchrones : une connexion par thread, les appels passent donc
+    # par le pool de threads plutôt que par le thread partagé de l'ORM.
+
+    async def aget(self, key, default=None, version=None):
+        return await sync_to_async(self.get, thread_sensitive=False)(key, default, version)
+
+    async def aset(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return await sync_to_async(self.set, thread_sensitive=False)(key, value, timeout, version)
+
+    async def aadd(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return await sync_to_async(self.add, thread_sensitive=False)(key, value, timeout, version)
+
+    async def atouch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return await sync_to_async(self.touch, thread_sensitive=False)(key, timeout, version)
+
+    async def adelete(self, key, version=None):
+        return await sync_to_async(self.delete, thread_sensitive=False)(key, version)
+
+    async def ahas_key(self, key, version=None):
+        return await sync_to_async(self.has_key, thread_sensitive=False)(key, version)
+
+    def clear(self):
+        conn = self._connection()
+        with conn:
+            conn.execute('DELETE FROM cache')
+
+    def stats(self):
+        """
+        Compteurs partagés par tous les processus : hits, misses, evictions et
+        entrées présentes. Les lectures des autres processus y figurent à
+        ``flush_interval`` près.
+        """
+        self.flush(force=True)
+        conn = self._connection()
+        stats = dict(conn.execute('SELECT name, value FROM stats').fetchall())
+        stats['entries'] = conn.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+    def reset_stats(self):
+        with self._lock:
+            self._lookups = {'hits': 0, 'misses': 0}
+        conn = self._connection()
+        with conn:
+            conn.execute('UPDATE stats SET value = 0')
+
+    def close(self, **kwargs):
+        # Appelé en fin de requête. Les connexions sont conservées d'une requête à l'autre (une par thread)
+        self.flush()
+
+
+@atexit.register
+def _flush_all():
+    for instance in list(_instances):
+        try:
+            instance.flush(force=True)
+        except sqlite3.Error:
+            pass
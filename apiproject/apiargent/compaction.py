@@ -0,0 +1,212 @@
+"""
+Conversion des tables de logs entre le format décimal et le format compact
+(voir apiargent/fields.py).
+
+La conversion se fait en deux temps :
+
+1. ``expand`` et ``backfill`` : une colonne fantôme au nouveau format est
+   ajoutée pour chaque champ converti, puis remplie par paquets d'ids, un
+   paquet par transaction. L'application continue de servir pendant ce temps
+   (les montants et actions d'un log ne changent plus après sa création).
+2. ``swap`` : les dernières lignes sont converties, les anciennes colonnes
+   supprimées et les colonnes fantômes renommées. Cette étape doit être
+   exécutée écritures arrêtées, puis les workers redémarrés avec le réglage
+   ``COMPACT_LEDGER`` correspondant.
+
+Un worker démarré avec un réglage qui ne correspond pas aux colonnes
+écrirait des centimes dans des colonnes décimales (ou l'inverse) : les points
+d'entrée (WSGI, ASGI, worker de règlement) appellent
+``ensure_ledger_storage`` et refusent de démarrer dans ce cas.
+"""
+import copy
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, transaction
+
+from .fields import compact_ledger, ledger_storage
+from .models import ArchivedLog, Log
+
+LEDGER_MODELS = (Log, ArchivedLog)
+# Champs convertis, dans l'ordre des colonnes fantômes
+CONVERTED_FIELDS = ('montant', 'action')
+SHADOW_SUFFIX = '_conv'
+# Lignes converties par transaction
+BACKFILL_CHUNK_SIZE = 10000
+
+COMPACT = 'compact'
+DECIMAL = 'decimal'
+
+
+def _columns(model):
+    with connection.cursor() as cursor:
+        description = connection.introspection.get_table_description(cursor, model._meta.db_table)
+    return {column.name: connection.introspection.get_field_type(column.type_code, column) for column in description}
+
+
+def storage(model):
+    """Format actuel de la table de ``model`` en base (``compact`` ou ``decimal``)."""
+    field_type = _columns(model)[model._meta.get_field('montant').column]
+    return COMPACT if field_type.endswith('IntegerField') else DECIMAL
+
+
+def storage_mismatches():
+    """Tables de logs dont le format en base diffère de ``COMPACT_LEDGER`` : [(table, format en base)]."""
+    expected = COMPACT if compact_ledger() else DECIMAL
+    tables = connection.introspection.table_names()
+    mismatches = []
+    for model in LEDGER_MODELS:
+        # Base pas encore migrée : la migration 0010 crée les colonnes au format du réglage
+        if model._meta.db_table in tables and storage(model) != expected:
+            mismatches.append((model._meta.db_table, storage(model)))
+    return mismatches
+
+
+def ensure_ledger_storage(close_connection=False):
+    """
+    Lève ImproperlyConfigured si le réglage ``COMPACT_LEDGER`` ne correspond
+    pas aux colonnes en base. Avec ``close_connection`` (démarrage avant le
+    fork des workers), la connexion ouverte pour la vérification est refermée.
+    """
+    try:
+        mismatches = storage_mismatches()
+    finally:
+        if close_connection:
+            connection.close()
+    if mismatches:
+        tables = ', '.join(f"{table} ({current})" for table, current in mismatches)
+        raise ImproperlyConfigured(
+            f"COMPACT_LEDGER = {compact_ledger()} ne correspond pas au format des tables {tables} : "
+            "corriger le réglage ou terminer la conversion avec la commande compact_ledger")
+
+
+def shadow_column(model, name):
+    return model._meta.get_field(name).column + SHADOW_SUFFIX
+
+
+def has_shadow_columns(model):
+    return shadow_column(model, CONVERTED_FIELDS[0]) in _columns(model)
+
+
+def _shadow_field(model, name):
+    field = copy.copy(model._meta.get_field(name))
+    field.null = True
+    field.name = None
+    field.set_attributes_from_name(name + SHADOW_SUFFIX)
+    return field
+
+
+def expand(model, compact, schema_editor):
+    """Ajoute les colonnes fantômes (nullables, donc sans réécriture de la table) au format cible."""
+    table = schema_editor.quote_name(model._meta.db_table)
+    with ledger_storage(compact):
+        for name in CONVERTED_FIELDS:
+            field = _shadow_field(model, name)
+            definition, params = schema_editor.column_sql(model, field)
+            schema_editor.execute(
+                f"ALTER TABLE {table} ADD COLUMN {schema_editor.quote_name(field.column)} {definition}", params)
+
+
+def _conversions(model, compact):
+    """Expressions SQL (et paramètres) donnant chaque colonne fantôme à partir de l'ancienne colonne."""
+    qn = connection.ops.quote_name
+    amount = model._meta.get_field('montant')
+    action = model._meta.get_field('action')
+    scale = 10 ** amount.decimal_places
+    if compact:
+        codes = list(action.codes.items())
+        amount_sql = f"ROUND({qn(amount.column)} * {scale})"
+    else:
+        codes = [(code, value) for value, code in action.codes.items()]
+        amount_sql = f"{qn(amount.column)} / {scale}.0"
+    whens = ' '.join(['WHEN %s THEN %s'] * len(codes))
+    action_sql = f"CASE {qn(action.column)} {whens} END"
+    return [(amount_sql, []), (action_sql, [param for pair in codes for param in pair])]
+
+
+def backfill(model, compact, chunk_size=BACKFILL_CHUNK_SIZE, progress=None):
+    """
+    Remplit les colonnes fantômes des lignes qui ne le sont pas encore, par
+    paquets de ``chunk_size`` ids (une transaction courte par paquet).
+    Peut être interrompu et relancé. Retourne le nombre de lignes converties.
+    """
+    qn = connection.ops.quote_name
+    table = qn(model._meta.db_table)
+    assignments = []
+    params = []
+    for name, (sql, sql_params) in zip(CONVERTED_FIELDS, _conversions(model, compact)):
+        assignments.append(f"{qn(shadow_column(model, name))} = {sql}")
+        params += sql_params
+    marker = qn(shadow_column(model, CONVERTED_FIELDS[-1]))
+    statement = f"UPDATE {table} SET {', '.join(assignments)} WHERE id > %s AND id <= %s AND {marker} IS NULL"
+
+    converted = 0
+    ids = model.objects.order_by('id').values_list('id', flat=True)
+    first_id, last_id = ids.first(), ids.last()
+    if first_id is None:
+        return converted
+    position = first_id - 1
+    while position < last_id:
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(statement, params + [position, position + chunk_size])
+                converted += cursor.rowcount
+        position += chunk_size
+        if progress:
+            progress(model, converted)
+    return converted
+
+
+def swap(model, compact, schema_editor, chunk_size=BACKFILL_CHUNK_SIZE):
+    """
+    Remplace les anciennes colonnes par les colonnes fantômes, écritures arrêtées :
+    dernières lignes converties, index des champs convertis supprimés puis recréés.
+    """
+    backfill(model, compact, chunk_size)
+    table = model._meta.db_table
+    indexes = [index for index in model._meta.indexes if set(index.fields) & set(CONVERTED_FIELDS)]
+    with ledger_storage(compact):
+        for index in indexes:
+            schema_editor.remove_index(model, index)
+        for name in CONVERTED_FIELDS:
+            field = model._meta.get_field(name)
+            schema_editor.execute(
+                f"ALTER TABLE {schema_editor.quote_name(table)} DROP COLUMN {schema_editor.quote_name(field.column)}")
+            schema_editor.execute(schema_editor.sql_rename_column % {
+                'table': schema_editor.quote_name(table),
+                'old_column': schema_editor.quote_name(shadow_column(model, name)),
+                'new_column': schema_editor.quote_name(field.column),
+            })
+        for name in CONVERTED_FIELDS:
+            field = model._meta.get_field(name)
+            nullable = copy.copy(field)
+            nullable.null = True
+            schema_editor.alter_field(model, nullable, field)
+        # SQLite recrée les index en reconstruisant la table
+        with connection.cursor() as cursor:
+            existing = connection.introspection.get_constraints(cursor, table)
+        for index in indexes:
+            if index.name not in existing:
+                schema_editor.add_index(model, index)
+
+
+def convert(model, compact, chunk_size=BACKFILL_CHUNK_SIZE, swap_columns=True, schema_editor=None, progress=None):
+    """
+    Convertit la table de ``model`` au format compact (``compact=True``) ou
+    décimal. Sans ``swap_columns``, s'arrête après le remplissage des colonnes
+    fantômes (étape en ligne). Retourne le nombre de lignes converties.
+    """
+    if storage(model) == (COMPACT if compact else DECIMAL):
+        return 0
+
+    def run(editor):
+        if not has_shadow_columns(model):
+            expand(model, compact, editor)
+        converted = backfill(model, compact, chunk_size, progress)
+        if swap_columns:
+            swap(model, compact, editor, chunk_size)
+        return converted
+
+    if schema_editor is not None:
+        return run(schema_editor)
+    with connection.schema_editor(atomic=False) as editor:
+        return run(editor)
@@ -0,0 +1,39 @@
+import hashlib
+
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+
+def make_etag(request, *versions, media_type='application/json'):
+    """
+    ETag faible d'une lecture : versions des comptes lus, URL complète
+    (pagination, limite) et type de contenu négocié.
+    """
+    raw = '|'.join([request.get_full_path(), media_type] + [str(version) for version in versions])
+    return 'W/' + quote_etag(hashlib.md5(raw.encode(), usedforsecurity=False).hexdigest())
+
+
+def is_not_modified(request, etag):
+    """Vrai si ``If-None-Match`` contient ``etag`` (comparaison faible, RFC 9110)."""
+    header = request.META.get('HTTP_IF_NONE_MATCH')
+    if not header:
+        return False
+    tags = parse_etags(header)
+    return '*' in tags or etag.removeprefix('W/') in {tag.removeprefix('W/') for tag in tags}
+
+
+def conditional(request, *versions):
+    """
+    Pour les vues DRF : retourne ``(etag, réponse 304)`` si le client a déjà
+    cette version, ``(etag, None)`` sinon. À appeler avant toute sérialisation.
+    """
+    etag = make_etag(request, *versions, media_type=request.accepted_media_type)
+    if is_not_modified(request, etag):
+        return etag, Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+    return etag, None
+
+
+def account_versions(rows):
+    """Marqueur d'une liste de comptes : (id, version) de chaque compte, dans l'ordre."""
+    return ','.join(f'{row.id}:{row.version}' for row in rows)
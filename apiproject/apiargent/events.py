@@ -0,0 +1,253 @@
+"""
+Flux des actions en attente (créations, validations, refus) pour les banquiers.
+
+Les services écrivent chaque événement, après validation de la transaction,
+dans un journal SQLite local partagé par les workers de la machine ; l'id
+auto-incrémenté du journal sert d'identifiant d'événement (``Last-Event-ID``).
+Dans chaque processus ASGI, une seule tâche relit le journal à intervalle
+régulier et réveille les connexions en attente : le coût d'un banquier
+connecté ne dépend pas de la table des logs et reste nul quand rien ne change.
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import deque, namedtuple
+from contextlib import asynccontextmanager
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from rest_framework.utils.encoders import JSONEncoder
+
+from .Serializer import log_values_serializer
+
+CREATED = 'created'
+# Mêmes valeurs que les résultats de services.settle_logs
+VALIDATED = 'validated'
+DECLINED = 'declined'
+# Événements perdus (purgés du journal) : le client doit recharger la liste des actions en attente
+RESET = 'reset'
+
+# Fichier du journal, partagé par les workers d'une même machine
+EVENTS_LOCATION = getattr(settings, 'EVENTS_LOCATION', '/tmp/apiargent_events.sqlite3')
+# Durée de conservation des événements (secondes) pour la reprise après déconnexion
+EVENTS_RETENTION = getattr(settings, 'EVENTS_RETENTION', 3600)
+# Intervalle de lecture du journal par la tâche de chaque processus
+EVENTS_POLL_INTERVAL = getattr(settings, 'EVENTS_POLL_INTERVAL', 0.5)
+# Nombre d'événements récents gardés en mémoire par processus
+EVENTS_BUFFER_SIZE = 1000
+
+Event = namedtuple('Event', 'id kind data')
+
+
+def _dumps(data):
+    return json.dumps(data, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':'))
+
+
+class EventJournal:
+    """Journal d'événements append-only ; ``data`` est stocké déjà sérialisé en JSON."""
+    # Nombre d'écritures entre deux purges des événements expirés
+    prune_interval = 100
+
+    def __init__(self, path, retention=EVENTS_RETENTION):
+        self.path = path
+        self.retention = retention
+        self._local = threading.local()
+        self._appends = 0
+
+    def _connection(self):
+        pid = os.getpid()
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != pid:
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS events '
+                '(id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT NOT NULL, data TEXT NOT NULL, created REAL NOT NULL)'
+            )
+            self._local.conn, self._local.pid = conn, pid
+        return conn
+
+    def append(self, kind, items):
+        """Ajoute un événement ``kind`` par élément de ``items``."""
+        if not items:
+            return
+        conn = self._connection()
+        now = time.time()
+        with conn:
+            conn.executemany('INSERT INTO events (kind, data, created) VALUES (?, ?, ?)',
+                             [(kind, _dumps(item), now) for item in items])
+        self._appends += 1
+        if self._appends % self.prune_interval == 0:
+            self.prune()
+
+    def since(self, last_id, limit=EVENTS_BUFFER_SIZE):
+        rows = self._connection().execute(
+            'SELECT id, kind, data FROM events WHERE id > ? ORDER BY id LIMIT ?', (last_id, limit)
+        ).fetchall()
+        return [Event(*row) for row in rows]
+
+    def last_id(self):
+        # sqlite_sequence conserve le dernier id même si tous les événements ont été purgés
+        row = self._connection().execute("SELECT seq FROM sqlite_sequence WHERE name = 'events'").fetchone()
+        return row[0] if row else 0
+
+    def prune(self):
+        conn = self._connection()
+        with conn:
+            conn.execute('DELETE FROM events WHERE created < ?', (time.time() - self.retention,))
+
+    def clear(self):
+        conn = self._connection()
+        with conn:
+            conn.execute('DELETE FROM events')
+
+
+class EventBroker:
+    """
+    Diffusion des événements du journal aux connexions d'un processus.
+
+    Tant qu'au moins une connexion est abonnée, une tâche lit les nouveaux
+    événements toutes les ``interval`` secondes, les garde dans un tampon
+    circulaire et réveille les connexions en attente. Une connexion qui
+    reprend depuis un id sorti du tampon relit le journal ; si les événements
+    ont été purgés, elle reçoit un événement ``reset``.
+    """
+
+    def __init__(self, journal, interval=EVENTS_POLL_INTERVAL, buffer_size=EVENTS_BUFFER_SIZE):
+        self.journal = journal
+        self.interval = interval
+        self.buffer = deque(maxlen=buffer_size)
+        self.loop = None
+
+    def _bind(self):
+        # L'état asyncio appartient à une boucle d'événements (une par processus sous uvicorn)
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop:
+            self.loop = loop
+            self.changed = asyncio.Condition()
+            self.subscribers = 0
+            self.task = None
+            self.last_id = None
+            self.buffer.clear()
+
+    async def current_id(self):
+        """Id du dernier événement publié, pour une connexion qui ne reprend pas un flux."""
+        return await sync_to_async(self.journal.last_id, thread_sensitive=False)()
+
+    async def subscribe(self):
+        """Démarre la lecture du journal si besoin ; chaque appel doit être suivi d'un ``unsubscribe()``."""
+        self._bind()
+        if self.last_id is None:
+            self.last_id = await self.current_id()
+        self.subscribers += 1
+        if self.task is None:
+            self.task = asyncio.create_task(self._poll())
+
+    def unsubscribe(self):
+        # Synchrone : appelé depuis le finally d'un générateur fermé par le serveur
+        self.subscribers -= 1
+
+    @asynccontextmanager
+    async def subscription(self):
+        await self.subscribe()
+        try:
+            yield self
+        finally:
+            self.unsubscribe()
+
+    async def _poll(self):
+        read = sync_to_async(self.journal.since, thread_sensitive=False)
+        try:
+            while self.subscribers:
+                events = await read(self.last_id)
+                if events:
+                    self.buffer.extend(events)
+                    self.last_id = events[-1].id
+                    async with self.changed:
+                        self.changed.notify_all()
+                    if len(events) == self.buffer.maxlen:
+                        continue
+                await asyncio.sleep(self.interval)
+        finally:
+            self.task = None
+
+    def _buffered(self, cursor):
+        """Événements postérieurs à ``cursor`` présents dans le tampon, ou None s'il faut relire le journal."""
+        if cursor == self.last_id:
+            return []
+        if cursor > self.last_id or not self.buffer or self.buffer[0].id > cursor + 1:
+            return None
+        return [event for event in self.buffer if event.id > cursor]
+
+    async def _replay(self, cursor):
+        events = await sync_to_async(self.journal.since, thread_sensitive=False)(cursor)
+        if cursor > self.last_id or not events or events[0].id > cursor + 1:
+            # Reprise impossible (événements purgés ou id inconnu)
+            return [Event(self.last_id, RESET, 'null')]
+        return [event for event in events if event.id <= self.last_id]
+
+    async def wait(self, cursor, timeout):
+        """
+        Événements postérieurs à ``cursor``, en attendant au plus ``timeout``
+        secondes qu'il en arrive (liste vide sinon). À appeler entre ``subscribe()`` et ``unsubscribe()``.
+        """
+        deadline = self.loop.time() + timeout
+        while True:
+            events = self._buffered(cursor)
+            if events is None:
+                return await self._replay(cursor)
+            if events:
+                return events
+            remaining = deadline - self.loop.time()
+            if remaining <= 0:
+                return []
+            async with self.changed:
+                try:
+                    await asyncio.wait_for(self.changed.wait(), remaining)
+                except asyncio.TimeoutError:
+                    return []
+
+
+journal = EventJournal(EVENTS_LOCATION)
+broker = EventBroker(journal)
+
+
+def publish(kind, items):
+    """
+    Écrit les événements dans le journal après la validation de la transaction
+    en cours. Une erreur d'écriture du journal est journalisée par Django
+    (``robust``) : l'opération, déjà validée, ne doit pas répondre 500.
+    """
+    if items:
+        transaction.on_commit(lambda: journal.append(kind, items), robust=True)
+
+
+def publish_created(logs):
+    """
+    Événements ``created`` des logs en attente (les ``virement_recu`` ne sont
+    pas des actions à traiter). Les logs doivent avoir leur clé primaire.
+    """
+    logs = [log for log in logs if log.action != 'virement_recu']
+
+    def send():
+        journal.append(CREATED, log_values_serializer.serialize_instances(logs))
+
+    if logs:
+        transaction.on_commit(send, robust=True)
+
+
+def publish_settled(outcomes):
+    """Événements ``validated`` et ``declined`` d'un règlement ({log_id: résultat} de ``settle_logs``)."""
+    for kind in (VALIDATED, DECLINED):
+        ids = [pk for pk, outcome in outcomes.items() if outcome == kind]
+        if ids:
+            publish(kind, [{'ids': ids}])
+
+
+def format_sse(event):
+    return f"id: {event.id}\nevent: {event.kind}\ndata: {event.data}\n\n"
@@ -0,0 +1,97 @@
+"""
+Champs des tables de logs au format compact facultatif.
+
+Avec ``settings.COMPACT_LEDGER``, les montants sont stockés en centimes
+(entier) et les actions en petits entiers ; sans ce réglage, les colonnes
+restent décimales et textuelles. Dans les deux cas, les valeurs Python
+(``Decimal`` à deux décimales, chaîne de l'action), les filtres de l'ORM et
+les sérialiseurs sont identiques : seul le stockage change. La conversion
+d'une base existante se fait avec la commande ``compact_ledger``.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import models
+
+# Format imposé pendant une conversion (None : celui des réglages)
+_storage = ContextVar('apiargent_compact_ledger', default=None)
+
+
+def compact_ledger():
+    """Vrai si les tables de logs utilisent le format compact."""
+    storage = _storage.get()
+    return getattr(settings, 'COMPACT_LEDGER', False) if storage is None else storage
+
+
+@contextmanager
+def ledger_storage(compact):
+    """Impose le format des colonnes dans le bloc (DDL de la conversion)."""
+    token = _storage.set(compact)
+    try:
+        yield
+    finally:
+        _storage.reset(token)
+
+
+class AmountField(models.DecimalField):
+    """Montant ``Decimal`` stocké en décimal ou, au format compact, en unités mineures (centimes)."""
+
+    def get_internal_type(self):
+        return 'BigIntegerField' if compact_ledger() else 'DecimalField'
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if not compact_ledger():
+            return super().get_db_prep_value(value, connection, prepared)
+        if not prepared:
+            value = self.get_prep_value(value)
+        if value is None:
+            return None
+        return int(value.scaleb(self.decimal_places).to_integral_value())
+
+    def get_db_converters(self, connection):
+        converters = super().get_db_converters(connection)
+        if compact_ledger():
+            converters = converters + [self.from_minor_units]
+        return converters
+
+    def from_minor_units(self, value, expression, connection):
+        return None if value is None else Decimal(value).scaleb(-self.decimal_places)
+
+
+class CodeField(models.CharField):
+    """
+    Valeur textuelle parmi ``codes`` ({valeur: code}), stockée telle quelle ou,
+    au format compact, sous forme de code entier. Une valeur inconnue devient
+    NULL : elle ne correspond à aucune ligne et ne peut pas être enregistrée.
+    """
+
+    def __init__(self, *args, codes=None, **kwargs):
+        self.codes = dict(codes or {})
+        self.values_by_code = {code: value for value, code in self.codes.items()}
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs['codes'] = self.codes
+        return name, path, args, kwargs
+
+    def get_internal_type(self):
+        return 'PositiveSmallIntegerField' if compact_ledger() else 'CharField'
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if not prepared:
+            value = self.get_prep_value(value)
+        if value is None or not compact_ledger():
+            return value
+        return self.codes.get(value)
+
+    def get_db_converters(self, connection):
+        converters = super().get_db_converters(connection)
+        if compact_ledger():
+            converters = converters + [self.from_code]
+        return converters
+
+    def from_code(self, value, expression, connection):
+        return None if value is None else self.values_by_code[value]
@@ -0,0 +1,140 @@
+"""
+Clés d'idempotence (en-tête ``Idempotency-Key``) des vues d'écriture.
+
+Un client qui renvoie une requête après un délai d'attente dépassé réutilise
+la même clé : la réponse de la première exécution est conservée dans un cache
+dédié (``settings.IDEMPOTENCY_CACHE``, entrées expirées après
+``IDEMPOTENCY_TTL`` et évincées au-delà de sa taille maximale) et rejouée
+sans toucher aux comptes ni aux logs. Une requête qui arrive pendant
+l'exécution de la première attend son résultat au lieu de s'exécuter en
+parallèle.
+"""
+import functools
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import QueryDict
+from rest_framework import status
+from rest_framework.response import Response
+
+from .metrics import registry
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+# Durée de conservation d'une réponse (secondes)
+IDEMPOTENCY_TTL = getattr(settings, 'IDEMPOTENCY_TTL', 24 * 3600)
+# Durée maximale d'exécution de la première requête (au-delà, le verrou expire)
+IDEMPOTENCY_LOCK_TTL = getattr(settings, 'IDEMPOTENCY_LOCK_TTL', 30)
+# Attente maximale d'une requête en double avant de répondre 409
+IDEMPOTENCY_WAIT = getattr(settings, 'IDEMPOTENCY_WAIT', 10)
+POLL_INTERVAL = 0.05
+
+IDEMPOTENCY = registry.counter(
+    'apiargent_idempotency_total', "Requêtes avec clé d'idempotence par vue et résultat")
+
+
+class KeyReused(Exception):
+    """Clé déjà utilisée pour une requête différente (autre URL ou autre corps)."""
+
+
+class KeyInProgress(Exception):
+    """La première requête de cette clé ne s'est pas terminée dans le délai d'attente."""
+
+
+def store():
+    return caches[getattr(settings, 'IDEMPOTENCY_CACHE', 'default')]
+
+
+def fingerprint(request):
+    """Empreinte (méthode, URL, corps) d'une requête DRF, comparée lors d'un rejeu."""
+    data = request.data
+    if isinstance(data, QueryDict):
+        data = dict(data.lists())
+    raw = json.dumps([request.method, request.get_full_path(), data], sort_keys=True, default=str)
+    return hashlib.blake2b(raw.encode(), digest_size=16).digest()
+
+
+def run_once(key, request_fingerprint, execute):
+    """
+    Résultat ``(code HTTP, données)`` de la requête identifiée par ``key`` :
+    celui conservé si elle a déjà été exécutée, sinon celui de ``execute()``,
+    conservé s'il ne s'agit pas d'une erreur serveur. Retourne aussi
+    ``replayed`` (vrai si le résultat vient du cache).
+
+    Une seule exécution à la fois par clé (verrou ``cache.add``) ; les
+    doublons attendent au plus ``IDEMPOTENCY_WAIT`` secondes puis lèvent
+    ``KeyInProgress``. Lève ``KeyReused`` si l'empreinte diffère.
+    """
+    cache = store()
+    result_key = f"idempotency_{key}"
+    lock_key = result_key + '_lock'
+    deadline = time.monotonic() + IDEMPOTENCY_WAIT
+    while True:
+        stored = cache.get(result_key)
+        if stored is not None:
+            stored_fingerprint, status_code, data = stored
+            if stored_fingerprint != request_fingerprint:
+                raise KeyReused(key)
+            return status_code, data, True
+        if cache.add(lock_key, 1, IDEMPOTENCY_LOCK_TTL):
+            try:
+                # La première requête a pu terminer entre la lecture et la prise du verrou
+                if cache.get(result_key) is not None:
+                    continue
+                status_code, data = execute()
+                if status_code < 500:
+                    cache.set(result_key, (request_fingerprint, status_code, data), IDEMPOTENCY_TTL)
+            finally:
+                cache.delete(lock_key)
+            return status_code, data, False
+        if time.monotonic() >= deadline:
+            raise KeyInProgress(key)
+        time.sleep(POLL_INTERVAL)
+
+
+def idempotent(method):
+    """
+    Décorateur des méthodes ``post`` d'une APIView : sans en-tête
+    ``Idempotency-Key``, la vue s'exécute normalement. Les clés sont propres
+    à chaque utilisateur et à chaque vue.
+    """
+    @functools.wraps(method)
+    def wrapper(view, request, *args, **kwargs):
+        client_key = request.headers.get(IDEMPOTENCY_HEADER)
+        if client_key is None:
+            return method(view, request, *args, **kwargs)
+        name = type(view).__name__
+        if not client_key or len(client_key) > MAX_KEY_LENGTH:
+            return Response({"res": "Invalid Idempotency-Key"}, status=status.HTTP_400_BAD_REQUEST)
+
+        scope = f"{request.user.id}|{name}|{client_key}"
+        key = hashlib.sha256(scope.encode()).hexdigest()
+        responses = []
+
+        def execute():
+            response = method(view, request, *args, **kwargs)
+            responses.append(response)
+            return response.status_code, response.data
+
+        try:
+            status_code, data, replayed = run_once(key, fingerprint(request), execute)
+        except KeyReused:
+            registry.inc(IDEMPOTENCY, (('view', name), ('result', 'reused')))
+            return Response({"res": "Idempotency-Key already used for a different request"},
+                            status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        except KeyInProgress:
+            registry.inc(IDEMPOTENCY, (('view', name), ('result', 'in_progress')))
+            return Response({"res": "A request with this Idempotency-Key is still in progress"},
+                            status=status.HTTP_409_CONFLICT)
+
+        if not replayed:
+            registry.inc(IDEMPOTENCY, (('view', name), ('result', 'executed')))
+            return responses[0]
+        registry.inc(IDEMPOTENCY, (('view', name), ('result', 'replayed')))
+        return Response(data, status=status_code, headers={'Idempotent-Replayed': 'true'})
+
+    return wrapper
@@ -0,0 +1,46 @@
+from .models import Account
+
+
+class AccountLoader:
+    """
+    Identity map des comptes, limitée à une requête HTTP.
+
+    Les classes de permission et les vues passent par le même loader : un
+    compte lu pour vérifier les droits n'est pas relu par la vue.
+    """
+
+    def __init__(self):
+        self._accounts = {}
+
+    @classmethod
+    def for_request(cls, request):
+        # On s'attache à la HttpRequest sous-jacente pour partager le loader
+        # entre la Request DRF des permissions et celle des vues.
+        http_request = getattr(request, '_request', request)
+        loader = getattr(http_request, '_account_loader', None)
+        if loader is None:
+            loader = http_request._account_loader = cls()
+        return loader
+
+    def prime(self, account):
+        if account is not None:
+            self._accounts[account.pk] = account
+        return account
+
+    def get(self, pk):
+        """Retourne le compte ``pk`` (une requête au plus par requête HTTP) ou lève ``Account.DoesNotExist``."""
+        try:
+            pk = int(pk)
+        except (TypeError, ValueError):
+            raise Account.DoesNotExist
+        if pk not in self._accounts:
+            # Le point de contrôle d'archivage est lu avec le compte (historique des logs)
+            self._accounts[pk] = Account.objects.select_related('checkpoint').filter(pk=pk).first()
+        account = self._accounts[pk]
+        if account is None:
+            raise Account.DoesNotExist
+        return account
+
+
+def account_loader(request):
+    return AccountLoader.for_request(request)
@@ -0,0 +1,32 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from apiargent.archive import ARCHIVE_CHUNK_SIZE, archive_logs
+from apiargent.statements import parse_bound
+
+
+class Command(BaseCommand):
+    help = (
+        "Déplace les logs validés ou refusés antérieurs à une date vers la table d'archive, "
+        "par transactions bornées. Peut être interrompue et relancée sans risque."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--before', help="Date limite (date ou date-heure ISO 8601, exclue)")
+        parser.add_argument('--older-than-days', type=int, default=365, help="Âge minimal des logs archivés (sans --before)")
+        parser.add_argument('--chunk-size', type=int, default=ARCHIVE_CHUNK_SIZE, help="Nombre de logs déplacés par transaction")
+        parser.add_argument('--max-chunks', type=int, help="Nombre maximal de transactions pour cette exécution")
+
+    def handle(self, *args, **options):
+        if options['before']:
+            try:
+                cutoff = parse_bound(options['before'])
+            except ValueError:
+                raise CommandError(f"Date invalide : {options['before']}")
+        else:
+            cutoff = timezone.now() - timedelta(days=options['older_than_days'])
+
+        archived = archive_logs(cutoff, chunk_size=options['chunk_size'], max_chunks=options['max_chunks'])
+        self.stdout.write(self.style.SUCCESS(f"{archived} log(s) archivé(s) avant {cutoff.isoformat()}"))
@@ -0,0 +1,281 @@
+import json
+import os
+import random
+import subprocess
+import tempfile
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from apiargent import urls
+from apiargent.models import Account, Log, SettlementJob
+from apiargent.services import insert_logs
+from apiargent.stubs import StubAuthServer
+
+BATCH_SIZE = 1000
+
+
+def percentile(sorted_values, p):
+    """Percentile par rang le plus proche sur une liste déjà triée."""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, round(p / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+class Command(BaseCommand):
+    help = (
+        "Crée une base de test, la remplit de comptes et de logs, remplace l'API "
+        "d'authentification par un serveur local puis mesure chaque endpoint "
+        "d'apiargent (latences p50/p95/p99, débit, requêtes SQL) au format JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--accounts', type=int, default=1000, help="Nombre de comptes créés")
+        parser.add_argument('--logs', type=int, default=20000, help="Nombre de logs créés")
+        parser.add_argument('--requests', type=int, default=2000, help="Nombre de requêtes HTTP envoyées")
+        parser.add_argument('--seed', type=int, default=42, help="Graine aléatoire (mélange reproductible)")
+        parser.add_argument('--auth-delay', type=float, default=0.0, help="Latence simulée de l'API d'authentification (s)")
+        parser.add_argument('--output', help="Fichier JSON de résultats (sortie standard par défaut)")
+        parser.add_argument('--compare', help="Résultats JSON d'un commit précédent à comparer")
+        parser.add_argument('--max-regression', type=float, default=0.2,
+                            help="Hausse relative maximale du p95 tolérée avec --compare (0.2 = +20%%)")
+        parser.add_argument('--keepdb', action='store_true', help="Conserve la base de test entre deux exécutions")
+
+    def handle(self, *args, **options):
+        self.check_coverage()
+        self.random = random.Random(options['seed'])
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        stub = StubAuthServer(delay=options['auth_delay'])
+        cache_dir = tempfile.TemporaryDirectory()
+        bench_caches = {'default': {**settings.CACHES['default'], 'LOCATION': os.path.join(cache_dir.name, 'cache.sqlite3')}}
+
+        try:
+            with override_settings(AUTH_API_URL=stub.url, CACHES=bench_caches, METRICS_DIR=None, ALLOWED_HOSTS=['*']):
+                cache.clear()
+                self.seed(options['accounts'], options['logs'])
+                started = time.perf_counter()
+                samples = self.run_mix(options['requests'])
+                duration = time.perf_counter() - started
+        finally:
+            stub.close()
+            cache_dir.cleanup()
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+
+        report = self.report(samples, duration, options)
+        output = json.dumps(report, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+        if options['compare']:
+            self.compare(report, options['compare'], options['max_regression'])
+
+    # Données
+
+    def seed(self, account_count, log_count):
+        now = timezone.now()
+        accounts = [
+            Account(
+                user_id=i // 2 + 1,
+                solde=Decimal(self.random.randint(0, 1000000)) / 100,
+                type_compte=self.random.choice(['courant', 'epargne']),
+                statut='en_creation' if i % 50 == 0 else 'actif',
+            )
+            for i in range(account_count)
+        ]
+        Account.objects.bulk_create(accounts, batch_size=BATCH_SIZE)
+        self.accounts = list(Account.objects.values_list('id', 'user_id'))
+
+        logs = []
+        received = []
+        created = 0
+        while created + len(logs) + len(received) < log_count:
+            account_id, _ = self.random.choice(self.accounts)
+            montant = Decimal(self.random.randint(100, 50000)) / 100
+            settled = now if self.random.random() < 0.5 else None
+            action = self.random.choice(['depot', 'retrait', 'virement_envoye'])
+            if action == 'virement_envoye':
+                target_id, _ = self.random.choice(self.accounts)
+                log = Log(account_id=account_id, action=action, montant=montant, cible_id=target_id, date_valeur=settled)
+                logs.append(log)
+                received.append(Log(account_id=target_id, action='virement_recu', montant=montant, cible_id=account_id,
+                                    date_valeur=settled, origine=log))
+            else:
+                logs.append(Log(account_id=account_id, action=action, montant=montant, date_valeur=settled))
+            if len(logs) + len(received) >= BATCH_SIZE:
+                created += self.insert(logs, received)
+                logs, received = [], []
+        self.insert(logs, received)
+
+        self.pending = list(
+            Log.objects.filter(date_valeur__isnull=True).exclude(action='virement_recu').values_list('id', flat=True)
+        )
+        self.random.shuffle(self.pending)
+        # Demandes de règlement déjà traitées, consultées par la route settlement-job
+        SettlementJob.objects.bulk_create([
+            SettlementJob(log_id=log_id, approve=True, status='done', outcome='validated')
+            for log_id in Log.objects.filter(date_valeur__isnull=False).values_list('id', flat=True)[:100]
+        ])
+        self.jobs = list(SettlementJob.objects.values_list('id', flat=True))
+
+    def insert(self, logs, received):
+        # Les logs reçus référencent les logs envoyés : insérés une fois leurs ids connus
+        insert_logs(logs)
+        insert_logs(received)
+        return len(logs) + len(received)
+
+    # Scénarios : (nom de route, poids, fonction qui construit la requête)
+
+    def scenarios(self):
+        return [
+            ('account-list', 1, lambda: ('get', '/api/', None, None)),
+            ('account-detail', 20, lambda: ('get', f'/api/{self.account()}/', None, self.owner_token)),
+            ('user-accounts', 10, lambda: ('get', '/api/list/', None, self.owner_token)),
+            ('user-accounts-by-id', 3, lambda: ('get', f'/api/list/{self.random.choice(self.accounts)[1]}/', None, 'banquier-1')),
+            ('account-balance-update', 15, lambda: ('post', f'/api/{self.account()}/balance/update/',
+                                                    {'action': self.random.choice(['deposit', 'withdraw']), 'amount': '10.00'},
+                                                    self.owner_token)),
+            ('account-logs', 15, lambda: ('get', f'/api/{self.account()}/logs/', None, self.owner_token)),
+            ('account-logs-limited', 5, lambda: ('get', f'/api/{self.account()}/logs/20/', None, self.owner_token)),
+            ('account-statement', 1, lambda: ('get', f'/api/{self.account()}/statement/?output=ndjson', None, self.owner_token)),
+            ('account-summary', 3, lambda: ('get', f'/api/{self.account()}/summary/', None, self.owner_token)),
+            ('account-transfer', 10, lambda: ('post', f'/api/{self.account()}/virement/',
+                                              {'target_account_id': self.random.choice(self.accounts)[0], 'amount': '5.00', 'libele': 'bench'},
+                                              self.owner_token)),
+            ('log-search', 3, lambda: ('get', f'/api/logs/search/?account={self.account()}&min_amount=10', None, 'banquier-1')),
+            ('batch-operations', 2, lambda: ('post', '/api/batch/', {'operations': [
+                {'action': 'deposit', 'account_id': self.account(), 'amount': '1.00'} for _ in range(10)]}, 'banquier-1')),
+            ('bank-summary', 1, lambda: ('get', '/api/summary/', None, 'banquier-1')),
+            ('pending-actions', 5, lambda: ('get', '/api/pending-actions/?page_size=50', None, 'banquier-1')),
+            ('validate-action', 5, lambda: ('post', f'/api/validate-action/{self.pending_log()}/', None, 'banquier-1')),
+            ('decline-action', 2, lambda: ('post', f'/api/decline-action/{self.pending_log()}/', None, 'banquier-1')),
+            ('process-pending-actions', 1, lambda: ('post', '/api/process-pending-actions/',
+                                                    {'decision': 'validate', 'ids': [self.pending_log() for _ in range(50)]},
+                                                    'banquier-1')),
+            ('settlement-job', 2, lambda: ('get', f'/api/settlement-jobs/{self.random.choice(self.jobs)}/', None, 'banquier-1')),
+            ('change-account-state', 1, lambda: ('post', f'/api/change-account-state/{self.account()}/', {'etat': 'actif'}, 'banquier-1')),
+            ('list-created-accounts', 2, lambda: ('get', '/api/list-process-created-accounts/', None, 'banquier-1')),
+            ('request-new-account', 2, lambda: ('post', '/api/request-new-account/', {'type_compte': 'courant'}, self.owner_token)),
+            ('metrics', 1, lambda: ('get', '/metrics/', None, None)),
+        ]
+
+    def check_coverage(self):
+        """Chaque route nommée de apiargent/urls.py doit avoir un scénario, et inversement."""
+        routes = {pattern.name for pattern in urls.urlpatterns if pattern.name}
+        scenarios = {name for name, _, _ in self.scenarios()}
+        if routes != scenarios:
+            raise CommandError(
+                f"Scénarios à mettre à jour : routes sans scénario {sorted(routes - scenarios)}, "
+                f"scénarios sans route {sorted(scenarios - routes)}")
+
+    def account(self):
+        account_id, user_id = self.random.choice(self.accounts)
+        self.owner_token = f'client-{user_id}'
+        return account_id
+
+    def pending_log(self):
+        return self.pending.pop() if self.pending else 0
+
+    def run_mix(self, request_count):
+        client = Client(raise_request_exception=False)
+        scenarios = self.scenarios()
+        names = [name for name, _, _ in scenarios]
+        weights = [weight for _, weight, _ in scenarios]
+        builders = {name: build for name, _, build in scenarios}
+        samples = {name: [] for name in names}
+
+        # Chaque route est appelée au moins une fois, le reste suit les poids
+        plan = names + self.random.choices(names, weights=weights, k=max(0, request_count - len(names)))
+        for name in plan:
+            self.owner_token = 'client-1'
+            method, path, data, token = builders[name]()
+            extra = {'HTTP_AUTHORIZATION': f'Token {token}'} if token else {}
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                if method == 'get':
+                    response = client.get(path, **extra)
+                else:
+                    response = client.post(path, data=json.dumps(data or {}), content_type='application/json', **extra)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                elapsed = time.perf_counter() - started
+            samples[name].append((elapsed, len(queries), response.status_code))
+        return samples
+
+    # Résultats
+
+    def report(self, samples, duration, options):
+        endpoints = {}
+        total = 0
+        for name, rows in samples.items():
+            if not rows:
+                continue
+            total += len(rows)
+            latencies = sorted(elapsed * 1000 for elapsed, _, _ in rows)
+            query_counts = [count for _, count, _ in rows]
+            busy = sum(latencies) / 1000
+            endpoints[name] = {
+                'count': len(rows),
+                'errors': sum(1 for _, _, code in rows if code >= 500),
+                'p50_ms': round(percentile(latencies, 50), 3),
+                'p95_ms': round(percentile(latencies, 95), 3),
+                'p99_ms': round(percentile(latencies, 99), 3),
+                'mean_ms': round(sum(latencies) / len(latencies), 3),
+                'throughput_rps': round(len(rows) / busy, 1) if busy else None,
+                'queries_mean': round(sum(query_counts) / len(query_counts), 2),
+                'queries_max': max(query_counts),
+            }
+        return {
+            'meta': {
+                'commit': self.git_commit(),
+                'database': connection.vendor,
+                'accounts': options['accounts'],
+                'logs': options['logs'],
+                'requests': options['requests'],
+                'seed': options['seed'],
+                'auth_delay': options['auth_delay'],
+            },
+            'total': {
+                'requests': total,
+                'duration_s': round(duration, 3),
+                'throughput_rps': round(total / duration, 1) if duration else None,
+            },
+            'endpoints': endpoints,
+        }
+
+    def git_commit(self):
+        try:
+            return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                  cwd=settings.BASE_DIR, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def compare(self, report, baseline_path, max_regression):
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+
+        regressions = []
+        for name, current in sorted(report['endpoints'].items()):
+            previous = baseline.get('endpoints', {}).get(name)
+            if not previous or not previous['p95_ms']:
+                continue
+            ratio = current['p95_ms'] / previous['p95_ms'] - 1
+            line = (f"{name}: p95 {previous['p95_ms']} -> {current['p95_ms']} ms ({ratio:+.0%}), "
+                    f"requêtes {previous['queries_mean']} -> {current['queries_mean']}")
+            self.stderr.write(line)
+            if ratio > max_regression or current['queries_mean'] > previous['queries_mean']:
+                regressions.append(name)
+
+        if regressions:
+            raise CommandError(f"Régressions détectées : {', '.join(regressions)}")
@@ -0,0 +1,118 @@
+import asyncio
+import json
+import time
+from decimal import Decimal
+
+import httpx
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+
+from apiargent.models import Account
+from apiargent.stubs import StubAuthServer
+
+from .benchmark import BATCH_SIZE, percentile
+
+
+class Command(BaseCommand):
+    help = (
+        "Mesure la concurrence d'un seul worker quand l'API d'authentification est "
+        "lente : vues asynchrones sous ASGI, vues DRF sous ASGI et worker WSGI "
+        "synchrone, sur le détail d'un compte avec un token différent par requête."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help="Nombre de requêtes par mode")
+        parser.add_argument('--concurrency', type=int, default=50, help="Requêtes simultanées sous ASGI")
+        parser.add_argument('--auth-delay', type=float, default=0.2, help="Latence simulée de l'API d'authentification (s)")
+        parser.add_argument('--modes', default='asgi-async,asgi-sync,wsgi',
+                            help="Modes mesurés, séparés par des virgules")
+        parser.add_argument('--output', help="Fichier JSON de résultats (sortie standard par défaut)")
+
+    def handle(self, *args, **options):
+        from apiproject.asgi import application
+
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        stub = StubAuthServer(delay=options['auth_delay'])
+        results = {}
+
+        try:
+            with override_settings(AUTH_API_URL=stub.url, METRICS_DIR=None, ALLOWED_HOSTS=['*']):
+                # Un compte par utilisateur : chaque requête présente un token inconnu du cache
+                Account.objects.bulk_create(
+                    [Account(user_id=i + 1, solde=Decimal('100.00')) for i in range(options['requests'])],
+                    batch_size=BATCH_SIZE,
+                )
+                targets = list(Account.objects.values_list('id', 'user_id'))
+
+                for mode in options['modes'].split(','):
+                    cache.clear()
+                    calls = stub.calls
+                    if mode == 'wsgi':
+                        samples, duration = self.run_wsgi(targets)
+                    else:
+                        urlconf = settings.ASGI_ROOT_URLCONF if mode == 'asgi-async' else settings.ROOT_URLCONF
+                        with override_settings(ASGI_ROOT_URLCONF=urlconf):
+                            samples, duration = asyncio.run(self.run_asgi(application, targets, options['concurrency']))
+                    results[mode] = self.summary(samples, duration, stub.calls - calls)
+        finally:
+            stub.close()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        report = {
+            'meta': {
+                'database': connection.vendor,
+                'requests': options['requests'],
+                'concurrency': options['concurrency'],
+                'auth_delay': options['auth_delay'],
+            },
+            'modes': results,
+        }
+        output = json.dumps(report, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+    def run_wsgi(self, targets):
+        # Un worker synchrone (gunicorn par défaut) traite les requêtes l'une après l'autre
+        client = Client(raise_request_exception=False)
+        samples = []
+        started = time.perf_counter()
+        for account_id, user_id in targets:
+            request_started = time.perf_counter()
+            response = client.get(f'/api/{account_id}/', HTTP_AUTHORIZATION=f'Token client-{user_id}')
+            samples.append((time.perf_counter() - request_started, response.status_code))
+        return samples, time.perf_counter() - started
+
+    async def run_asgi(self, application, targets, concurrency):
+        semaphore = asyncio.Semaphore(concurrency)
+        transport = httpx.ASGITransport(app=application)
+
+        async with httpx.AsyncClient(transport=transport, base_url='http://testserver') as client:
+            async def fetch(account_id, user_id):
+                async with semaphore:
+                    request_started = time.perf_counter()
+                    response = await client.get(f'/api/{account_id}/', headers={'Authorization': f'Token client-{user_id}'})
+                    return time.perf_counter() - request_started, response.status_code
+
+            started = time.perf_counter()
+            samples = await asyncio.gather(*(fetch(account_id, user_id) for account_id, user_id in targets))
+            return samples, time.perf_counter() - started
+
+    def summary(self, samples, duration, auth_calls):
+        latencies = sorted(elapsed * 1000 for elapsed, _ in samples)
+        return {
+            'count': len(samples),
+            'errors': sum(1 for _, code in samples if code != 200),
+            'auth_calls': auth_calls,
+            'duration_s': round(duration, 3),
+            'throughput_rps': round(len(samples) / duration, 1) if duration else None,
+            'p50_ms': round(percentile(latencies, 50), 3),
+            'p95_ms': round(percentile(latencies, 95), 3),
+            'p99_ms': round(percentile(latencies, 99), 3),
+        }
@@ -0,0 +1,105 @@
+import json
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Count, Sum
+from django.test import override_settings
+from django.utils import timezone
+
+from apiargent.Serializer import log_values_serializer
+from apiargent.compaction import convert
+from apiargent.models import Account, Log
+
+BATCH_SIZE = 5000
+
+
+class Command(BaseCommand):
+    help = (
+        "Crée une base de test remplie de logs et mesure, au format décimal puis au format compact "
+        "(COMPACT_LEDGER), la taille de la table des logs et de ses index et la durée de quelques "
+        "lectures complètes de la table. Résultats au format JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--accounts', type=int, default=1000, help="Nombre de comptes créés")
+        parser.add_argument('--logs', type=int, default=200000, help="Nombre de logs créés")
+        parser.add_argument('--repeat', type=int, default=3, help="Nombre de mesures par lecture (meilleure retenue)")
+        parser.add_argument('--seed', type=int, default=42, help="Graine aléatoire")
+        parser.add_argument('--output', help="Fichier JSON de résultats (sortie standard par défaut)")
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            self.seed(options['accounts'], options['logs'])
+            report = {
+                'meta': {'database': connection.vendor, 'accounts': options['accounts'], 'logs': options['logs']},
+                'decimal': self.measure(options['repeat']),
+            }
+            convert(Log, True)
+            with override_settings(COMPACT_LEDGER=True):
+                report['compact'] = self.measure(options['repeat'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        output = json.dumps(report, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+    def seed(self, account_count, log_count):
+        Account.objects.bulk_create([Account(user_id=i + 1) for i in range(account_count)], batch_size=BATCH_SIZE)
+        account_ids = list(Account.objects.values_list('id', flat=True))
+        actions = ['depot', 'retrait', 'virement_envoye', 'virement_recu']
+        now = timezone.now()
+        for start in range(0, log_count, BATCH_SIZE):
+            Log.objects.bulk_create([
+                Log(account_id=self.random.choice(account_ids), action=self.random.choice(actions),
+                    montant=Decimal(self.random.randint(100, 500000)) / 100,
+                    date_valeur=now - timedelta(seconds=i))
+                for i in range(start, min(start + BATCH_SIZE, log_count))
+            ])
+
+    def measure(self, repeat):
+        scans = {
+            'totals_by_action': lambda: list(Log.objects.values('action').annotate(count=Count('id'), total=Sum('montant')).order_by()),
+            'amount_range_count': lambda: Log.objects.filter(montant__gte=Decimal('100'), montant__lt=Decimal('200')).count(),
+            'serialize_all': lambda: log_values_serializer.serialize(Log.objects.order_by('id')),
+        }
+        timings = {}
+        for name, scan in scans.items():
+            best = None
+            for _ in range(repeat):
+                started = time.perf_counter()
+                scan()
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+            timings[name] = round(best * 1000, 1)
+        return {'sizes_bytes': self.sizes(Log._meta.db_table), 'scan_ms': timings}
+
+    def sizes(self, table):
+        """Taille (octets) de la table et de ses index, ou None si la base ne la donne pas."""
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute('VACUUM')
+                cursor.execute(
+                    "SELECT SUM(CASE WHEN name = %s THEN pgsize ELSE 0 END), SUM(CASE WHEN name != %s THEN pgsize ELSE 0 END) "
+                    "FROM dbstat WHERE name IN (SELECT name FROM sqlite_master WHERE tbl_name = %s)",
+                    [table, table, table])
+            elif connection.vendor == 'mysql':
+                cursor.execute(f'ANALYZE TABLE {connection.ops.quote_name(table)}')
+                cursor.fetchall()
+                cursor.execute(
+                    "SELECT data_length, index_length FROM information_schema.tables "
+                    "WHERE table_schema = DATABASE() AND table_name = %s", [table])
+            else:
+                return None
+            data, indexes = cursor.fetchone()
+        return {'table': int(data), 'indexes': int(indexes)}
@@ -0,0 +1,22 @@
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "Affiche les compteurs (hits, misses, évictions, entrées) du cache partagé"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--alias', default='default', help="Alias du cache dans settings.CACHES")
+        parser.add_argument('--reset', action='store_true', help="Remet les compteurs à zéro après affichage")
+
+    def handle(self, *args, **options):
+        cache = caches[options['alias']]
+        if not hasattr(cache, 'stats'):
+            raise CommandError(f"Le cache '{options['alias']}' ne fournit pas de statistiques")
+
+        stats = cache.stats()
+        for name in ('hits', 'misses', 'hit_ratio', 'evictions', 'entries'):
+            self.stdout.write(f"{name}: {stats[name]}")
+
+        if options['reset']:
+            cache.reset_stats()
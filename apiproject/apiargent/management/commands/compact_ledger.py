@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from apiargent.compaction import BACKFILL_CHUNK_SIZE, COMPACT, DECIMAL, LEDGER_MODELS, convert, storage
+
+
+class Command(BaseCommand):
+    help = (
+        "Convertit les tables de logs au format compact (montants en centimes, actions en codes entiers) "
+        "ou, avec --revert, au format décimal. Avec --backfill-only, remplit seulement les colonnes "
+        "converties par petites transactions, application en service ; sans cette option, termine la "
+        "conversion (à lancer écritures arrêtées, avant de redémarrer avec le réglage COMPACT_LEDGER correspondant)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--revert', action='store_true', help="Revient au format décimal")
+        parser.add_argument('--backfill-only', action='store_true', help="S'arrête avant le remplacement des colonnes")
+        parser.add_argument('--chunk-size', type=int, default=BACKFILL_CHUNK_SIZE, help="Nombre d'ids convertis par transaction")
+
+    def handle(self, *args, **options):
+        compact = not options['revert']
+        target = COMPACT if compact else DECIMAL
+        if options['chunk_size'] < 1:
+            raise CommandError("--chunk-size doit être positif")
+
+        def progress(model, converted):
+            if options['verbosity'] > 1:
+                self.stdout.write(f"{model._meta.db_table} : {converted} ligne(s) convertie(s)")
+
+        for model in LEDGER_MODELS:
+            table = model._meta.db_table
+            if storage(model) == target:
+                self.stdout.write(f"{table} : déjà au format {target}")
+                continue
+            converted = convert(model, compact, chunk_size=options['chunk_size'],
+                                swap_columns=not options['backfill_only'], progress=progress)
+            self.stdout.write(f"{table} : {converted} ligne(s) convertie(s)")
+
+        if options['backfill_only']:
+            self.stdout.write(self.style.SUCCESS("Colonnes converties remplies ; relancer sans --backfill-only pour terminer"))
+        elif getattr(settings, 'COMPACT_LEDGER', False) != compact:
+            self.stdout.write(self.style.WARNING(f"Tables au format {target} : redémarrer avec COMPACT_LEDGER = {compact}"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Tables au format {target}"))
@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apiargent.bulk_data import DUMP_CHUNK_SIZE, FORMATS, MODEL_COLUMNS, guess_format, iter_dump
+from apiargent.streaming import iter_csv, iter_ndjson
+
+
+class Command(BaseCommand):
+    help = (
+        "Exporte les comptes, les logs, les logs archivés ou les points de reprise d'archive "
+        "(ids, liens et dates compris) en CSV ou NDJSON, "
+        "lus par paquets : la mémoire utilisée ne dépend pas de la taille de la table. "
+        "Le fichier produit se réimporte avec import_data."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', choices=sorted(MODEL_COLUMNS))
+        parser.add_argument('--format', choices=FORMATS, help="Format (d'après l'extension de --output par défaut, sinon csv)")
+        parser.add_argument('--chunk-size', type=int, default=DUMP_CHUNK_SIZE, help="Nombre de lignes lues par requête")
+        parser.add_argument('--output', help="Fichier de sortie (sortie standard par défaut)")
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or guess_format(options['output'] or '')
+        columns = MODEL_COLUMNS[options['model']][1]
+        rows = iter_dump(options['model'], chunk_size=options['chunk_size'])
+
+        count = 0
+        started = time.monotonic()
+
+        def counted():
+            nonlocal count
+            for row in rows:
+                count += 1
+                yield row
+
+        chunks = iter_csv(counted(), columns) if fmt == 'csv' else iter_ndjson(counted())
+        if options['output']:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as f:
+                f.writelines(chunks)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+
+        elapsed = time.monotonic() - started
+        # Le rapport va sur la sortie d'erreur pour ne pas se mêler à l'export
+        self.stderr.write(f"{count} ligne(s) exportée(s) en {elapsed:.1f} s ({count / elapsed if elapsed else 0:.0f} lignes/s)",
+                          style_func=self.style.SUCCESS)
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apiargent.models import Account
+from apiargent.statements import DATE_FIELDS, STATEMENT_FIELDS, iter_statement, statement_options
+from apiargent.streaming import CHUNK_SIZE, iter_csv, iter_ndjson
+
+
+class Command(BaseCommand):
+    help = (
+        "Exporte le relevé d'un compte (logs et solde courant) en CSV ou NDJSON, "
+        "lu par paquets : la mémoire utilisée ne dépend pas de la longueur de l'historique."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('account_id', type=int)
+        parser.add_argument('--format', choices=['csv', 'ndjson'], default='csv')
+        parser.add_argument('--field', choices=DATE_FIELDS, default='date_action', help="Date utilisée pour borner et ordonner")
+        parser.add_argument('--from', dest='start', help="Début (date ou date-heure ISO 8601, inclus)")
+        parser.add_argument('--to', dest='end', help="Fin (date incluse ou date-heure ISO 8601 exclue)")
+        parser.add_argument('--action', help="Types d'action à exporter, séparés par des virgules")
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="Nombre de logs lus par requête")
+        parser.add_argument('--output', help="Fichier de sortie (sortie standard par défaut)")
+
+    def handle(self, *args, **options):
+        try:
+            account = Account.objects.select_related('checkpoint').get(pk=options['account_id'])
+        except Account.DoesNotExist:
+            raise CommandError(f"Compte {options['account_id']} introuvable")
+        try:
+            statement = statement_options({
+                'field': options['field'],
+                'from': options['start'],
+                'to': options['end'],
+                'action': options['action'],
+            })
+        except ValueError as e:
+            raise CommandError(f"Paramètre invalide : {e}")
+
+        rows = iter_statement(account, chunk_size=options['chunk_size'], **statement)
+        chunks = iter_csv(rows, STATEMENT_FIELDS) if options['format'] == 'csv' else iter_ndjson(rows)
+
+        if options['output']:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as f:
+                f.writelines(chunks)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
@@ -0,0 +1,72 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apiargent.bulk_data import (
+    FORMATS,
+    INSERT_BATCH_SIZE,
+    MODEL_COLUMNS,
+    TRANSACTION_SIZE,
+    InvalidRow,
+    guess_format,
+    import_rows,
+    iter_file,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Importe des comptes, des logs, des logs archivés ou des points de reprise d'archive depuis "
+        "un fichier CSV ou NDJSON (produit par export_data) en conservant les ids et les liens : lecture "
+        "en flux, validation ligne par ligne, bulk_create par transactions de taille fixe. Importer dans "
+        "l'ordre account, log, archived_log, balance_checkpoint, puis lancer rebuild_rollups (résumés "
+        "mensuels) et reconcile_pending_debits si les débits en attente doivent être recalculés."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', choices=sorted(MODEL_COLUMNS))
+        parser.add_argument('path', help="Fichier à importer (« - » pour l'entrée standard)")
+        parser.add_argument('--format', choices=FORMATS, help="Format (d'après l'extension par défaut, sinon csv)")
+        parser.add_argument('--batch-size', type=int, default=INSERT_BATCH_SIZE, help="Nombre de lignes par INSERT")
+        parser.add_argument('--transaction-size', type=int, default=TRANSACTION_SIZE, help="Nombre de lignes par transaction")
+        parser.add_argument('--skip-invalid', action='store_true', help="Ignore les lignes invalides au lieu d'arrêter l'import")
+        parser.add_argument('--ignore-conflicts', action='store_true', help="Ignore les lignes dont l'id existe déjà")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or guess_format(path)
+
+        def progress(stats):
+            rate = stats['imported'] / stats['seconds'] if stats['seconds'] else 0
+            self.stderr.write(f"{stats['imported']} ligne(s) importée(s), {rate:.0f} lignes/s")
+
+        stream = sys.stdin
+        try:
+            if path != '-':
+                stream = open(path, newline='', encoding='utf-8')
+            stats = import_rows(
+                options['model'], iter_file(stream, fmt),
+                insert_batch_size=options['batch_size'],
+                transaction_size=options['transaction_size'],
+                skip_invalid=options['skip_invalid'],
+                ignore_conflicts=options['ignore_conflicts'],
+                progress=progress,
+            )
+        except InvalidRow as e:
+            raise CommandError(f"Import interrompu, {e} (les transactions précédentes sont conservées)")
+        except OSError as e:
+            raise CommandError(str(e))
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        for error in stats['errors']:
+            self.stderr.write(error)
+        rate = stats['imported'] / stats['seconds'] if stats['seconds'] else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"{stats['imported']} ligne(s) importée(s), {stats['invalid']} ignorée(s), "
+            f"en {stats['seconds']:.1f} s ({rate:.0f} lignes/s)"
+        ))
+        if options['model'] in ('log', 'archived_log'):
+            # Les résumés mensuels ne sont pas tenus à jour par bulk_create
+            self.stderr.write("Lancer rebuild_rollups pour recalculer les résumés mensuels.")
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from apiargent.rollups import REBUILD_CHUNK_SIZE, rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcule les agrégats mensuels des comptes à partir des logs réglés (courants et archivés), "
+        "par transactions de quelques comptes. À lancer après la migration qui crée la table, "
+        "puis en cas de doute sur les agrégats."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=REBUILD_CHUNK_SIZE, help="Nombre de comptes traités par transaction")
+
+    def handle(self, *args, **options):
+        def progress(done):
+            if options['verbosity'] > 1:
+                self.stdout.write(f"{done} compte(s) traité(s)")
+
+        done = rebuild_rollups(chunk_size=options['chunk_size'], progress=progress)
+        self.stdout.write(self.style.SUCCESS(f"Agrégats recalculés pour {done} compte(s)"))
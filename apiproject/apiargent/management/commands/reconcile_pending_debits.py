@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from apiargent.services import reconcile_pending_debits
+
+
+class Command(BaseCommand):
+    help = "Vérifie (et corrige) les débits en attente des comptes à partir des logs non validés"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help="Nombre de comptes traités par transaction")
+        parser.add_argument('--dry-run', action='store_true', help="Affiche les écarts sans les corriger")
+
+    def handle(self, *args, **options):
+        mismatches = reconcile_pending_debits(chunk_size=options['chunk_size'], fix=not options['dry_run'])
+        for account_id, stored, expected in mismatches:
+            self.stdout.write(f"Compte {account_id}: {stored} enregistré, {expected} attendu")
+
+        verb = "détecté(s)" if options['dry_run'] else "corrigé(s)"
+        self.stdout.write(self.style.SUCCESS(f"{len(mismatches)} écart(s) {verb}"))
@@ -0,0 +1,76 @@
+import signal
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, close_old_connections
+
+from apiargent.compaction import ensure_ledger_storage
+from apiargent.metrics import registry
+from apiargent.settlement import SETTLEMENT_BATCH_SIZE, auto_approve, process_jobs, purge_jobs
+
+# Intervalle minimal entre deux purges des demandes traitées (secondes)
+PURGE_INTERVAL = 300
+STOP_SIGNALS = (signal.SIGTERM, signal.SIGINT)
+
+
+class Command(BaseCommand):
+    help = (
+        "Worker de règlement : traite les demandes de validation et de refus mises en file par l'API "
+        "et valide les logs couverts par AUTO_APPROVAL_RULES, par paquets. Plusieurs workers peuvent "
+        "tourner en parallèle. S'arrête proprement sur SIGTERM ou SIGINT, après le paquet en cours."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=SETTLEMENT_BATCH_SIZE, help="Demandes ou logs traités par transaction")
+        parser.add_argument('--interval', type=float, default=1.0, help="Attente (secondes) quand il n'y a rien à traiter")
+        parser.add_argument('--once', action='store_true', help="Vide la file puis s'arrête")
+
+    def handle(self, *args, **options):
+        ensure_ledger_storage()
+        self.running = True
+        previous = {signum: signal.signal(signum, self.stop) for signum in STOP_SIGNALS}
+        try:
+            jobs_total, validated_total = self.run(options['batch_size'], options['interval'], options['once'])
+        finally:
+            for signum, handler in previous.items():
+                signal.signal(signum, handler)
+            registry.flush(force=True)
+        self.stdout.write(self.style.SUCCESS(
+            f"{jobs_total} demande(s) traitée(s), {validated_total} log(s) validé(s) automatiquement"))
+
+    def run(self, batch_size, interval, once):
+        cursor = None
+        jobs_total = validated_total = 0
+        last_purge = 0.0
+        while self.running:
+            try:
+                jobs = process_jobs(batch_size)
+                validated, cursor = auto_approve(batch_size, cursor)
+            except DatabaseError as e:
+                if once:
+                    raise CommandError(f"Paquet annulé : {e}")
+                # Interblocage ou perte de connexion : le paquet est annulé et repris au tour suivant
+                self.stderr.write(f"Paquet annulé : {e}")
+                cursor = None
+                self.pause(interval)
+                continue
+            jobs_total += jobs
+            validated_total += validated
+            registry.flush()
+            if jobs or cursor is not None:
+                continue
+            if time.monotonic() - last_purge > PURGE_INTERVAL:
+                purge_jobs()
+                last_purge = time.monotonic()
+            if once:
+                break
+            self.pause(interval)
+        return jobs_total, validated_total
+
+    def pause(self, interval):
+        time.sleep(interval)
+        # Connexion rouverte au tour suivant si elle a expiré (CONN_MAX_AGE) ou est devenue inutilisable
+        close_old_connections()
+
+    def stop(self, signum, frame):
+        self.running = False
@@ -0,0 +1,251 @@
+import atexit
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+
+# Bornes (en secondes) des histogrammes de durée
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Bornes des histogrammes de nombre de requêtes SQL
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 500)
+
+# Intervalle minimal (secondes) entre deux écritures du fichier de métriques d'un worker
+FLUSH_INTERVAL = 1.0
+
+
+class Metric:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.samples = {}
+
+    def dump(self):
+        return {
+            'type': self.kind,
+            'help': self.help_text,
+            'buckets': list(getattr(self, 'buckets', ())),
+            'samples': [[list(labels), value] for labels, value in self.samples.items()],
+        }
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, labels, amount=1):
+        self.samples[labels] = self.samples.get(labels, 0) + amount
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, buckets):
+        super().__init__(name, help_text)
+        self.buckets = tuple(buckets)
+
+    def observe(self, labels, value):
+        sample = self.samples.get(labels)
+        if sample is None:
+            # [compteurs par intervalle (+Inf en dernier), somme, nombre]
+            sample = self.samples[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        sample[0][bisect_left(self.buckets, value)] += 1
+        sample[1] += value
+        sample[2] += 1
+
+
+class Registry:
+    """
+    Métriques du processus courant.
+
+    Si ``settings.METRICS_DIR`` est défini, chaque worker y écrit
+    périodiquement ses métriques (un fichier par pid) et l'export fusionne les
+    fichiers de tous les workers : les compteurs et histogrammes s'additionnent.
+    Un worker supprime son fichier à sa sortie ; l'export supprime ceux des
+    processus qui n'existent plus (worker tué, conteneur redémarré).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+        self.last_flush = 0.0
+
+    def counter(self, name, help_text):
+        with self.lock:
+            return self.metrics.setdefault(name, Counter(name, help_text))
+
+    def histogram(self, name, help_text, buckets=DURATION_BUCKETS):
+        with self.lock:
+            return self.metrics.setdefault(name, Histogram(name, help_text, buckets))
+
+    def inc(self, metric, labels, amount=1):
+        with self.lock:
+            metric.inc(labels, amount)
+
+    def observe(self, metric, labels, value):
+        with self.lock:
+            metric.observe(labels, value)
+
+    def dump(self):
+        with self.lock:
+            return {name: metric.dump() for name, metric in self.metrics.items()}
+
+    def metrics_dir(self):
+        return getattr(settings, 'METRICS_DIR', None)
+
+    def path(self, directory, pid=None):
+        return os.path.join(directory, f"metrics_{pid or os.getpid()}.json")
+
+    def flush(self, force=False):
+        directory = self.metrics_dir()
+        now = time.monotonic()
+        if not directory or (not force and now - self.last_flush < FLUSH_INTERVAL):
+            return
+        self.last_flush = now
+        os.makedirs(directory, exist_ok=True)
+        path = self.path(directory)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.dump(), f)
+        os.replace(tmp_path, path)
+
+    def discard(self):
+        """Supprime le fichier du processus courant (à la sortie du worker)."""
+        directory = self.metrics_dir()
+        if not directory:
+            return
+        try:
+            os.remove(self.path(directory))
+        except FileNotFoundError:
+            pass
+
+    def collect(self):
+        """Métriques fusionnées de tous les workers (ou du seul processus courant)."""
+        directory = self.metrics_dir()
+        if not directory:
+            return self.dump()
+
+        self.flush(force=True)
+        merged = {}
+        for filename in sorted(os.listdir(directory)):
+            if not (filename.startswith('metrics_') and filename.endswith('.json')):
+                continue
+            pid = filename[len('metrics_'):-len('.json')]
+            if pid.isdigit() and not pid_alive(int(pid)):
+                try:
+                    os.remove(os.path.join(directory, filename))
+                except OSError:
+                    pass
+                continue
+            try:
+                with open(os.path.join(directory, filename)) as f:
+                    merge_dumps(merged, json.load(f))
+            except (OSError, ValueError):
+                continue
+        return merged
+
+
+def pid_alive(pid):
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def merge_dumps(target, dump):
+    for name, metric in dump.items():
+        merged = target.setdefault(name, {**metric, 'samples': []})
+        samples = {tuple(tuple(pair) for pair in labels): value for labels, value in merged['samples']}
+        for labels, value in metric['samples']:
+            key = tuple(tuple(pair) for pair in labels)
+            current = samples.get(key)
+            if current is None:
+                samples[key] = value
+            elif metric['type'] == 'counter':
+                samples[key] = current + value
+            else:
+                samples[key] = [
+                    [a + b for a, b in zip(current[0], value[0])],
+                    current[1] + value[1],
+                    current[2] + value[2],
+                ]
+        merged['samples'] = [[list(labels), value] for labels, value in samples.items()]
+    return target
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = ('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for k, v in pairs)
+    return '{' + ','.join(escaped) + '}'
+
+
+def render_prometheus(dump):
+    """Format d'exposition texte de Prometheus (version 0.0.4)."""
+    lines = []
+    for name in sorted(dump):
+        metric = dump[name]
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        for labels, value in metric['samples']:
+            labels = [tuple(pair) for pair in labels]
+            if metric['type'] == 'counter':
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+                continue
+            counts, total, count = value
+            cumulative = 0
+            for bound, bucket_count in zip(list(metric['buckets']) + ['+Inf'], counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+    return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+# Enregistré avant le fork des workers : chaque processus supprime son propre fichier
+atexit.register(registry.discard)
+
+REQUEST_DURATION = registry.histogram(
+    'apiargent_request_duration_seconds', "Durée de traitement des requêtes par vue")
+DB_DURATION = registry.histogram(
+    'apiargent_db_duration_seconds', "Temps SQL cumulé par requête HTTP")
+DB_QUERIES = registry.histogram(
+    'apiargent_db_queries', "Nombre de requêtes SQL par requête HTTP", QUERY_COUNT_BUCKETS)
+AUTH_API_DURATION = registry.histogram(
+    'apiargent_auth_api_duration_seconds', "Latence des appels à l'API d'authentification externe")
+AUTH_CACHE = registry.counter(
+    'apiargent_auth_cache_total', "Consultations du cache des tokens par résultat")
+SLOW_QUERIES = registry.counter(
+    'apiargent_slow_queries_total', "Requêtes SQL au-delà du seuil SLOW_QUERY_THRESHOLD_MS")
+
+
+class RequestStats:
+    """Mesures d'une requête HTTP, remplies par le middleware et l'authentification."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.auth_cache = None
+        self.auth_time = None
+
+
+def request_stats(request):
+    """Statistiques de la requête en cours (Request DRF ou HttpRequest), ou None hors middleware."""
+    http_request = getattr(request, '_request', request)
+    return getattr(http_request, '_apiargent_stats', None)
+
+
+def record_auth(request, cache_result, duration=None):
+    registry.inc(AUTH_CACHE, (('result', cache_result),))
+    stats = request_stats(request)
+    if stats is not None:
+        stats.auth_cache = cache_result
+        stats.auth_time = duration
@@ -0,0 +1,168 @@
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from .metrics import (
+    DB_DURATION,
+    DB_QUERIES,
+    REQUEST_DURATION,
+    SLOW_QUERIES,
+    RequestStats,
+    registry,
+)
+
+slow_query_logger = logging.getLogger('apiargent.slow_queries')
+
+# Enregistreur de la requête HTTP en cours. La variable de contexte suit la
+# requête jusque dans le thread de ``sync_to_async`` où l'ORM s'exécute sous ASGI.
+current_recorder = ContextVar('apiargent_query_recorder', default=None)
+
+
+class QueryRecorder:
+    """``execute_wrapper`` qui compte et chronomètre les requêtes SQL d'une requête HTTP."""
+
+    def __init__(self, stats, view_name, threshold_ms):
+        self.stats = stats
+        self.view_name = view_name
+        self.threshold_ms = threshold_ms
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.stats.queries += 1
+            self.stats.db_time += duration
+            if self.threshold_ms is not None and duration * 1000 >= self.threshold_ms:
+                registry.inc(SLOW_QUERIES, (('view', self.view_name()),))
+                slow_query_logger.warning(
+                    "Requête SQL lente (%.1f ms) dans %s : %s", duration * 1000, self.view_name(), sql
+                )
+
+
+def record_query(execute, sql, params, many, context):
+    recorder = current_recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    """
+    Installe ``record_query`` sur chaque connexion ouverte (signal
+    ``connection_created``), quel que soit le thread qui l'utilise.
+    """
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class InstrumentationMiddleware:
+    """
+    Mesure chaque requête : vue résolue, durée, nombre de requêtes SQL et temps
+    SQL, résultat du cache d'authentification et latence de l'API d'auth.
+
+    Les mesures sont renvoyées dans l'en-tête ``Server-Timing`` et agrégées
+    dans les histogrammes exposés par l'endpoint ``metrics/``.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+
+        stats = request._apiargent_stats = RequestStats()
+        start = time.perf_counter()
+        with self.record_queries(request, stats):
+            response = self.get_response(request)
+        return self.finish(request, response, stats, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        stats = request._apiargent_stats = RequestStats()
+        start = time.perf_counter()
+        with self.record_queries(request, stats):
+            response = await self.get_response(request)
+        return self.finish(request, response, stats, time.perf_counter() - start)
+
+    @contextmanager
+    def record_queries(self, request, stats):
+        recorder = QueryRecorder(stats, lambda: self.view_name(request), getattr(settings, 'SLOW_QUERY_THRESHOLD_MS', None))
+        token = current_recorder.set(recorder)
+        try:
+            yield
+        finally:
+            current_recorder.reset(token)
+
+    def finish(self, request, response, stats, duration):
+        labels = (('view', self.view_name(request)), ('method', request.method), ('status', str(response.status_code)))
+        registry.observe(REQUEST_DURATION, labels, duration)
+        registry.observe(DB_DURATION, labels[:1], stats.db_time)
+        registry.observe(DB_QUERIES, labels[:1], stats.queries)
+        registry.flush()
+
+        response['Server-Timing'] = self.server_timing(stats, duration)
+        return response
+
+    def view_name(self, request):
+        match = getattr(request, 'resolver_match', None)
+        if match is None:
+            return 'unresolved'
+        return match.url_name or match.route
+
+    def server_timing(self, stats, duration):
+        entries = [f'db;dur={stats.db_time * 1000:.2f};desc="{stats.queries} queries"']
+        if stats.auth_cache is not None:
+            auth = f'auth;desc="cache {stats.auth_cache}"'
+            if stats.auth_time is not None:
+                auth += f';dur={stats.auth_time * 1000:.2f}'
+            entries.append(auth)
+        entries.append(f'total;dur={duration * 1000:.2f}')
+        return ', '.join(entries)
+
+
+class AsyncWhiteNoiseMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoise utilisable dans une chaîne asynchrone.
+
+    Le middleware d'origine est uniquement synchrone : sous ASGI, Django
+    exécute alors toute la suite de la chaîne via ``async_to_sync`` dans le
+    thread partagé, ce qui sérialise les vues asynchrones. Ici seuls les
+    fichiers statiques sont servis dans un thread, les autres requêtes restent
+    sur la boucle d'événements.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, settings=settings):
+        super().__init__(get_response, settings)
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve)(static_file, request)
+        return await self.get_response(request)
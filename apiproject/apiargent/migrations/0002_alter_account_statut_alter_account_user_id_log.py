@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apiargent', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='account',
+            name='statut',
+            field=models.CharField(choices=[('actif', 'Actif'), ('fermé', 'Fermé'), ('en_creation', 'En cours de création')], default='actif', max_length=20, verbose_name='Statut du compte'),
+        ),
+        migrations.AlterField(
+            model_name='account',
+            name='user_id',
+            field=models.IntegerField(verbose_name="ID de l'utilisateur"),
+        ),
+        migrations.CreateModel(
+            name='Log',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action', models.CharField(choices=[('depot', 'Dépôt'), ('retrait', 'Retrait'), ('virement_recu', 'Virement reçu'), ('virement_envoye', 'Virement envoyé')], max_length=50, verbose_name='Action effectuée')),
+                ('montant', models.DecimalField(decimal_places=2, max_digits=10, verbose_name="Montant de l'action")),
+                ('date_action', models.DateTimeField(auto_now_add=True, verbose_name="Date de l'action")),
+                ('date_valeur', models.DateTimeField(blank=True, null=True, verbose_name="Date de valeur de l'action")),
+                ('libele', models.CharField(blank=True, max_length=255, null=True, verbose_name="Libellé de l'action")),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='logs', to='apiargent.account', verbose_name='Compte associé')),
+                ('cible', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='logs_cible', to='apiargent.account', verbose_name='Compte cible (pour les virements)')),
+            ],
+        ),
+    ]
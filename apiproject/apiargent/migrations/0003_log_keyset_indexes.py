@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apiargent', '0002_alter_account_statut_alter_account_user_id_log'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='log',
+            index=models.Index(fields=['account', 'date_action', 'id'], name='log_account_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='log',
+            index=models.Index(fields=['date_valeur', 'date_action', 'id'], name='log_pending_date_id_idx'),
+        ),
+    ]
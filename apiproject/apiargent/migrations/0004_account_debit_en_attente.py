@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:06
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def init_debit_en_attente(apps, schema_editor):
+    # Reprise des retraits et virements envoyés encore en attente
+    Account = apps.get_model('apiargent', 'Account')
+    Log = apps.get_model('apiargent', 'Log')
+    pending = (
+        Log.objects.filter(date_valeur__isnull=True, action__in=['retrait', 'virement_envoye'])
+        .values('account_id')
+        .annotate(total=Sum('montant'))
+    )
+    for row in pending.iterator():
+        Account.objects.filter(pk=row['account_id']).update(debit_en_attente=row['total'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apiargent', '0003_log_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='account',
+            name='debit_en_attente',
+            field=models.DecimalField(decimal_places=2, default=0.0, max_digits=10, verbose_name='Débits en attente de validation'),
+        ),
+        migrations.RunPython(init_debit_en_attente, migrations.RunPython.noop),
+    ]
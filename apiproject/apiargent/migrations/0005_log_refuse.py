@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apiargent', '0004_account_debit_en_attente'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='log',
+            name='refuse',
+            field=models.BooleanField(default=False, verbose_name='Action refusée'),
+        ),
+    ]
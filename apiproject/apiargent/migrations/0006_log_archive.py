@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apiargent', '0005_log_refuse'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BalanceCheckpoint',
+            fields=[
+                ('account', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='checkpoint', serialize=False, to='apiargent.account', verbose_name='Compte')),
+                ('archived_until', models.DateTimeField(verbose_name="Date d'action du log archivé le plus récent")),
+                ('archived_count', models.BigIntegerField(default=0, verbose_name='Nombre de logs archivés')),
+                ('archived_total', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Somme des mouvements validés archivés')),
+                ('date_maj', models.DateTimeField(auto_now=True, verbose_name='Dernière mise à jour')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedLog',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('action', models.CharField(max_length=50, verbose_name='Action effectuée')),
+                ('montant', models.DecimalField(decimal_places=2, max_digits=10, verbose_name="Montant de l'action")),
+                ('date_action', models.DateTimeField(verbose_name="Date de l'action")),
+                ('date_valeur', models.DateTimeField(verbose_name="Date de valeur de l'action")),
+                ('libele', models.CharField(blank=True, max_length=255, null=True, verbose_name="Libellé de l'action")),
+                ('refuse', models.BooleanField(default=False, verbose_name='Action refusée')),
+                ('date_archivage', models.DateTimeField(auto_now_add=True, verbose_name="Date d'archivage")),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_logs', to='apiargent.account', verbose_name='Compte associé')),
+                ('cible', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_logs_cible', to='apiargent.account', verbose_name='Compte cible (pour les virements)')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['account', 'date_action', 'id'], name='archivedlog_account_date_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apiargent', '0006_log_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='account',
+            name='version',
+            field=models.PositiveBigIntegerField(default=0, verbose_name='Version du compte et de ses logs'),
+        ),
+    ]
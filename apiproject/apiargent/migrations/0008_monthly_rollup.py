@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apiargent', '0007_account_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(verbose_name='Mois (premier jour)')),
+                ('action', models.CharField(max_length=50, verbose_name='Action effectuée')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name="Nombre d'actions validées")),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Montant total validé')),
+                ('declined', models.PositiveIntegerField(default=0, verbose_name="Nombre d'actions refusées")),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='apiargent.account', verbose_name='Compte')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('account', 'month', 'action'), name='monthlyrollup_account_month_action')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apiargent', '0008_monthly_rollup'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='log',
+            index=models.Index(fields=['date_action', 'id'], name='log_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='log',
+            index=models.Index(fields=['cible', 'date_action', 'id'], name='log_cible_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='log',
+            index=models.Index(fields=['montant', 'date_action', 'id'], name='log_montant_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='log',
+            index=models.Index(fields=['action', 'date_action', 'id'], name='log_action_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='log',
+            index=models.Index(fields=['libele'], name='log_libele_idx'),
+        ),
+    ]
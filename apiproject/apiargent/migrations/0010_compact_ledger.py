@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:43
+
+import apiargent.fields
+from django.db import migrations
+
+from apiargent.compaction import COMPACT, convert, storage
+from apiargent.fields import compact_ledger
+
+
+def to_compact(apps, schema_editor):
+    # Format compact seulement s'il est demandé (COMPACT_LEDGER) ; sinon aucun changement en base
+    if not compact_ledger():
+        return
+    for name in ('Log', 'ArchivedLog'):
+        convert(apps.get_model('apiargent', name), True, schema_editor=schema_editor)
+
+
+def to_decimal(apps, schema_editor):
+    for name in ('Log', 'ArchivedLog'):
+        model = apps.get_model('apiargent', name)
+        if storage(model) == COMPACT:
+            convert(model, False, schema_editor=schema_editor)
+
+
+class Migration(migrations.Migration):
+    # Conversion par paquets, une transaction par paquet
+    atomic = False
+
+    dependencies = [
+        ('apiargent', '0009_log_search_indexes'),
+    ]
+
+    operations = [
+        # Même colonne qu'avant sans COMPACT_LEDGER : seul l'état des modèles change
+        migrations.SeparateDatabaseAndState(state_operations=[
+            migrations.AlterField(
+                model_name='archivedlog',
+                name='action',
+                field=apiargent.fields.CodeField(codes={'depot': 1, 'retrait': 2, 'virement_envoye': 4, 'virement_recu': 3}, max_length=50, verbose_name='Action effectuée'),
+            ),
+            migrations.AlterField(
+                model_name='archivedlog',
+                name='montant',
+                field=apiargent.fields.AmountField(decimal_places=2, max_digits=10, verbose_name="Montant de l'action"),
+            ),
+            migrations.AlterField(
+                model_name='log',
+                name='action',
+                field=apiargent.fields.CodeField(choices=[('depot', 'Dépôt'), ('retrait', 'Retrait'), ('virement_recu', 'Virement reçu'), ('virement_envoye', 'Virement envoyé')], codes={'depot': 1, 'retrait': 2, 'virement_envoye': 4, 'virement_recu': 3}, max_length=50, verbose_name='Action effectuée'),
+            ),
+            migrations.AlterField(
+                model_name='log',
+                name='montant',
+                field=apiargent.fields.AmountField(decimal_places=2, max_digits=10, verbose_name="Montant de l'action"),
+            ),
+        ]),
+        migrations.RunPython(to_compact, to_decimal),
+    ]
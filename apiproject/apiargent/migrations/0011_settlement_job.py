@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apiargent', '0010_compact_ledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SettlementJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('approve', models.BooleanField(verbose_name='Validation (sinon refus)')),
+                ('requested_by', models.IntegerField(blank=True, null=True, verbose_name='ID du banquier')),
+                ('status', models.CharField(choices=[('pending', 'En attente'), ('done', 'Traitée')], default='pending', max_length=20, verbose_name='Statut de la demande')),
+                ('outcome', models.CharField(blank=True, max_length=30, null=True, verbose_name='Résultat du règlement')),
+                ('date_creation', models.DateTimeField(auto_now_add=True, verbose_name='Date de la demande')),
+                ('date_traitement', models.DateTimeField(blank=True, null=True, verbose_name='Date de traitement')),
+                ('log', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='settlement_jobs', to='apiargent.log', verbose_name='Log à régler')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'id'], name='settlementjob_status_id_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,98 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:16
+
+from collections import defaultdict
+from datetime import timedelta
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+CHUNK_SIZE = 1000
+# Délai maximal entre un virement envoyé et le log reçu créé avec lui (même transaction)
+PAIR_WINDOW = timedelta(minutes=1)
+
+
+def pair_key(log, sent):
+    # (compte émetteur, compte destinataire, montant) d'un virement, vu depuis l'un de ses deux logs
+    return (log.account_id, log.cible_id, log.montant) if sent else (log.cible_id, log.account_id, log.montant)
+
+
+def matches(log, candidates):
+    return [other for other in candidates if abs(other.date_action - log.date_action) <= PAIR_WINDOW]
+
+
+def link_transfers(apps, schema_editor):
+    """
+    Renseigne ``origine`` des logs reçus existants, créés sans lien avec
+    leur log envoyé. Un couple n'est lié que s'il est sans ambiguïté : le log
+    envoyé n'a qu'un seul log reçu possible (mêmes comptes, même montant,
+    créé dans ``PAIR_WINDOW``) et ce log reçu n'a que ce log envoyé possible.
+    Deux virements identiques rapprochés restent sans lien (et leurs logs
+    reçus en attente).
+
+    Les logs reçus en attente dont le virement envoyé est réglé sont ensuite
+    réglés comme lui. Les agrégats mensuels sont à recalculer après la
+    migration (commande ``rebuild_rollups``).
+    """
+    Log = apps.get_model('apiargent', 'Log')
+    last_id = 0
+    while True:
+        transfers = list(
+            Log.objects.filter(action='virement_envoye', id__gt=last_id).order_by('id')[:CHUNK_SIZE]
+        )
+        if not transfers:
+            return
+        last_id = transfers[-1].id
+        start = min(transfer.date_action for transfer in transfers) - PAIR_WINDOW
+        end = max(transfer.date_action for transfer in transfers) + PAIR_WINDOW
+        received = defaultdict(list)
+        for log in Log.objects.filter(
+            action='virement_recu', origine__isnull=True,
+            account_id__in={transfer.cible_id for transfer in transfers}, date_action__range=(start, end),
+        ):
+            received[pair_key(log, False)].append(log)
+        if not received:
+            continue
+        # Tous les virements envoyés possibles de ces logs reçus, y compris hors du paquet
+        sent = defaultdict(list)
+        for log in Log.objects.filter(
+            action='virement_envoye',
+            account_id__in={key[0] for key in received},
+            date_action__range=(start - PAIR_WINDOW, end + PAIR_WINDOW),
+        ):
+            sent[pair_key(log, True)].append(log)
+
+        linked = []
+        for transfer in transfers:
+            candidates = matches(transfer, received.get(pair_key(transfer, True), []))
+            if len(candidates) != 1:
+                continue
+            log = candidates[0]
+            if len(matches(log, sent[pair_key(log, False)])) != 1:
+                continue
+            log.origine_id = transfer.id
+            if log.date_valeur is None and transfer.date_valeur is not None:
+                log.date_valeur = log.date_action
+                log.refuse = transfer.refuse
+            linked.append(log)
+        Log.objects.bulk_update(linked, ['origine', 'date_valeur', 'refuse'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apiargent', '0011_settlement_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedlog',
+            name='origine',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='apiargent.archivedlog', verbose_name='Virement envoyé (pour un virement reçu)'),
+        ),
+        migrations.AddField(
+            model_name='log',
+            name='origine',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='contrepartie', to='apiargent.log', verbose_name='Virement envoyé (pour un virement reçu)'),
+        ),
+        migrations.RunPython(link_transfers, migrations.RunPython.noop),
+    ]
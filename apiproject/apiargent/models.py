@@ -1,8 +1,11 @@
 from django.db import models
 
+from .fields import AmountField, CodeField
+
 class Account(models.Model):
     user_id = models.IntegerField(verbose_name="ID de l'utilisateur")
     solde = models.DecimalField(max_digits=10, decimal_places=2, default=0.00, verbose_name="Solde du compte")
+    debit_en_attente = models.DecimalField(max_digits=10, decimal_places=2, default=0.00, verbose_name="Débits en attente de validation")
     date_creation = models.DateTimeField(auto_now_add=True, verbose_name="Date de création du compte")
     type_compte = models.CharField(max_length=50, verbose_name="Type de compte", choices=[
         ('epargne', 'Épargne'),
@@ -13,6 +16,13 @@ class Account(models.Model):
         ('fermé', 'Fermé'),
         ('en_creation', 'En cours de création'),
     ], default='actif')
+    # Incrémentée à chaque écriture du compte ou de ses logs (ETag des lectures)
+    version = models.PositiveBigIntegerField(default=0, verbose_name="Version du compte et de ses logs")
+
+    @property
+    def solde_disponible(self):
+        # Solde diminué des retraits et virements envoyés pas encore validés
+        return self.solde - self.debit_en_attente
 
     def __str__(self):
         return f"Compte de l'utilisateur {self.user_id} - Solde: {self.solde} - Type: {self.type_compte} - Statut: {self.statut}"
@@ -20,22 +30,129 @@ class Account(models.Model):
     def __repr__(self):
         return f"Account(user_id={self.user_id}, solde={self.solde}, type_compte={self.type_compte}, statut={self.statut})"
 
+# Actions qui réservent des fonds sur le compte tant qu'elles sont en attente
+DEBIT_ACTIONS = ('retrait', 'virement_envoye')
+# Actions qui créditent le compte une fois validées
+CREDIT_ACTIONS = ('depot', 'virement_recu')
+# Codes stockés des actions au format compact (COMPACT_LEDGER) ; un code attribué ne change plus
+ACTION_CODES = {'depot': 1, 'retrait': 2, 'virement_recu': 3, 'virement_envoye': 4}
+
 class Log(models.Model):
     account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='logs', verbose_name="Compte associé")
-    action = models.CharField(max_length=50, verbose_name="Action effectuée", choices=[
+    action = CodeField(max_length=50, codes=ACTION_CODES, verbose_name="Action effectuée", choices=[
         ('depot', 'Dépôt'),
         ('retrait', 'Retrait'),
         ('virement_recu', 'Virement reçu'),
         ('virement_envoye', 'Virement envoyé'),
     ])
-    montant = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Montant de l'action")
+    montant = AmountField(max_digits=10, decimal_places=2, verbose_name="Montant de l'action")
     date_action = models.DateTimeField(auto_now_add=True, verbose_name="Date de l'action")
     date_valeur = models.DateTimeField(null=True, blank=True, verbose_name="Date de valeur de l'action")
     cible = models.ForeignKey(Account, on_delete=models.SET_NULL, null=True, blank=True, related_name='logs_cible', verbose_name="Compte cible (pour les virements)")
     libele = models.CharField(max_length=255, null=True, blank=True, verbose_name="Libellé de l'action")
+    refuse = models.BooleanField(default=False, verbose_name="Action refusée")
+    origine = models.OneToOneField('self', on_delete=models.SET_NULL, null=True, blank=True, related_name='contrepartie', verbose_name="Virement envoyé (pour un virement reçu)")
+
+    class Meta:
+        indexes = [
+            # Pagination par curseur de l'historique d'un compte
+            models.Index(fields=['account', 'date_action', 'id'], name='log_account_date_id_idx'),
+            # Pagination par curseur de la file des actions en attente
+            models.Index(fields=['date_valeur', 'date_action', 'id'], name='log_pending_date_id_idx'),
+            # Recherche (apiargent/search.py) : un index par filtre, suivi de l'ordre de pagination
+            models.Index(fields=['date_action', 'id'], name='log_date_id_idx'),
+            models.Index(fields=['cible', 'date_action', 'id'], name='log_cible_date_id_idx'),
+            models.Index(fields=['montant', 'date_action', 'id'], name='log_montant_date_id_idx'),
+            models.Index(fields=['action', 'date_action', 'id'], name='log_action_date_id_idx'),
+            # Recherche par préfixe du libellé (intervalle sur l'index)
+            models.Index(fields=['libele'], name='log_libele_idx'),
+        ]
 
     def __str__(self):
         return f"{self.action} de {self.montant} sur le compte {self.account.user_id} le {self.date_action}"
 
     def __repr__(self):
-        return f"Log(account={self.account.user_id}, action={self.action}, montant={self.montant}, date_action={self.date_action}, cible={self.cible.user_id if self.cible else 'None'})"
\ No newline at end of file
+        return f"Log(account={self.account.user_id}, action={self.action}, montant={self.montant}, date_action={self.date_action}, cible={self.cible.user_id if self.cible else 'None'})"
+
+class ArchivedLog(models.Model):
+    """
+    Log validé ou refusé déplacé hors de la table des logs courants
+    (voir apiargent/archive.py). Les colonnes et l'id d'origine sont conservés.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='archived_logs', verbose_name="Compte associé")
+    action = CodeField(max_length=50, codes=ACTION_CODES, verbose_name="Action effectuée")
+    montant = AmountField(max_digits=10, decimal_places=2, verbose_name="Montant de l'action")
+    date_action = models.DateTimeField(verbose_name="Date de l'action")
+    date_valeur = models.DateTimeField(verbose_name="Date de valeur de l'action")
+    cible = models.ForeignKey(Account, on_delete=models.SET_NULL, null=True, blank=True, related_name='archived_logs_cible', verbose_name="Compte cible (pour les virements)")
+    libele = models.CharField(max_length=255, null=True, blank=True, verbose_name="Libellé de l'action")
+    refuse = models.BooleanField(default=False, verbose_name="Action refusée")
+    # Sans contrainte : le virement envoyé peut être archivé dans un autre paquet
+    origine = models.ForeignKey('self', on_delete=models.DO_NOTHING, db_constraint=False, null=True, blank=True, related_name='+', verbose_name="Virement envoyé (pour un virement reçu)")
+    date_archivage = models.DateTimeField(auto_now_add=True, verbose_name="Date d'archivage")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['account', 'date_action', 'id'], name='archivedlog_account_date_idx'),
+        ]
+
+    def __repr__(self):
+        return f"ArchivedLog(id={self.id}, account={self.account_id}, action={self.action}, montant={self.montant}, date_action={self.date_action})"
+
+class BalanceCheckpoint(models.Model):
+    """Résumé par compte de l'historique archivé."""
+    account = models.OneToOneField(Account, on_delete=models.CASCADE, primary_key=True, related_name='checkpoint', verbose_name="Compte")
+    archived_until = models.DateTimeField(verbose_name="Date d'action du log archivé le plus récent")
+    archived_count = models.BigIntegerField(default=0, verbose_name="Nombre de logs archivés")
+    archived_total = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Somme des mouvements validés archivés")
+    date_maj = models.DateTimeField(auto_now=True, verbose_name="Dernière mise à jour")
+
+    def __repr__(self):
+        return f"BalanceCheckpoint(account={self.account_id}, archived_until={self.archived_until}, archived_total={self.archived_total})"
+
+class MonthlyRollup(models.Model):
+    """
+    Mouvements réglés d'un compte pour un mois et un type d'action, mis à jour
+    au moment de la validation ou du refus (voir apiargent/rollups.py).
+    """
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='rollups', verbose_name="Compte")
+    month = models.DateField(verbose_name="Mois (premier jour)")
+    action = models.CharField(max_length=50, verbose_name="Action effectuée")
+    count = models.PositiveIntegerField(default=0, verbose_name="Nombre d'actions validées")
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Montant total validé")
+    declined = models.PositiveIntegerField(default=0, verbose_name="Nombre d'actions refusées")
+
+    class Meta:
+        constraints = [
+            # Sert aussi les lectures par compte et par période
+            models.UniqueConstraint(fields=['account', 'month', 'action'], name='monthlyrollup_account_month_action'),
+        ]
+
+    def __repr__(self):
+        return f"MonthlyRollup(account={self.account_id}, month={self.month}, action={self.action}, count={self.count}, total={self.total})"
+
+class SettlementJob(models.Model):
+    """
+    Validation ou refus d'un log demandé par un banquier, traité en arrière-plan
+    par le worker de règlement (voir apiargent/settlement.py).
+    """
+    log = models.ForeignKey(Log, on_delete=models.CASCADE, related_name='settlement_jobs', verbose_name="Log à régler")
+    approve = models.BooleanField(verbose_name="Validation (sinon refus)")
+    requested_by = models.IntegerField(null=True, blank=True, verbose_name="ID du banquier")
+    status = models.CharField(max_length=20, default='pending', verbose_name="Statut de la demande", choices=[
+        ('pending', 'En attente'),
+        ('done', 'Traitée'),
+    ])
+    outcome = models.CharField(max_length=30, null=True, blank=True, verbose_name="Résultat du règlement")
+    date_creation = models.DateTimeField(auto_now_add=True, verbose_name="Date de la demande")
+    date_traitement = models.DateTimeField(null=True, blank=True, verbose_name="Date de traitement")
+
+    class Meta:
+        indexes = [
+            # Prise des demandes en attente par les workers, dans l'ordre d'arrivée
+            models.Index(fields=['status', 'id'], name='settlementjob_status_id_idx'),
+        ]
+
+    def __repr__(self):
+        return f"SettlementJob(id={self.id}, log={self.log_id}, approve={self.approve}, status={self.status}, outcome={self.outcome})"
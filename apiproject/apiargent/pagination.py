@@ -0,0 +1,113 @@
+import base64
+import json
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework import exceptions
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from .archive import merge_history
+
+
+class KeysetPagination(BasePagination):
+    """
+    Pagination par curseur opaque sur le couple (date_action, id).
+
+    Chaque page est obtenue par un filtre "après la dernière ligne vue" qui
+    s'appuie sur les index composites des logs : récupérer la page N coûte
+    le même prix que récupérer la première.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = 50
+    max_page_size = 500
+    descending = True
+
+    def is_requested(self, request):
+        params = request.query_params
+        return self.cursor_query_param in params or self.page_size_query_param in params
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def encode_cursor(self, date_action, pk):
+        raw = json.dumps({'d': date_action.isoformat(), 'i': pk}).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            raw = base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4))
+            data = json.loads(raw)
+            date_action = parse_datetime(data['d'])
+            pk = int(data['i'])
+        except (TypeError, ValueError, KeyError):
+            raise exceptions.NotFound('Curseur invalide')
+        if date_action is None:
+            raise exceptions.NotFound('Curseur invalide')
+        return date_action, pk
+
+    def order_and_seek(self, queryset, position):
+        if self.descending:
+            queryset = queryset.order_by('-date_action', '-id')
+            if position:
+                date_action, pk = position
+                queryset = queryset.filter(Q(date_action__lt=date_action) | Q(date_action=date_action, id__lt=pk))
+        else:
+            queryset = queryset.order_by('date_action', 'id')
+            if position:
+                date_action, pk = position
+                queryset = queryset.filter(Q(date_action__gt=date_action) | Q(date_action=date_action, id__gt=pk))
+        return queryset
+
+    def paginate_queryset(self, queryset, request, view=None, archive=None, archived_until=None):
+        """
+        ``archive`` : historique archivé facultatif (lignes toutes antérieures
+        ou égales à ``archived_until``), fusionné quand la page l'atteint.
+        Uniquement en ordre décroissant.
+        """
+        self.request = request
+        page_size = self.get_page_size(request)
+        position = self.decode_cursor(request)
+
+        # Une ligne de plus que demandé permet de savoir s'il existe une page suivante
+        rows = list(self.order_and_seek(queryset, position)[:page_size + 1])
+        if archive is not None and archived_until is not None:
+            rows = merge_history(rows, self.order_and_seek(archive, position), page_size + 1, archived_until)
+        self.has_next = len(rows) > page_size
+        rows = rows[:page_size]
+        self.last = rows[-1] if rows else None
+        return rows
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        # Instance de modèle ou ligne nommée de values_list(named=True)
+        cursor = self.encode_cursor(self.last.date_action, self.last.id)
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+
+class AccountLogPagination(KeysetPagination):
+    descending = True
+
+
+class PendingActionsPagination(KeysetPagination):
+    descending = False
+
+
+class LogSearchPagination(KeysetPagination):
+    descending = True
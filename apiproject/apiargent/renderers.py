@@ -0,0 +1,38 @@
+try:
+    import orjson
+except ImportError:  # orjson est optionnel : sans lui on garde le rendu de DRF
+    orjson = None
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    ``JSONRenderer`` qui délègue l'encodage à orjson quand il est installé.
+
+    La sortie est identique octet pour octet à celle de DRF (séparateurs
+    compacts, UTF-8, ``\\u2028``/``\\u2029`` échappés) : les dates et décimaux
+    passent par l'encodeur de DRF, les listes de ``ValuesSerializer`` n'en
+    contiennent plus. Les réponses indentées (API navigable,
+    ``Accept: application/json; indent=4``) et les données qu'orjson refuse
+    reviennent au rendu standard. Réservé aux vues sans flottants : orjson
+    n'écrit pas les grands exposants comme ``json`` (``1e16`` / ``1e+16``) et
+    remplace NaN par ``null``.
+    """
+
+    options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS if orjson else 0
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (orjson is None or data is None or not self.compact or self.ensure_ascii
+                or self.get_indent(accepted_media_type, renderer_context or {}) is not None):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=JSONEncoder().default, option=self.options)
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Même échappement que DRF pour rester un sous-ensemble strict de JavaScript
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+        return ret
@@ -0,0 +1,113 @@
+import hashlib
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+
+from .metrics import registry
+
+# Réponses mises en cache, invalidées chacune par sa propre génération
+PENDING_ACTIONS = 'pending_actions'
+CREATED_ACCOUNTS = 'created_accounts'
+
+# Durée de vie d'une réponse en cache (filet de sécurité si une écriture échappe aux invalidations)
+RESPONSE_CACHE_TTL = getattr(settings, 'RESPONSE_CACHE_TTL', 60)
+# Durée maximale du recalcul par le worker qui détient le verrou
+RESPONSE_CACHE_LOCK_TTL = getattr(settings, 'RESPONSE_CACHE_LOCK_TTL', 10)
+# Attente maximale des autres workers avant de calculer eux-mêmes la réponse
+RESPONSE_CACHE_WAIT = getattr(settings, 'RESPONSE_CACHE_WAIT', 5)
+POLL_INTERVAL = 0.02
+
+RESPONSE_CACHE = registry.counter(
+    'apiargent_response_cache_total', "Consultations du cache des réponses par vue et résultat")
+
+
+def generation_key(name):
+    return f"response_cache_gen_{name}"
+
+
+def current_generation(name):
+    generation = cache.get(generation_key(name))
+    if generation is None:
+        cache.add(generation_key(name), uuid.uuid4().hex, None)
+        generation = cache.get(generation_key(name))
+    return generation
+
+
+def invalidate(*names):
+    """
+    Invalide les réponses ``names`` après la validation de la transaction en
+    cours (immédiatement hors transaction).
+
+    Chaque invalidation remplace la génération par une valeur aléatoire : deux
+    invalidations concurrentes ne peuvent pas se confondre comme un compteur
+    incrémenté par lecture puis écriture. Une erreur d'écriture du cache est
+    journalisée par Django (``robust``) sans faire échouer l'écriture déjà
+    validée ; les réponses expirent au plus tard après ``RESPONSE_CACHE_TTL``.
+    """
+    def bump():
+        for name in names:
+            cache.set(generation_key(name), uuid.uuid4().hex, None)
+
+    transaction.on_commit(bump, robust=True)
+
+
+def get_or_compute(name, variant, compute):
+    """
+    Contenu mis en cache pour (``name``, ``variant``), calculé par ``compute()``
+    en cas d'absence.
+
+    Après une invalidation, un seul worker recalcule (verrou ``cache.add``) ;
+    les autres attendent son résultat au plus ``RESPONSE_CACHE_WAIT``
+    secondes puis calculent eux-mêmes sans écrire dans le cache.
+    """
+    # La génération est lue avant la base : un calcul concurrent d'une écriture
+    # est rangé sous l'ancienne génération et ne sera jamais resservi.
+    generation = current_generation(name)
+    digest = hashlib.md5(variant.encode(), usedforsecurity=False).hexdigest()
+    key = f"response_cache_{name}_{generation}_{digest}"
+    lock_key = key + '_lock'
+
+    deadline = time.monotonic() + RESPONSE_CACHE_WAIT
+    waited = False
+    while True:
+        content = cache.get(key)
+        if content is not None:
+            registry.inc(RESPONSE_CACHE, (('name', name), ('result', 'wait' if waited else 'hit')))
+            return content
+        if cache.add(lock_key, 1, RESPONSE_CACHE_LOCK_TTL):
+            try:
+                content = compute()
+                cache.set(key, content, RESPONSE_CACHE_TTL)
+            finally:
+                cache.delete(lock_key)
+            registry.inc(RESPONSE_CACHE, (('name', name), ('result', 'miss')))
+            return content
+        if time.monotonic() >= deadline:
+            registry.inc(RESPONSE_CACHE, (('name', name), ('result', 'timeout')))
+            return compute()
+        waited = True
+        time.sleep(POLL_INTERVAL)
+
+
+def cached_response(name, view, request, build):
+    """
+    Réponse d'une vue DRF en lecture servie depuis le cache partagé.
+
+    ``build()`` retourne la ``Response`` de la vue ; le corps est mis en cache
+    déjà rendu, par URL complète et type de contenu. L'API navigable (HTML)
+    n'est pas mise en cache.
+    """
+    media_type = request.accepted_media_type
+    if not media_type.startswith('application/json'):
+        return build()
+
+    def compute():
+        response = build()
+        return request.accepted_renderer.render(response.data, media_type, view.get_renderer_context())
+
+    content = get_or_compute(name, f"{request.get_full_path()}|{media_type}", compute)
+    return HttpResponse(content, content_type=media_type)
@@ -0,0 +1,200 @@
+"""
+Agrégats mensuels des mouvements réglés, par compte et par type d'action.
+
+``record_rollups`` ajoute les logs validés ou refusés aux agrégats dans la
+transaction du règlement ; ``rebuild_rollups`` les recalcule depuis les logs
+(courants et archivés) par paquets de comptes. Les résumés ne lisent que les
+agrégats : leur coût dépend du nombre de mois, pas du nombre de logs.
+"""
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .models import CREDIT_ACTIONS, DEBIT_ACTIONS, Account, ArchivedLog, Log, MonthlyRollup
+
+# Nombre de comptes recalculés par transaction
+REBUILD_CHUNK_SIZE = 500
+ACTIONS = CREDIT_ACTIONS + DEBIT_ACTIONS
+CENT = Decimal('0.01')
+
+
+def month_of(moment):
+    """Premier jour du mois de ``moment`` dans le fuseau courant (comme TruncMonth)."""
+    return timezone.localtime(moment).date().replace(day=1)
+
+
+def parse_month(value):
+    """Mois ``AAAA-MM`` ; lève ValueError si la valeur est invalide."""
+    if not value:
+        return None
+    year, month = value.split('-')
+    return date(int(year), int(month), 1)
+
+
+def record_rollups(logs):
+    """
+    Ajoute des logs réglés (``date_valeur`` renseignée) aux agrégats de leur
+    compte, en une lecture et deux écritures groupées.
+
+    À appeler dans la transaction du règlement, après la mise à jour des
+    comptes concernés : le verrou de ces comptes sérialise les règlements
+    concurrents d'un même compte, qui ne peuvent donc pas créer deux fois la
+    même ligne d'agrégat.
+    """
+    counts = defaultdict(int)
+    totals = defaultdict(Decimal)
+    declined = defaultdict(int)
+    for log in logs:
+        key = (log.account_id, month_of(log.date_action), log.action)
+        if log.refuse:
+            declined[key] += 1
+        else:
+            counts[key] += 1
+            totals[key] += log.montant
+    keys = set(counts) | set(declined)
+    if not keys:
+        return
+
+    existing = MonthlyRollup.objects.filter(
+        account_id__in={account_id for account_id, _, _ in keys},
+        month__in={month for _, month, _ in keys},
+    )
+    rollups = {(rollup.account_id, rollup.month, rollup.action): rollup for rollup in existing}
+    changed = []
+    created = []
+    for key in keys:
+        rollup = rollups.get(key)
+        if rollup is None:
+            account_id, month, action = key
+            created.append(MonthlyRollup(account_id=account_id, month=month, action=action,
+                                         count=counts[key], total=totals[key], declined=declined[key]))
+            continue
+        rollup.count += counts[key]
+        rollup.total += totals[key]
+        rollup.declined += declined[key]
+        changed.append(rollup)
+    MonthlyRollup.objects.bulk_create(created)
+    MonthlyRollup.objects.bulk_update(changed, ['count', 'total', 'declined'])
+
+
+def aggregate_logs(account_ids):
+    """Agrégats recalculés depuis les logs réglés, courants et archivés, des comptes ``account_ids``."""
+    rollups = {}
+    for model in (Log, ArchivedLog):
+        rows = (
+            model.objects.filter(account_id__in=account_ids, date_valeur__isnull=False)
+            .annotate(month=TruncMonth('date_action'))
+            .values('account_id', 'month', 'action')
+            .annotate(
+                count=Count('id', filter=Q(refuse=False)),
+                total=Sum('montant', filter=Q(refuse=False)),
+                declined=Count('id', filter=Q(refuse=True)),
+            )
+            .order_by()
+        )
+        for row in rows:
+            key = (row['account_id'], row['month'], row['action'])
+            rollup = rollups.get(key)
+            if rollup is None:
+                rollup = rollups[key] = MonthlyRollup(account_id=key[0], month=key[1], action=key[2])
+            rollup.count += row['count']
+            rollup.total += row['total'] or Decimal('0')
+            rollup.declined += row['declined']
+    return list(rollups.values())
+
+
+def rebuild_rollups(chunk_size=REBUILD_CHUNK_SIZE, progress=None):
+    """
+    Recalcule tous les agrégats depuis les logs, par transactions de
+    ``chunk_size`` comptes. Les comptes du paquet sont verrouillés : un
+    règlement concurrent attend la fin du paquet au lieu de s'y perdre.
+    Retourne le nombre de comptes traités.
+    """
+    done = 0
+    last_id = 0
+    while True:
+        with transaction.atomic():
+            account_ids = list(
+                Account.objects.select_for_update().filter(pk__gt=last_id)
+                .order_by('id').values_list('id', flat=True)[:chunk_size]
+            )
+            if not account_ids:
+                break
+            MonthlyRollup.objects.filter(account_id__in=account_ids).delete()
+            MonthlyRollup.objects.bulk_create(aggregate_logs(account_ids), batch_size=1000)
+        done += len(account_ids)
+        last_id = account_ids[-1]
+        if progress:
+            progress(done)
+    return done
+
+
+def _month_entry(month):
+    return {'month': month.strftime('%Y-%m'), 'inflow': Decimal('0'), 'outflow': Decimal('0'),
+            'counts': {action: 0 for action in ACTIONS}, 'declined': 0}
+
+
+def summarize(rows):
+    """Résumé mois par mois (entrées, sorties, nombre d'actions par type) de lignes (month, action, count, total, declined)."""
+    months = {}
+    for row in rows:
+        entry = months.get(row['month'])
+        if entry is None:
+            entry = months[row['month']] = _month_entry(row['month'])
+        if row['action'] in CREDIT_ACTIONS:
+            entry['inflow'] += row['total']
+        elif row['action'] in DEBIT_ACTIONS:
+            entry['outflow'] += row['total']
+        entry['counts'][row['action']] = entry['counts'].get(row['action'], 0) + row['count']
+        entry['declined'] += row['declined']
+    summary = []
+    for month in sorted(months):
+        entry = months[month]
+        entry['net'] = entry['inflow'] - entry['outflow']
+        for field in ('inflow', 'outflow', 'net'):
+            entry[field] = '{:f}'.format(entry[field].quantize(CENT))
+        summary.append(entry)
+    return summary
+
+
+def rollup_rows(start=None, end=None, **filters):
+    """Agrégats par mois et type d'action entre ``start`` et ``end`` (mois inclus), sommés sur les comptes filtrés."""
+    rollups = MonthlyRollup.objects.filter(**filters)
+    if start is not None:
+        rollups = rollups.filter(month__gte=start)
+    if end is not None:
+        rollups = rollups.filter(month__lte=end)
+    return (
+        rollups.values('month', 'action')
+        .annotate(count=Sum('count'), total=Sum('total'), declined=Sum('declined'))
+        .order_by('month', 'action')
+    )
+
+
+def account_summary(account_id, start=None, end=None):
+    return summarize(rollup_rows(start, end, account_id=account_id))
+
+
+def bank_summary(start=None, end=None):
+    return summarize(rollup_rows(start, end))
+
+
+def balances_by_type():
+    """
+    Soldes cumulés par type de compte. Lus sur la table des comptes (une ligne
+    par compte, pas par log) : le solde n'est pas constitué que de logs.
+    """
+    rows = Account.objects.values('type_compte').annotate(
+        accounts=Count('id'), solde=Sum('solde'), debit_en_attente=Sum('debit_en_attente'),
+    ).order_by('type_compte')
+    return [
+        {'type_compte': row['type_compte'], 'accounts': row['accounts'],
+         'solde': '{:f}'.format(row['solde'].quantize(CENT)),
+         'debit_en_attente': '{:f}'.format(row['debit_en_attente'].quantize(CENT))}
+        for row in rows
+    ]
@@ -0,0 +1,128 @@
+"""
+Lectures sur réplicas, écritures sur la base principale.
+
+Les lectures ne partent vers un réplica (``settings.DATABASE_REPLICAS``) que
+dans une requête HTTP de lecture (GET, HEAD, OPTIONS) autorisée par
+``ReplicaRoutingMiddleware`` ou dans un bloc ``replica_reads()``. Toute
+écriture épingle ensuite la base principale jusqu'à la fin de la requête,
+et le client qui vient d'écrire lit la base principale pendant
+``REPLICA_PIN_SECONDS`` secondes (retard de réplication). Hors requête
+(commandes, tâches de fond), tout passe par la base principale.
+
+Configuration::
+
+    DATABASES = {
+        'default': {...},
+        'replica': {..., 'TEST': {'MIRROR': 'default'}},
+    }
+    DATABASE_REPLICAS = ['replica']
+"""
+import hashlib
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+# True : lectures autorisées sur un réplica ; False : base principale (défaut, et après une écriture)
+_replica_allowed = ContextVar('apiargent_replica_allowed', default=False)
+# Vrai dès la première écriture de la requête
+_wrote = ContextVar('apiargent_wrote', default=False)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def pin_primary():
+    """Envoie toutes les lectures suivantes de la requête (ou du bloc) vers la base principale."""
+    _replica_allowed.set(False)
+    _wrote.set(True)
+
+
+@contextmanager
+def replica_reads(allowed=True):
+    """Autorise (ou interdit) les lectures sur réplica dans le bloc, hors requête HTTP (exports, rapports)."""
+    allowed_token = _replica_allowed.set(allowed)
+    wrote_token = _wrote.set(False)
+    try:
+        yield
+    finally:
+        _replica_allowed.reset(allowed_token)
+        _wrote.reset(wrote_token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        aliases = replicas()
+        if not aliases or not _replica_allowed.get():
+            return DEFAULT_DB_ALIAS
+        return random.choice(aliases)
+
+    def db_for_write(self, model, **hints):
+        pin_primary()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Les réplicas contiennent les mêmes données que la base principale
+        databases = {DEFAULT_DB_ALIAS, *replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+def pin_key(request):
+    """Clé du cache épinglant la base principale pour le client (token) qui vient d'écrire."""
+    credentials = request.META.get('HTTP_AUTHORIZATION')
+    if not credentials:
+        return None
+    return 'replica_pin_' + hashlib.md5(credentials.encode(), usedforsecurity=False).hexdigest()
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Autorise les lectures sur réplica pour les requêtes GET, HEAD et OPTIONS
+    d'un client qui n'a pas écrit récemment ; après une requête qui a écrit,
+    le même client lit la base principale pendant ``REPLICA_PIN_SECONDS``.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        with replica_reads(self.allowed(request)):
+            response = self.get_response(request)
+            self.finish(request)
+        return response
+
+    async def __acall__(self, request):
+        # Les vues synchrones et l'ORM asynchrone (threads) héritent du contexte de la requête
+        with replica_reads(self.allowed(request)):
+            response = await self.get_response(request)
+            self.finish(request)
+        return response
+
+    def allowed(self, request):
+        if not replicas() or request.method not in SAFE_METHODS:
+            return False
+        key = pin_key(request)
+        return key is None or cache.get(key) is None
+
+    def finish(self, request):
+        if _wrote.get() and replicas():
+            key = pin_key(request)
+            if key is not None:
+                cache.set(key, 1, getattr(settings, 'REPLICA_PIN_SECONDS', 5))
@@ -0,0 +1,103 @@
+"""
+Recherche dans les logs courants par filtres combinables.
+
+Chaque filtre s'appuie sur un index des logs (voir ``Log.Meta.indexes``) :
+compte, compte cible, action et montant exact sont suivis de (date_action, id)
+dans leur index, ce qui sert aussi l'ordre de la pagination par curseur ; la
+période et les bornes de montant sont des intervalles sur ces mêmes index, et
+le libellé est cherché par préfixe sur son index.
+
+Le préfixe suit la collation de la base : sous MySQL/MariaDB, ``LIKE 'x%'``
+est un parcours d'intervalle de l'index (insensible à la casse et aux
+accents avec la collation par défaut) ; sous SQLite, où ``LIKE`` n'utilise
+pas l'index, il devient un intervalle explicite dans l'ordre des points de
+code, celui de la collation BINARY.
+"""
+from decimal import Decimal, InvalidOperation
+
+from django.db import connection
+
+from .models import CREDIT_ACTIONS, DEBIT_ACTIONS, Log
+from .statements import parse_bound
+
+ACTIONS = CREDIT_ACTIONS + DEBIT_ACTIONS
+
+
+def parse_amount(value):
+    if not value:
+        return None
+    try:
+        amount = Decimal(value)
+    except InvalidOperation:
+        raise ValueError(value)
+    if not amount.is_finite():
+        raise ValueError(value)
+    return amount
+
+
+def parse_id(value):
+    return int(value) if value else None
+
+
+def prefix_range(prefix):
+    """
+    Bornes [prefix, suivant) des chaînes commençant par ``prefix`` (dernier
+    caractère incrémenté). Valable seulement pour un ordre par point de code
+    (SQLite) : dans une collation Unicode, le caractère suivant peut être
+    classé avant le préfixe.
+    """
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def search_options(params):
+    """
+    Filtres d'une recherche à partir des paramètres de requête (?account=,
+    ?cible=, ?action=depot,retrait, ?amount=, ?min_amount=, ?max_amount=,
+    ?from=, ?to=, ?libele=). Lève ValueError si un paramètre est invalide.
+    """
+    actions = None
+    if params.get('action'):
+        actions = set(params['action'].split(','))
+        if not actions <= set(ACTIONS):
+            raise ValueError(params['action'])
+    return {
+        'account': parse_id(params.get('account')),
+        'cible': parse_id(params.get('cible')),
+        'actions': actions,
+        'amount': parse_amount(params.get('amount')),
+        'min_amount': parse_amount(params.get('min_amount')),
+        'max_amount': parse_amount(params.get('max_amount')),
+        'start': parse_bound(params.get('from')),
+        'end': parse_bound(params.get('to'), end=True),
+        'libele': params.get('libele') or None,
+    }
+
+
+def search_logs(account=None, cible=None, actions=None, amount=None, min_amount=None, max_amount=None,
+                start=None, end=None, libele=None):
+    """Logs courants correspondant à tous les filtres donnés (sans ordre : la pagination l'impose)."""
+    logs = Log.objects.all()
+    if account is not None:
+        logs = logs.filter(account_id=account)
+    if cible is not None:
+        logs = logs.filter(cible_id=cible)
+    if actions:
+        logs = logs.filter(action__in=actions)
+    if amount is not None:
+        logs = logs.filter(montant=amount)
+    if min_amount is not None:
+        logs = logs.filter(montant__gte=min_amount)
+    if max_amount is not None:
+        logs = logs.filter(montant__lte=max_amount)
+    if start is not None:
+        logs = logs.filter(date_action__gte=start)
+    if end is not None:
+        logs = logs.filter(date_action__lt=end)
+    if libele:
+        if connection.vendor == 'sqlite':
+            low, high = prefix_range(libele)
+            logs = logs.filter(libele__gte=low, libele__lt=high)
+        else:
+            # LIKE 'x%' dans la collation de la colonne (startswith produirait LIKE BINARY)
+            logs = logs.filter(libele__istartswith=libele)
+    return logs
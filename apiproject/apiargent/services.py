@@ -0,0 +1,420 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Case, DecimalField, F, Sum, Value, When
+
+from .events import publish_created, publish_settled
+from .models import DEBIT_ACTIONS, Account, Log
+from .response_cache import PENDING_ACTIONS, invalidate
+from .rollups import record_rollups
+
+# Résultats possibles du traitement d'un log en attente
+VALIDATED = 'validated'
+DECLINED = 'declined'
+INSUFFICIENT_FUNDS = 'insufficient_funds'
+INVALID_ACTION = 'invalid_action'
+NOT_FOUND = 'not_found'
+# Résultats possibles d'une opération d'un lot (submit_batch)
+CREATED = 'created'
+FORBIDDEN = 'forbidden'
+INVALID_AMOUNT = 'invalid_amount'
+INVALID_OPERATION = 'invalid_operation'
+
+# Types d'opération d'un lot et action du log créé
+BATCH_ACTIONS = {'deposit': 'depot', 'withdraw': 'retrait', 'transfer': 'virement_envoye'}
+# Nombre de logs insérés par requête INSERT
+BULK_CREATE_BATCH_SIZE = 1000
+# Montant maximal d'un log (DecimalField(max_digits=10, decimal_places=2))
+MAX_AMOUNT = Decimal('99999999.99')
+CENT = Decimal('0.01')
+
+# Nombre de comptes mis à jour par requête UPDATE groupée
+UPDATE_BATCH_SIZE = 500
+
+
+class InsufficientFunds(Exception):
+    pass
+
+
+def lock_accounts(account_ids):
+    """
+    Verrouille (SELECT ... FOR UPDATE) les comptes demandés en une seule requête.
+
+    Les lignes sont toujours verrouillées dans l'ordre croissant des id pour que
+    deux transactions concurrentes ne puissent pas s'interbloquer.
+    Doit être appelé dans un bloc ``transaction.atomic()``.
+    """
+    accounts = Account.objects.select_for_update().filter(pk__in=set(account_ids)).order_by('id')
+    return {account.pk: account for account in accounts}
+
+
+def create_transfer(source_id, target_id, amount, libele=None):
+    """
+    Enregistre un virement (log envoyé + log reçu) en une seule transaction.
+
+    Le montant est réservé sur le compte source (``debit_en_attente``) jusqu'à
+    la validation. Lève ``Account.DoesNotExist`` si l'un des comptes est
+    introuvable et ``InsufficientFunds`` si le solde disponible est insuffisant.
+    """
+    with transaction.atomic():
+        accounts = lock_accounts([source_id, target_id])
+        source_account = accounts.get(source_id)
+        target_account = accounts.get(target_id)
+        if source_account is None or target_account is None:
+            raise Account.DoesNotExist
+
+        if source_account.solde_disponible < amount:
+            raise InsufficientFunds
+        # Réservation sur le compte source et nouvelle version des deux comptes en un seul UPDATE
+        Account.objects.filter(pk__in=[source_id, target_id]).update(
+            debit_en_attente=F('debit_en_attente') + _delta_case({source_id: amount}),
+            version=F('version') + 1,
+        )
+
+        # bulk_create n'envoie pas de signal post_save
+        invalidate(PENDING_ACTIONS)
+        sent = Log(account=source_account, action='virement_envoye', montant=amount, cible=target_account, libele=libele)
+        insert_logs([sent])
+        # Le log reçu référence le log envoyé : inséré une fois l'id de celui-ci connu
+        received = Log(account=target_account, action='virement_recu', montant=amount, cible=source_account,
+                       libele=libele, origine=sent)
+        insert_logs([received])
+        logs = [sent, received]
+        publish_created(logs)
+        return logs
+
+
+def create_withdrawal(account_id, amount):
+    """
+    Enregistre une demande de retrait en réservant le montant sur le solde disponible.
+
+    La réservation est un UPDATE conditionnel : deux retraits concurrents ne
+    peuvent pas dépasser le solde disponible, sans verrou ni SUM sur les logs.
+    """
+    with transaction.atomic():
+        reserved = Account.objects.filter(
+            pk=account_id,
+            solde__gte=F('debit_en_attente') + amount,
+        ).update(debit_en_attente=F('debit_en_attente') + amount, version=F('version') + 1)
+        if not reserved:
+            raise InsufficientFunds
+        log = Log.objects.create(account_id=account_id, action='retrait', montant=amount)
+        publish_created([log])
+        return log
+
+
+def create_deposit(account_id, amount):
+    """Enregistre une demande de dépôt (le solde change à la validation)."""
+    with transaction.atomic():
+        touch_accounts([account_id])
+        log = Log.objects.create(account_id=account_id, action='depot', montant=amount)
+        publish_created([log])
+        return log
+
+
+def parse_operation(item):
+    """
+    Opération d'un lot normalisée (action, account_id, amount,
+    target_account_id, libele). Lève ValueError avec le résultat à renvoyer
+    si l'opération est invalide.
+    """
+    if not isinstance(item, dict) or item.get('action') not in BATCH_ACTIONS:
+        raise ValueError(INVALID_OPERATION)
+    try:
+        operation = {
+            'action': item['action'],
+            'account_id': int(item['account_id']),
+            'target_account_id': int(item['target_account_id']) if item['action'] == 'transfer' else None,
+            'libele': item.get('libele'),
+        }
+    except (KeyError, TypeError, ValueError):
+        raise ValueError(INVALID_OPERATION)
+    if operation['libele'] is not None and (not isinstance(operation['libele'], str) or len(operation['libele']) > 255):
+        raise ValueError(INVALID_OPERATION)
+    try:
+        amount = Decimal(str(item.get('amount')))
+    except ArithmeticError:
+        raise ValueError(INVALID_AMOUNT)
+    # Montant positif, au centime près et représentable par Log.montant
+    if not amount.is_finite() or not 0 < amount <= MAX_AMOUNT or amount != amount.quantize(CENT):
+        raise ValueError(INVALID_AMOUNT)
+    operation['amount'] = amount
+    return operation
+
+
+def submit_batch(items, owner_id=None):
+    """
+    Enregistre un lot de dépôts, retraits et virements en une transaction.
+
+    Les opérations sont validées, puis tous les comptes référencés sont
+    verrouillés en une seule requête ; les réservations sont contrôlées en
+    mémoire dans l'ordre du lot, les débits en attente mis à jour par des
+    UPDATE groupés et les logs écrits avec ``bulk_create``. Une opération
+    refusée n'empêche pas les autres d'être enregistrées. Avec ``owner_id``,
+    seules les opérations au départ des comptes de cet utilisateur sont
+    acceptées. Retourne, dans l'ordre du lot, une liste de (résultat, log ou None).
+    """
+    results = [None] * len(items)
+    operations = {}
+    for index, item in enumerate(items):
+        try:
+            operations[index] = parse_operation(item)
+        except ValueError as e:
+            results[index] = (e.args[0], None)
+
+    with transaction.atomic():
+        account_ids = {operation['account_id'] for operation in operations.values()}
+        account_ids.update(operation['target_account_id'] for operation in operations.values()
+                           if operation['target_account_id'] is not None)
+        accounts = lock_accounts(account_ids)
+        available = {pk: account.solde_disponible for pk, account in accounts.items()}
+        pending_deltas = defaultdict(Decimal)
+        logs = []
+        received = []
+
+        for index, operation in operations.items():
+            account = accounts.get(operation['account_id'])
+            target = accounts.get(operation['target_account_id'])
+            if account is None or (operation['action'] == 'transfer' and target is None):
+                results[index] = (NOT_FOUND, None)
+                continue
+            if owner_id is not None and account.user_id != owner_id:
+                results[index] = (FORBIDDEN, None)
+                continue
+
+            amount = operation['amount']
+            action = BATCH_ACTIONS[operation['action']]
+            if action in DEBIT_ACTIONS:
+                if available[account.pk] < amount:
+                    results[index] = (INSUFFICIENT_FUNDS, None)
+                    continue
+                available[account.pk] -= amount
+                pending_deltas[account.pk] += amount
+
+            log = Log(account=account, action=action, montant=amount, cible=target, libele=operation['libele'])
+            logs.append(log)
+            results[index] = (CREATED, log)
+            if target is not None:
+                received.append(Log(account=target, action='virement_recu', montant=amount, cible=account,
+                                    libele=operation['libele'], origine=log))
+
+        if logs:
+            apply_balance_deltas({}, pending_deltas, touched={log.account_id for log in logs + received})
+            insert_logs(logs)
+            # Les logs reçus référencent les logs envoyés : insérés une fois leurs ids connus
+            insert_logs(received)
+            logs += received
+            invalidate(PENDING_ACTIONS)
+            publish_created(logs)
+    return results
+
+
+def insert_logs(logs):
+    """
+    Insère les logs et renseigne leurs clés primaires. ``bulk_create`` ne
+    retourne les ids qu'avec ``INSERT ... RETURNING`` (SQLite, PostgreSQL,
+    MariaDB 10.5+) ; ailleurs (MySQL) chaque log est inséré par sa propre
+    requête, seule façon sûre de connaître son id. Retourne ``logs``.
+    """
+    if connection.features.can_return_rows_from_bulk_insert:
+        Log.objects.bulk_create(logs, batch_size=BULK_CREATE_BATCH_SIZE)
+    else:
+        for log in logs:
+            log.save(force_insert=True)
+    return logs
+
+
+def touch_accounts(account_ids):
+    """Change la version des comptes dont une donnée lisible (compte ou logs) a été modifiée."""
+    Account.objects.filter(pk__in=set(account_ids)).update(version=F('version') + 1)
+
+
+def _delta_case(deltas):
+    return Case(
+        *[When(pk=pk, then=Value(delta)) for pk, delta in deltas.items()],
+        default=Value(Decimal('0')),
+        output_field=DecimalField(max_digits=10, decimal_places=2),
+    )
+
+
+def apply_balance_deltas(deltas, pending_deltas=None, touched=()):
+    """
+    Applique des variations {account_id: delta} du solde et des débits en
+    attente avec des UPDATE groupés (un CASE par paquet de comptes) calculés
+    par la base à partir de F('solde') / F('debit_en_attente').
+
+    La version des comptes modifiés et des comptes ``touched`` (logs changés
+    sans mouvement de solde) est incrémentée dans les mêmes requêtes.
+    """
+    pending_deltas = pending_deltas or {}
+    account_ids = sorted(
+        {pk for pk in set(deltas) | set(pending_deltas) if deltas.get(pk) or pending_deltas.get(pk)} | set(touched)
+    )
+    for start in range(0, len(account_ids), UPDATE_BATCH_SIZE):
+        batch = account_ids[start:start + UPDATE_BATCH_SIZE]
+        changes = {'version': F('version') + 1}
+        batch_deltas = {pk: deltas[pk] for pk in batch if deltas.get(pk)}
+        if batch_deltas:
+            changes['solde'] = F('solde') + _delta_case(batch_deltas)
+        batch_pending = {pk: pending_deltas[pk] for pk in batch if pending_deltas.get(pk)}
+        if batch_pending:
+            changes['debit_en_attente'] = F('debit_en_attente') + _delta_case(batch_pending)
+        Account.objects.filter(pk__in=batch).update(**changes)
+
+
+def settle_counterparts(transfers, refuse=False):
+    """
+    Règle les logs ``virement_recu`` encore en attente créés avec les
+    virements envoyés ``transfers`` (champ ``origine``). Retourne les logs
+    reçus modifiés (à enregistrer par l'appelant).
+    """
+    if not transfers:
+        return []
+    settled = list(
+        Log.objects.select_for_update()
+        .filter(origine__in=[transfer.pk for transfer in transfers], date_valeur__isnull=True)
+        .order_by('id')
+    )
+    for log in settled:
+        log.date_valeur = log.date_action
+        log.refuse = refuse
+    return settled
+
+
+def settle_logs(queryset, approve=True):
+    """
+    Valide (``approve=True``) ou refuse les logs en attente du queryset en une transaction.
+
+    Les logs et les comptes concernés sont verrouillés une seule fois, les
+    mouvements sont appliqués dans l'ordre chronologique sur des soldes en
+    mémoire, puis écrits avec des UPDATE groupés et un ``bulk_update``.
+    Le log ``virement_recu`` d'un virement est réglé avec le log envoyé, et
+    jamais seul : il est ignoré s'il figure dans le queryset. Un virement dont
+    le compte cible a été supprimé ne peut pas être validé : il est refusé
+    (montant réservé libéré) avec le résultat ``invalid_action``.
+    Les agrégats mensuels (``rollups``) sont mis à jour dans la même transaction.
+    Retourne un dictionnaire {log_id: résultat}.
+    """
+    outcomes = {}
+    with transaction.atomic():
+        logs = list(
+            queryset.select_for_update()
+            .filter(date_valeur__isnull=True)
+            .exclude(action='virement_recu')
+            .order_by('date_action', 'id')
+        )
+        if not logs:
+            return outcomes
+
+        settled = []
+        pending_deltas = defaultdict(Decimal)
+        if not approve:
+            for log in logs:
+                log.date_valeur = log.date_action
+                log.refuse = True
+                settled.append(log)
+                outcomes[log.pk] = DECLINED
+                # Le refus libère le montant réservé
+                if log.action in DEBIT_ACTIONS:
+                    pending_deltas[log.account_id] -= log.montant
+            transfers = [log for log in settled if log.action == 'virement_envoye']
+            settled += settle_counterparts(transfers, refuse=True)
+            apply_balance_deltas({}, pending_deltas, touched={log.account_id for log in settled})
+            Log.objects.bulk_update(settled, ['date_valeur', 'refuse'], batch_size=1000)
+            record_rollups(settled)
+            invalidate(PENDING_ACTIONS)
+            publish_settled(outcomes)
+            return outcomes
+
+        account_ids = {log.account_id for log in logs}
+        account_ids.update(log.cible_id for log in logs if log.action == 'virement_envoye' and log.cible_id)
+        balances = {pk: account.solde for pk, account in lock_accounts(account_ids).items()}
+        deltas = defaultdict(Decimal)
+        refused = []
+
+        for log in logs:
+            amount = log.montant
+            if log.action == 'depot':
+                deltas[log.account_id] += amount
+                balances[log.account_id] += amount
+            elif log.action == 'retrait':
+                if balances[log.account_id] < amount:
+                    outcomes[log.pk] = INSUFFICIENT_FUNDS
+                    continue
+                deltas[log.account_id] -= amount
+                pending_deltas[log.account_id] -= amount
+                balances[log.account_id] -= amount
+            elif log.action == 'virement_envoye' and log.cible_id in balances:
+                if balances[log.account_id] < amount:
+                    outcomes[log.pk] = INSUFFICIENT_FUNDS
+                    continue
+                deltas[log.account_id] -= amount
+                pending_deltas[log.account_id] -= amount
+                balances[log.account_id] -= amount
+                deltas[log.cible_id] += amount
+                balances[log.cible_id] += amount
+            else:
+                # Virement sans compte cible (supprimé) : refusé, le montant réservé est libéré
+                outcomes[log.pk] = INVALID_ACTION
+                log.date_valeur = log.date_action
+                log.refuse = True
+                if log.action in DEBIT_ACTIONS:
+                    pending_deltas[log.account_id] -= amount
+                refused.append(log)
+                continue
+
+            log.date_valeur = log.date_action
+            settled.append(log)
+            outcomes[log.pk] = VALIDATED
+
+        settled += settle_counterparts([log for log in settled if log.action == 'virement_envoye'])
+        settled += refused + settle_counterparts([log for log in refused if log.action == 'virement_envoye'], refuse=True)
+        apply_balance_deltas(deltas, pending_deltas, touched={log.account_id for log in settled})
+        Log.objects.bulk_update(settled, ['date_valeur', 'refuse'], batch_size=1000)
+        record_rollups(settled)
+        if settled:
+            invalidate(PENDING_ACTIONS)
+            publish_settled({**outcomes, **{log.pk: DECLINED for log in refused}})
+    return outcomes
+
+
+def reconcile_pending_debits(chunk_size=1000, fix=True):
+    """
+    Recalcule ``debit_en_attente`` à partir des logs en attente, par paquets de comptes.
+
+    Retourne la liste des écarts trouvés (account_id, valeur stockée, valeur attendue) ;
+    avec ``fix=True`` chaque paquet est corrigé dans sa propre transaction.
+    """
+    mismatches = []
+    last_id = 0
+    while True:
+        with transaction.atomic():
+            accounts = list(
+                Account.objects.select_for_update()
+                .filter(pk__gt=last_id)
+                .order_by('id')
+                .values_list('id', 'debit_en_attente')[:chunk_size]
+            )
+            if not accounts:
+                return mismatches
+            last_id = accounts[-1][0]
+
+            expected = dict(
+                Log.objects.filter(
+                    account_id__in=[pk for pk, _ in accounts],
+                    date_valeur__isnull=True,
+                    action__in=DEBIT_ACTIONS,
+                )
+                .values('account_id')
+                .annotate(total=Sum('montant'))
+                .values_list('account_id', 'total')
+            )
+            corrections = {}
+            for pk, stored in accounts:
+                wanted = expected.get(pk) or Decimal('0')
+                if stored != wanted:
+                    mismatches.append((pk, stored, wanted))
+                    corrections[pk] = wanted - stored
+            if fix and corrections:
+                apply_balance_deltas({}, corrections)
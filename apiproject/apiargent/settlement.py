@@ -0,0 +1,151 @@
+"""
+File des règlements et worker de validation en arrière-plan.
+
+Les vues de validation et de refus enregistrent une demande (``SettlementJob``)
+et répondent aussitôt ; la commande ``settlement_worker`` prend les demandes
+en attente par paquets avec ``SELECT ... FOR UPDATE SKIP LOCKED`` et les
+règle avec ``settle_logs`` (une transaction par paquet). Plusieurs workers
+peuvent tourner en parallèle : chacun saute les lignes verrouillées par les
+autres. Le worker valide aussi, sans demande, les logs en attente qui
+satisfont une règle de ``settings.AUTO_APPROVAL_RULES``.
+"""
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .metrics import registry
+from .models import Log, SettlementJob
+from .services import NOT_FOUND, VALIDATED, settle_logs
+
+PENDING = 'pending'
+DONE = 'done'
+
+# Demandes (ou logs validés automatiquement) traitées par transaction
+SETTLEMENT_BATCH_SIZE = getattr(settings, 'SETTLEMENT_BATCH_SIZE', 500)
+# Conservation des demandes traitées (consultables par GET api/settlement-jobs/<id>/)
+SETTLEMENT_JOB_RETENTION = timedelta(days=getattr(settings, 'SETTLEMENT_JOB_RETENTION_DAYS', 7))
+
+SETTLEMENTS = registry.counter(
+    'apiargent_settlements_total', "Logs réglés par le worker, par origine (demande ou règle automatique) et résultat")
+
+
+def queue_enabled():
+    """Vrai si la validation HTTP passe par la file (réglage ``SETTLEMENT_QUEUE``)."""
+    return getattr(settings, 'SETTLEMENT_QUEUE', True)
+
+
+def enqueue(logs, approve, requested_by=None):
+    """
+    Crée une demande de validation (ou de refus) par log encore en attente du
+    queryset ``logs`` (hors ``virement_recu``, réglés avec leur virement
+    envoyé). Retourne les ids des logs mis en file.
+    """
+    log_ids = list(
+        logs.filter(date_valeur__isnull=True).exclude(action='virement_recu').order_by('id').values_list('id', flat=True)
+    )
+    SettlementJob.objects.bulk_create(
+        [SettlementJob(log_id=pk, approve=approve, requested_by=requested_by) for pk in log_ids], batch_size=1000)
+    return log_ids
+
+
+def enqueue_one(log_id, approve, requested_by=None):
+    """Demande pour un seul log ; None si le log n'existe pas, est déjà réglé ou est un ``virement_recu``."""
+    if not Log.objects.filter(pk=log_id, date_valeur__isnull=True).exclude(action='virement_recu').exists():
+        return None
+    return SettlementJob.objects.create(log_id=log_id, approve=approve, requested_by=requested_by)
+
+
+def process_jobs(batch_size=SETTLEMENT_BATCH_SIZE):
+    """
+    Prend et règle un paquet de demandes en attente. Seule la première demande
+    d'un log (par ordre d'arrivée) est appliquée, les suivantes reçoivent
+    ``not_found`` comme si elles arrivaient après son règlement : le résultat
+    ne dépend pas du découpage en paquets. Les refus sont ensuite appliqués
+    avant les validations (ils libèrent des montants réservés).
+    Retourne le nombre de demandes traitées.
+    """
+    with transaction.atomic():
+        jobs = list(
+            SettlementJob.objects.select_for_update(skip_locked=True)
+            .filter(status=PENDING)
+            .order_by('id')[:batch_size]
+        )
+        if not jobs:
+            return 0
+        first_jobs = {}
+        for job in jobs:
+            first_jobs.setdefault(job.log_id, job)
+        outcomes = {}
+        for approve in (False, True):
+            log_ids = [log_id for log_id, job in first_jobs.items() if job.approve == approve]
+            if log_ids:
+                outcomes.update(settle_logs(Log.objects.filter(pk__in=log_ids), approve=approve))
+        now = timezone.now()
+        for job in jobs:
+            job.outcome = outcomes.get(job.log_id, NOT_FOUND) if first_jobs[job.log_id] is job else NOT_FOUND
+            job.status = DONE
+            job.date_traitement = now
+        SettlementJob.objects.bulk_update(jobs, ['status', 'outcome', 'date_traitement'])
+    for job in jobs:
+        registry.inc(SETTLEMENTS, (('source', 'job'), ('outcome', job.outcome)))
+    return len(jobs)
+
+
+def auto_approval_condition():
+    """
+    Filtre des logs validés sans intervention d'un banquier, à partir de
+    ``settings.AUTO_APPROVAL_RULES`` : [{"action": "depot", "max_amount": "100"}, ...].
+    None si aucune règle n'est configurée.
+    """
+    condition = None
+    for rule in getattr(settings, 'AUTO_APPROVAL_RULES', []):
+        try:
+            rule_condition = Q(action=rule['action'])
+            if rule.get('max_amount') is not None:
+                rule_condition &= Q(montant__lte=Decimal(str(rule['max_amount'])))
+        except (KeyError, TypeError, InvalidOperation):
+            raise ImproperlyConfigured(f"Règle de validation automatique invalide : {rule!r}")
+        condition = rule_condition if condition is None else condition | rule_condition
+    return condition
+
+
+def auto_approve(batch_size=SETTLEMENT_BATCH_SIZE, after=None):
+    """
+    Valide un paquet de logs en attente couverts par une règle automatique, en
+    parcourant la file par (date_action, id) à partir de ``after``. Un log
+    refusé faute de fonds reste en attente et n'est revu qu'au tour suivant.
+    Retourne (logs validés, position à reprendre ou None en fin de file).
+    """
+    condition = auto_approval_condition()
+    if condition is None:
+        return 0, None
+    with transaction.atomic():
+        logs = (
+            Log.objects.select_for_update(skip_locked=True)
+            .filter(condition, date_valeur__isnull=True)
+            .exclude(action='virement_recu')
+            .order_by('date_action', 'id')
+        )
+        if after is not None:
+            date_action, pk = after
+            logs = logs.filter(Q(date_action__gt=date_action) | Q(date_action=date_action, id__gt=pk))
+        rows = list(logs.values_list('id', 'date_action')[:batch_size])
+        if not rows:
+            return 0, None
+        outcomes = settle_logs(Log.objects.filter(pk__in=[pk for pk, _ in rows]), approve=True)
+    for outcome in outcomes.values():
+        registry.inc(SETTLEMENTS, (('source', 'rule'), ('outcome', outcome)))
+    validated = sum(1 for outcome in outcomes.values() if outcome == VALIDATED)
+    last_id, last_date = rows[-1]
+    return validated, ((last_date, last_id) if len(rows) == batch_size else None)
+
+
+def purge_jobs(retention=SETTLEMENT_JOB_RETENTION):
+    """Supprime les demandes traitées depuis plus de ``retention`` ; retourne leur nombre."""
+    deleted, _ = SettlementJob.objects.filter(status=DONE, date_traitement__lt=timezone.now() - retention).delete()
+    return deleted
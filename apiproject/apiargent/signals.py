@@ -0,0 +1,23 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .middleware import install_query_recorder
+from .models import Account, Log
+from .response_cache import CREATED_ACCOUNTS, PENDING_ACTIONS, invalidate
+
+# Les écritures groupées (bulk_create, bulk_update, update) n'envoient pas ces
+# signaux : les services qui les utilisent invalident explicitement le cache.
+
+
+@receiver([post_save, post_delete], sender=Log, dispatch_uid='apiargent_log_response_cache')
+def log_changed(sender, **kwargs):
+    invalidate(PENDING_ACTIONS)
+
+
+@receiver([post_save, post_delete], sender=Account, dispatch_uid='apiargent_account_response_cache')
+def account_changed(sender, **kwargs):
+    invalidate(CREATED_ACCOUNTS)
+
+
+connection_created.connect(install_query_recorder, dispatch_uid='apiargent_query_recorder')
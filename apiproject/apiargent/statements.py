@@ -0,0 +1,150 @@
+import heapq
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db.models import Case, F, Sum, Value, When
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework import serializers
+
+from .archive import get_checkpoint
+from .fields import AmountField
+from .models import CREDIT_ACTIONS, DEBIT_ACTIONS, ArchivedLog, Log
+from .streaming import CHUNK_SIZE, iter_chunks
+
+# Colonnes d'un relevé (en-tête CSV et clés NDJSON)
+STATEMENT_FIELDS = ('id', 'date_action', 'date_valeur', 'action', 'montant', 'cible', 'libele', 'statut', 'solde')
+# Champs de date utilisables pour borner et ordonner un relevé
+DATE_FIELDS = ('date_action', 'date_valeur')
+ACTIONS = CREDIT_ACTIONS + DEBIT_ACTIONS
+
+PENDING = 'en_attente'
+VALIDATED = 'valide'
+DECLINED = 'refuse'
+
+CENT = Decimal('0.01')
+
+
+def parse_bound(value, end=False):
+    """Date (jour entier) ou date-heure ISO 8601 ; une date de fin inclut toute la journée."""
+    if not value:
+        return None
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(value)
+        moment = datetime.combine(day + timedelta(days=1) if end else day, time.min)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def statement_options(params):
+    """
+    Options d'un relevé à partir des paramètres de requête (?field=, ?from=,
+    ?to=, ?action=depot,retrait). Lève ValueError si un paramètre est invalide.
+    """
+    field = params.get('field') or 'date_action'
+    if field not in DATE_FIELDS:
+        raise ValueError(field)
+    actions = None
+    if params.get('action'):
+        actions = set(params['action'].split(','))
+        if not actions <= set(ACTIONS):
+            raise ValueError(params['action'])
+    return {
+        'field': field,
+        'start': parse_bound(params.get('from')),
+        'end': parse_bound(params.get('to'), end=True),
+        'actions': actions,
+    }
+
+
+def applied_effect():
+    """Variation de solde d'un log (crédit positif, débit négatif) pour un agrégat SQL."""
+    return Case(
+        When(action__in=CREDIT_ACTIONS, then=F('montant')),
+        When(action__in=DEBIT_ACTIONS, then=-F('montant')),
+        default=Value(Decimal('0')),
+        # Même stockage que les montants des logs (centimes au format compact)
+        output_field=AmountField(max_digits=14, decimal_places=2),
+    )
+
+
+def opening_balance(account, field='date_action', start=None):
+    """
+    Solde avant le premier log du relevé : solde actuel du compte moins les
+    mouvements validés depuis ``start``. Le relevé reste ainsi cohérent avec le
+    solde du compte, même si celui-ci n'a pas été constitué que par des logs.
+    Sans ``start``, le point de contrôle donne le total archivé sans relire l'archive.
+    """
+    checkpoint = get_checkpoint(account)
+    total = Decimal('0')
+    for model in (Log, ArchivedLog):
+        applied = model.objects.filter(account_id=account.pk, date_valeur__isnull=False, refuse=False)
+        if model is ArchivedLog:
+            if checkpoint is None:
+                continue
+            if start is None:
+                total += checkpoint.archived_total
+                continue
+            if start > checkpoint.archived_until:
+                continue
+        if start is not None:
+            applied = applied.filter(**{f'{field}__gte': start})
+        total += applied.aggregate(total=Sum(applied_effect()))['total'] or Decimal('0')
+    return account.solde - total
+
+
+def iter_statement(account, field='date_action', start=None, end=None, actions=None, chunk_size=CHUNK_SIZE):
+    """
+    Logs d'un compte avec le solde courant après chaque mouvement validé.
+
+    L'historique est lu par paquets de ``chunk_size`` lignes avec un filtre
+    « après la dernière ligne lue » sur (``field``, id), appuyé sur les index
+    des logs : la mémoire utilisée ne dépend pas de la longueur du relevé,
+    sur MySQL comme ailleurs (sans curseur serveur). Les logs archivés sont
+    fusionnés avec les logs courants. Le filtre ``actions`` limite les lignes
+    produites mais tous les mouvements comptent dans le solde.
+    """
+    balance = opening_balance(account, field, start)
+    date_format = serializers.DateTimeField()
+    checkpoint = get_checkpoint(account)
+
+    sources = []
+    for model in (Log, ArchivedLog):
+        if model is ArchivedLog and (checkpoint is None or (start is not None and start > checkpoint.archived_until)):
+            continue
+        logs = model.objects.filter(account_id=account.pk)
+        if field == 'date_valeur':
+            logs = logs.filter(date_valeur__isnull=False)
+        if start is not None:
+            logs = logs.filter(**{f'{field}__gte': start})
+        if end is not None:
+            logs = logs.filter(**{f'{field}__lt': end})
+        logs = logs.order_by(field, 'id').values_list(
+            'id', 'date_action', 'date_valeur', 'action', 'montant', 'cible', 'libele', 'refuse', named=True)
+        sources.append(iter_chunks(logs, field, chunk_size))
+
+    for row in heapq.merge(*sources, key=lambda row: (getattr(row, field), row.id)):
+        if row.date_valeur is None:
+            statut = PENDING
+        elif row.refuse:
+            statut = DECLINED
+        else:
+            statut = VALIDATED
+            balance += row.montant if row.action in CREDIT_ACTIONS else -row.montant
+        if actions is not None and row.action not in actions:
+            continue
+        yield {
+            'id': row.id,
+            'date_action': date_format.to_representation(row.date_action),
+            'date_valeur': date_format.to_representation(row.date_valeur),
+            'action': row.action,
+            'montant': '{:f}'.format(row.montant),
+            'cible': row.cible,
+            'libele': row.libele,
+            'statut': statut,
+            'solde': '{:f}'.format(balance.quantize(CENT)),
+        }
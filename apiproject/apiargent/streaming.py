@@ -0,0 +1,149 @@
+import csv
+import json
+
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from rest_framework.utils.encoders import JSONEncoder
+
+# Nombre de lignes lues par requête
+CHUNK_SIZE = 2000
+
+
+def _dumps(data):
+    return json.dumps(data, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':'))
+
+
+def iter_json_array(rows):
+    """Produit un tableau JSON élément par élément, sans jamais construire le corps complet."""
+    yield '['
+    first = True
+    for row in rows:
+        if first:
+            first = False
+            yield _dumps(row)
+        else:
+            yield ',' + _dumps(row)
+    yield ']'
+
+
+async def aiter_json_array(rows):
+    """Variante asynchrone de ``iter_json_array`` pour les vues ASGI."""
+    yield '['
+    first = True
+    async for row in rows:
+        if first:
+            first = False
+            yield _dumps(row)
+        else:
+            yield ',' + _dumps(row)
+    yield ']'
+
+
+def iter_ndjson(rows):
+    """Produit un objet JSON par ligne (NDJSON)."""
+    for row in rows:
+        yield _dumps(row) + '\n'
+
+
+async def aiter_ndjson(rows):
+    async for row in rows:
+        yield _dumps(row) + '\n'
+
+
+class _Echo:
+    # Tampon minimal : csv.writer renvoie directement la ligne formatée
+    def write(self, value):
+        return value
+
+
+def iter_csv(rows, fields):
+    """Produit un CSV (en-tête puis une ligne par dictionnaire) sans tampon intermédiaire."""
+    writer = csv.DictWriter(_Echo(), fieldnames=fields)
+    yield writer.writeheader()
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def streaming_response(rows, fmt='json', fields=None):
+    """
+    Réponse HTTP en flux pour un itérable (ou itérable asynchrone) de
+    dictionnaires déjà sérialisés.
+
+    ``fmt`` vaut ``json`` (tableau JSON), ``ndjson`` (un objet par ligne) ou
+    ``csv`` (colonnes ``fields``, itérable synchrone uniquement).
+    """
+    is_async = hasattr(rows, '__aiter__')
+    if fmt == 'csv':
+        response = StreamingHttpResponse(iter_csv(rows, fields), content_type='text/csv; charset=utf-8')
+    elif fmt == 'ndjson':
+        content = aiter_ndjson(rows) if is_async else iter_ndjson(rows)
+        response = StreamingHttpResponse(content, content_type='application/x-ndjson')
+    else:
+        content = aiter_json_array(rows) if is_async else iter_json_array(rows)
+        response = StreamingHttpResponse(content, content_type='application/json')
+    # Empêche nginx de remettre la réponse en tampon
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def _after(queryset, field, position):
+    if position is None:
+        return queryset
+    if field is None:
+        return queryset.filter(id__gt=position[1])
+    moment, pk = position
+    return queryset.filter(Q(**{f'{field}__gt': moment}) | Q(**{field: moment, 'id__gt': pk}))
+
+
+def _position(row, field):
+    return (None if field is None else getattr(row, field), row.id)
+
+
+def iter_chunks(queryset, field, chunk_size, limit=None):
+    """
+    Lignes (instances ou ``values_list(named=True)``) d'un queryset trié sur
+    (``field``, id), ou sur l'id seul si ``field`` vaut None, lues par paquets
+    avec un filtre « après la dernière ligne lue ». Contrairement à
+    ``iterator()``, la mémoire reste bornée sur MySQL, où mysqlclient met tout
+    le résultat en tampon faute de curseur serveur. ``limit`` borne le nombre
+    de lignes produites.
+    """
+    position = None
+    while limit is None or limit > 0:
+        size = chunk_size if limit is None else min(chunk_size, limit)
+        rows = list(_after(queryset, field, position)[:size])
+        yield from rows
+        if len(rows) < size:
+            return
+        if limit is not None:
+            limit -= len(rows)
+        position = _position(rows[-1], field)
+
+
+async def aiter_chunks(queryset, field, chunk_size, limit=None):
+    """Variante asynchrone de ``iter_chunks`` (ORM asynchrone)."""
+    position = None
+    while limit is None or limit > 0:
+        size = chunk_size if limit is None else min(chunk_size, limit)
+        rows = [row async for row in _after(queryset, field, position)[:size]]
+        for row in rows:
+            yield row
+        if len(rows) < size:
+            return
+        if limit is not None:
+            limit -= len(rows)
+        position = _position(rows[-1], field)
+
+
+def serialize_iter(queryset, serializer_class, chunk_size=CHUNK_SIZE, limit=None):
+    """Sérialise ligne par ligne un queryset trié sur l'id, lu par paquets d'ids (voir ``iter_chunks``)."""
+    serializer = serializer_class()
+    for instance in iter_chunks(queryset, None, chunk_size, limit):
+        yield serializer.to_representation(instance)
+
+
+async def serialize_aiter(queryset, serializer_class, chunk_size=CHUNK_SIZE, limit=None):
+    """Variante asynchrone de ``serialize_iter`` (ORM asynchrone)."""
+    serializer = serializer_class()
+    async for instance in aiter_chunks(queryset, None, chunk_size, limit):
+        yield serializer.to_representation(instance)
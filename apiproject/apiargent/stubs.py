@@ -0,0 +1,62 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROLES = ('client', 'banquier', 'administrateur')
+
+
+class StubAuthServer:
+    """
+    Serveur HTTP local qui remplace l'API d'authentification (tests et benchmarks).
+
+    Un token de la forme ``<role>-<id>`` (ex. ``client-12``, ``banquier-1``) est
+    valide et renvoie l'utilisateur correspondant ; tout autre token reçoit un 401.
+    ``delay`` simule une API d'authentification lente.
+    """
+
+    def __init__(self, delay=0):
+        self.calls = 0
+        self.delay = delay
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # En-têtes et corps envoyés en un seul segment (évite l'attente de l'ACK retardé)
+            wbufsize = 65536
+
+            def do_POST(self):
+                stub.calls += 1
+                time.sleep(stub.delay)
+                token = self.headers['Authorization'].split()[1]
+                user = stub.resolve(token)
+                if user is not None:
+                    status, body = 200, json.dumps(user).encode()
+                else:
+                    status, body = 401, b'{}'
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        class Server(ThreadingHTTPServer):
+            # File d'attente suffisante pour les benchmarks de concurrence
+            request_queue_size = 128
+
+        self.server = Server(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/api/validate-token/"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def resolve(self, token):
+        role, _, user_id = token.rpartition('-')
+        if role not in ROLES or not user_id.isdigit():
+            return None
+        return {'id': int(user_id), 'user_id': int(user_id), 'role': role}
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
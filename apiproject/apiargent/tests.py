@@ -1,3 +1,1629 @@
-from django.test import TestCase
+import asyncio
+import importlib
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+from datetime import timedelta
+from io import StringIO
+from decimal import Decimal
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.db import connection, connections, transaction
+from django.db.models import Sum
+from django.test import AsyncClient, SimpleTestCase, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework import exceptions
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APIRequestFactory
+
+from . import idempotency, renderers
+from .Serializer import AccountSerializer, LogSerializer, account_values_serializer, log_values_serializer
+from .authentication import ExternalTokenAuthentication, cache_key_for, cache_user
+from .cache import SQLiteCache
+from .compaction import COMPACT, DECIMAL, ensure_ledger_storage, storage
+from .events import broker, journal
+from .fields import compact_ledger
+from .idempotency import KeyInProgress, run_once
+from .archive import archive_logs
+from .models import DEBIT_ACTIONS, Account, ArchivedLog, BalanceCheckpoint, Log, MonthlyRollup, SettlementJob
+from .response_cache import PENDING_ACTIONS, current_generation, get_or_compute
+from .rollups import month_of
+from .search import search_logs
+from .services import InsufficientFunds, create_transfer, lock_accounts, settle_logs
+from .settlement import auto_approve, process_jobs
+from .statements import iter_statement
+from .streaming import serialize_iter
+from .stubs import StubAuthServer
+
+
+# Fichiers des caches (settings.CACHES) dans un répertoire temporaire : les tests
+# ne vident pas ceux d'une instance lancée sur la même machine
+_test_caches = None
+_test_cache_dir = None
+
+
+def setUpModule():
+    global _test_caches, _test_cache_dir
+    _test_cache_dir = tempfile.mkdtemp(prefix='apiargent_tests_')
+    _test_caches = override_settings(CACHES={
+        alias: {**config, 'LOCATION': os.path.join(_test_cache_dir, f'{alias}.sqlite3')}
+        for alias, config in settings.CACHES.items()
+    })
+    _test_caches.enable()
+
+
+def tearDownModule():
+    _test_caches.disable()
+    shutil.rmtree(_test_cache_dir)
+
+
+def pending_debits(account):
+    """Somme des retraits et virements envoyés en attente du compte (doit égaler ``debit_en_attente``)."""
+    return Log.objects.filter(account=account, action__in=DEBIT_ACTIONS, date_valeur__isnull=True).aggregate(
+        total=Sum('montant'))['total'] or Decimal('0')
+
+
+def authenticated_client(user_id, role='client', token=None):
+    """Client authentifié via le cache de ExternalTokenAuthentication (pas d'appel à l'API externe)."""
+    token = token or f"test-{role}-{user_id}"
+    cache_user(token, {'id': user_id, 'user_id': user_id, 'role': role})
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Token {token}")
+    return client
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.account = Account.objects.create(user_id=1, solde=100)
+        now = timezone.now()
+        logs = [Log(account=self.account, action='depot', montant=i + 1) for i in range(7)]
+        Log.objects.bulk_create(logs)
+        # Deux logs partagent la même date pour vérifier le départage par id
+        for i, log in enumerate(Log.objects.order_by('id')):
+            Log.objects.filter(pk=log.pk).update(date_action=now - timedelta(minutes=i // 2))
+
+    def _walk(self, client, url):
+        seen = []
+        while url:
+            response = client.get(url)
+            self.assertEqual(response.status_code, 200)
+            page = response.json()
+            seen.extend(row['id'] for row in page['results'])
+            url = page['next']
+        return seen
+
+    def test_account_logs_pages_cover_history_once(self):
+        client = authenticated_client(1)
+        ids = self._walk(client, f"/api/{self.account.pk}/logs/?page_size=3")
+        expected = list(Log.objects.filter(account=self.account).order_by('-date_action', '-id').values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+
+    def test_pending_actions_pages_in_queue_order(self):
+        client = authenticated_client(99, role='banquier')
+        ids = self._walk(client, "/api/pending-actions/?page_size=2")
+        expected = list(Log.objects.filter(date_valeur__isnull=True).order_by('date_action', 'id').values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+
+    def test_without_cursor_params_returns_plain_list(self):
+        client = authenticated_client(1)
+        response = client.get(f"/api/{self.account.pk}/logs/2/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 2)
+
+    def test_invalid_cursor(self):
+        client = authenticated_client(1)
+        response = client.get(f"/api/{self.account.pk}/logs/?cursor=nope")
+        self.assertEqual(response.status_code, 404)
+
+
+class AccountStreamingTests(TestCase):
+    def setUp(self):
+        for i in range(5):
+            Account.objects.create(user_id=i, type_compte='epargne' if i % 2 else 'courant')
+
+    def test_stream_json_matches_regular_listing(self):
+        client = APIClient()
+        regular = client.get("/api/")
+        streamed = client.get("/api/?stream=json")
+        self.assertTrue(streamed.streaming)
+        self.assertEqual(json.loads(b''.join(streamed.streaming_content)), json.loads(regular.content))
+
+    def test_stream_ndjson_with_filters_and_paging(self):
+        client = APIClient()
+        first = Account.objects.order_by('id').first()
+        response = client.get(f"/api/?stream=ndjson&type_compte=courant&after_id={first.pk}&limit=5")
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        expected = list(Account.objects.filter(type_compte='courant', id__gt=first.pk).order_by('id').values_list('id', flat=True))
+        self.assertEqual([row['id'] for row in rows], expected)
+
+    def test_stream_reads_keyset_chunks_up_to_the_limit(self):
+        ids = list(Account.objects.order_by('id').values_list('id', flat=True))
+        # Paquets de 2 lignes « id > dernier id lu », arrêtés à la limite
+        with self.assertNumQueries(2):
+            rows = list(serialize_iter(Account.objects.order_by('id'), AccountSerializer, chunk_size=2, limit=3))
+        self.assertEqual([row['id'] for row in rows], ids[:3])
+        with self.assertNumQueries(3):
+            rows = list(serialize_iter(Account.objects.order_by('id'), AccountSerializer, chunk_size=2))
+        self.assertEqual([row['id'] for row in rows], ids)
+
+    def test_invalid_paging_parameters(self):
+        response = APIClient().get("/api/?limit=abc")
+        self.assertEqual(response.status_code, 400)
+
+
+class TransferTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.source = Account.objects.create(user_id=1, solde=100)
+        self.target = Account.objects.create(user_id=2, solde=0)
+
+    def test_transfer_writes_both_logs(self):
+        client = authenticated_client(1)
+        response = client.post(f"/api/{self.source.pk}/virement/", {"target_account_id": self.target.pk, "amount": "30", "libele": "loyer"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Log.objects.get(account=self.source).action, 'virement_envoye')
+        self.assertEqual(Log.objects.get(account=self.target).cible, self.source)
+
+    def test_transfer_insufficient_funds(self):
+        client = authenticated_client(1)
+        response = client.post(f"/api/{self.source.pk}/virement/", {"target_account_id": self.target.pk, "amount": "300"})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Log.objects.exists())
+
+    def test_transfer_unknown_target(self):
+        client = authenticated_client(1)
+        response = client.post(f"/api/{self.source.pk}/virement/", {"target_account_id": "abc", "amount": "10"})
+        self.assertEqual(response.status_code, 404)
+
+    def test_transfer_query_count(self):
+        from .services import create_transfer
+        # SELECT ... FOR UPDATE + réservation + INSERT envoyé + INSERT reçu (+ SAVEPOINT/RELEASE dans le TestCase)
+        with self.assertNumQueries(6):
+            create_transfer(self.source.pk, self.target.pk, Decimal('10'))
+
+    def test_identical_transfers_settle_their_own_received_log(self):
+        first = create_transfer(self.source.pk, self.target.pk, Decimal('10'))
+        second = create_transfer(self.source.pk, self.target.pk, Decimal('10'))
+        self.assertEqual((first[1].origine, second[1].origine), (first[0], second[0]))
+        settle_logs(Log.objects.filter(pk=second[0].pk), approve=False)
+        settle_logs(Log.objects.filter(pk=first[0].pk))
+        received = {log.pk: log for log in Log.objects.filter(action='virement_recu')}
+        self.assertFalse(received[first[1].pk].refuse)
+        self.assertTrue(received[second[1].pk].refuse)
+        self.assertEqual(Account.objects.get(pk=self.target.pk).solde, Decimal('10'))
+
+
+class PendingDebitTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client_ = authenticated_client(1)
+        self.banker = authenticated_client(99, role='banquier')
+        self.account = Account.objects.create(user_id=1, solde=100)
+        self.other = Account.objects.create(user_id=2, solde=0)
+
+    def withdraw(self, amount):
+        return self.client_.post(f"/api/{self.account.pk}/balance/update/", {"action": "withdraw", "amount": amount})
+
+    def test_pending_withdrawals_reduce_available_balance(self):
+        self.assertEqual(self.withdraw("60").status_code, 200)
+        self.assertEqual(self.withdraw("60").status_code, 400)
+        transfer = self.client_.post(f"/api/{self.account.pk}/virement/", {"target_account_id": self.other.pk, "amount": "50"})
+        self.assertEqual(transfer.status_code, 400)
+        self.account.refresh_from_db()
+        self.assertEqual((self.account.solde, self.account.debit_en_attente), (Decimal('100'), Decimal('60')))
+
+    def test_validation_and_decline_release_reservations(self):
+        self.withdraw("30")
+        self.client_.post(f"/api/{self.account.pk}/virement/", {"target_account_id": self.other.pk, "amount": "20"})
+        withdrawal = Log.objects.get(action='retrait')
+        transfer = Log.objects.get(action='virement_envoye')
+        self.banker.post(f"/api/validate-action/{withdrawal.pk}/")
+        self.banker.post(f"/api/decline-action/{transfer.pk}/")
+        process_jobs()
+        self.account.refresh_from_db()
+        self.assertEqual((self.account.solde, self.account.debit_en_attente), (Decimal('70'), Decimal('0')))
+
+    def test_negative_amount_is_refused(self):
+        self.assertEqual(self.withdraw("-10").status_code, 400)
+
+    def test_reconcile_fixes_drift(self):
+        from .services import reconcile_pending_debits
+        self.withdraw("25")
+        Account.objects.filter(pk=self.account.pk).update(debit_en_attente=0)
+        Account.objects.filter(pk=self.other.pk).update(debit_en_attente=7)
+        mismatches = reconcile_pending_debits(chunk_size=1)
+        self.assertEqual(sorted(pk for pk, _, _ in mismatches), [self.account.pk, self.other.pk])
+        self.account.refresh_from_db()
+        self.other.refresh_from_db()
+        self.assertEqual((self.account.debit_en_attente, self.other.debit_en_attente), (Decimal('25'), Decimal('0')))
+        self.assertEqual(reconcile_pending_debits(), [])
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class ConcurrentTransferTests(TransactionTestCase):
+    workers = 8
+    transfers_per_worker = 10
+
+    def test_parallel_transfers_in_both_directions(self):
+        from .services import create_transfer
+        a = Account.objects.create(user_id=1, solde=1000)
+        b = Account.objects.create(user_id=2, solde=1000)
+        errors = []
+
+        def worker(index):
+            # Les transferts croisés A->B / B->A provoqueraient un interblocage sans ordre de verrouillage
+            source, target = (a, b) if index % 2 else (b, a)
+            try:
+                for _ in range(self.transfers_per_worker):
+                    create_transfer(source.pk, target.pk, Decimal('1'))
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(Log.objects.count(), 2 * self.workers * self.transfers_per_worker)
+        # Aucune mise à jour perdue : chaque réservation est comptée une fois, les soldes ne bougent pas avant validation
+        sent_per_account = self.workers // 2 * self.transfers_per_worker
+        for account in (a, b):
+            account.refresh_from_db()
+            self.assertEqual((account.solde, account.debit_en_attente), (Decimal('1000'), Decimal(sent_per_account)))
+            self.assertEqual(account.debit_en_attente, pending_debits(account))
+        settle_logs(Log.objects.filter(action='virement_envoye'))
+        for account in (a, b):
+            account.refresh_from_db()
+            self.assertEqual((account.solde, account.debit_en_attente), (Decimal('1000'), Decimal('0')))
+
+    def test_parallel_transfers_never_exceed_available_balance(self):
+        from .services import InsufficientFunds, create_transfer
+        source = Account.objects.create(user_id=1, solde=50)
+        target = Account.objects.create(user_id=2, solde=0)
+        refused = []
+
+        def worker():
+            try:
+                for _ in range(self.transfers_per_worker):
+                    try:
+                        create_transfer(source.pk, target.pk, Decimal('1'))
+                    except InsufficientFunds:
+                        refused.append(1)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        source.refresh_from_db()
+        self.assertEqual((source.solde, source.debit_en_attente), (Decimal('50'), Decimal('50')))
+        self.assertEqual(source.debit_en_attente, pending_debits(source))
+        self.assertEqual(len(refused), self.workers * self.transfers_per_worker - 50)
+        self.assertEqual(Log.objects.filter(action='virement_recu', account=target).count(), 50)
+
+
+class TransferReservationTests(TestCase):
+    """Ordre de verrouillage et réservation des virements, vérifiés sans threads (toutes les bases)."""
+
+    def setUp(self):
+        self.a = Account.objects.create(user_id=1, solde=50)
+        self.b = Account.objects.create(user_id=2, solde=0)
+
+    def test_accounts_are_locked_in_id_order(self):
+        with CaptureQueriesContext(connection) as queries:
+            create_transfer(self.b.pk, self.a.pk, Decimal('0'))
+        lock = next(query['sql'] for query in queries.captured_queries if query['sql'].startswith('SELECT'))
+        self.assertIn('ORDER BY "apiargent_account"."id" ASC', lock)
+        with transaction.atomic():
+            self.assertEqual(list(lock_accounts([self.b.pk, self.a.pk, self.b.pk])), [self.a.pk, self.b.pk])
+
+    def test_reservations_follow_the_available_balance(self):
+        first, _ = create_transfer(self.a.pk, self.b.pk, Decimal('30'))
+        with self.assertRaises(InsufficientFunds):
+            create_transfer(self.a.pk, self.b.pk, Decimal('30'))
+        second, _ = create_transfer(self.a.pk, self.b.pk, Decimal('20'))
+        self.a.refresh_from_db()
+        self.assertEqual((self.a.solde, self.a.debit_en_attente, self.a.solde_disponible), (Decimal('50'), Decimal('50'), Decimal('0')))
+        self.assertEqual(self.a.debit_en_attente, pending_debits(self.a))
+
+        settle_logs(Log.objects.filter(pk=first.pk))
+        settle_logs(Log.objects.filter(pk=second.pk), approve=False)
+        self.a.refresh_from_db()
+        self.b.refresh_from_db()
+        self.assertEqual((self.a.solde, self.a.debit_en_attente, self.b.solde), (Decimal('20'), Decimal('0'), Decimal('30')))
+        self.assertEqual(self.a.debit_en_attente, pending_debits(self.a))
+
+
+@override_settings(SETTLEMENT_QUEUE=False)
+class SettlementTests(TestCase):
+    """Règlement pendant la requête HTTP (sans file de règlement)."""
+
+    def setUp(self):
+        cache.clear()
+        self.banker = authenticated_client(99, role='banquier')
+        self.a = Account.objects.create(user_id=1, solde=50)
+        self.b = Account.objects.create(user_id=2, solde=0)
+
+    def test_validate_single_deposit(self):
+        log = Log.objects.create(account=self.a, action='depot', montant=25)
+        response = self.banker.post(f"/api/validate-action/{log.pk}/")
+        self.assertEqual(response.status_code, 200)
+        self.a.refresh_from_db()
+        self.assertEqual(self.a.solde, Decimal('75'))
+        self.assertEqual(self.banker.post(f"/api/validate-action/{log.pk}/").status_code, 404)
+
+    def test_validate_withdrawal_insufficient_funds(self):
+        log = Log.objects.create(account=self.a, action='retrait', montant=80)
+        response = self.banker.post(f"/api/validate-action/{log.pk}/")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["res"], "Insufficient funds for the withdrawal")
+
+    def test_bulk_validate_applies_in_order_with_per_log_outcomes(self):
+        deposit = Log.objects.create(account=self.a, action='depot', montant=10)
+        transfer = Log.objects.create(account=self.a, action='virement_envoye', montant=60, cible=self.b)
+        withdrawal = Log.objects.create(account=self.a, action='retrait', montant=30)
+        response = self.banker.post("/api/process-pending-actions/", {"decision": "validate", "ids": [deposit.pk, transfer.pk, withdrawal.pk, 12345]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        outcomes = {row["id"]: row["res"] for row in response.data["results"]}
+        self.assertEqual(outcomes, {deposit.pk: 'validated', transfer.pk: 'validated', withdrawal.pk: 'insufficient_funds', 12345: 'not_found'})
+        self.a.refresh_from_db()
+        self.b.refresh_from_db()
+        self.assertEqual((self.a.solde, self.b.solde), (Decimal('0'), Decimal('60')))
+        self.assertIsNone(Log.objects.get(pk=withdrawal.pk).date_valeur)
+
+    def test_received_leg_is_settled_only_with_its_transfer(self):
+        sent, received = create_transfer(self.a.pk, self.b.pk, Decimal('20'))
+        response = self.banker.post("/api/process-pending-actions/", {"decision": "decline", "ids": [received.pk]}, format='json')
+        self.assertEqual(response.data["results"], [{"id": received.pk, "res": "not_found"}])
+        self.assertEqual(self.banker.post(f"/api/decline-action/{received.pk}/").status_code, 404)
+        with override_settings(SETTLEMENT_QUEUE=True):
+            response = self.banker.post("/api/process-pending-actions/", {"decision": "decline", "ids": [received.pk]}, format='json')
+            self.assertEqual(response.data["results"], [{"id": received.pk, "res": "not_found"}])
+            self.assertEqual(self.banker.post(f"/api/validate-action/{received.pk}/").status_code, 404)
+        self.assertFalse(SettlementJob.objects.exists())
+        self.assertEqual(list(Log.objects.values_list('date_valeur', 'refuse')), [(None, False), (None, False)])
+
+        self.assertEqual(self.banker.post(f"/api/validate-action/{sent.pk}/").status_code, 200)
+        received.refresh_from_db()
+        self.assertEqual((received.date_valeur is not None, received.refuse), (True, False))
+
+    def test_transfer_to_a_deleted_account_is_refused(self):
+        sent, _ = create_transfer(self.a.pk, self.b.pk, Decimal('20'))
+        self.b.delete()
+        response = self.banker.post(f"/api/validate-action/{sent.pk}/")
+        self.assertEqual(response.status_code, 400)
+        sent.refresh_from_db()
+        self.assertEqual((sent.date_valeur is not None, sent.refuse), (True, True))
+        self.a.refresh_from_db()
+        self.assertEqual((self.a.solde, self.a.debit_en_attente), (Decimal('50'), Decimal('0')))
+        self.assertEqual(self.banker.post(f"/api/validate-action/{sent.pk}/").status_code, 404)
+
+    def test_bulk_decline_by_filter(self):
+        small = Log.objects.create(account=self.a, action='depot', montant=5)
+        large = Log.objects.create(account=self.a, action='depot', montant=500)
+        response = self.banker.post("/api/process-pending-actions/", {"decision": "decline", "action": "depot", "max_amount": "10"}, format='json')
+        self.assertEqual(response.data["results"], [{"id": small.pk, "res": "declined"}])
+        self.assertIsNotNone(Log.objects.get(pk=small.pk).date_valeur)
+        self.assertIsNone(Log.objects.get(pk=large.pk).date_valeur)
+        self.a.refresh_from_db()
+        self.assertEqual(self.a.solde, Decimal('50'))
+
+
+class ExternalTokenAuthenticationTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.stub = StubAuthServer(delay=0.2)
+        self.addCleanup(self.stub.close)
+        override = override_settings(AUTH_API_URL=self.stub.url)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def authenticate(self, token):
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'Token {token}')
+        return ExternalTokenAuthentication().authenticate(request)
+
+    def test_valid_token_is_cached(self):
+        user, _ = self.authenticate('client-1')
+        self.assertEqual(user.role, 'client')
+        self.authenticate('client-1')
+        self.assertEqual(self.stub.calls, 1)
+
+    def test_invalid_token_is_negatively_cached(self):
+        for _ in range(3):
+            with self.assertRaises(exceptions.AuthenticationFailed):
+                self.authenticate('bad-1')
+        self.assertEqual(self.stub.calls, 1)
+
+    def test_concurrent_misses_share_one_call(self):
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.authenticate('client-2'))) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(results), 10)
+        self.assertEqual(self.stub.calls, 1)
+
+    def test_stale_token_is_served_while_refreshing(self):
+        cache.set(cache_key_for('client-3'), {'user': {'id': 1, 'role': 'ancien'}, 'fresh_until': time.time() - 1})
+        started = time.monotonic()
+        user, _ = self.authenticate('client-3')
+        self.assertLess(time.monotonic() - started, self.stub.delay)
+        self.assertEqual(user.role, 'ancien')
+        for _ in range(50):
+            if cache.get(cache_key_for('client-3'))['user']['role'] == 'client':
+                break
+            time.sleep(0.02)
+        self.assertEqual(cache.get(cache_key_for('client-3'))['user']['role'], 'client')
+        self.assertEqual(self.stub.calls, 1)
+
+
+class SQLiteCacheTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'cache.sqlite3')
+
+    def make_cache(self, **options):
+        return SQLiteCache(self.path, {'TIMEOUT': 300, 'OPTIONS': options})
+
+    def test_entries_are_shared_between_instances(self):
+        worker_a, worker_b = self.make_cache(), self.make_cache()
+        worker_a.set('auth_token_x', {'user': 1})
+        self.assertEqual(worker_b.get('auth_token_x'), {'user': 1})
+        self.assertFalse(worker_b.add('auth_token_x', 'autre'))
+        self.assertTrue(worker_b.delete('auth_token_x'))
+        self.assertIsNone(worker_a.get('auth_token_x'))
+
+    def test_expired_entries_are_misses(self):
+        cache_ = self.make_cache()
+        cache_.set('k', 'v', timeout=-1)
+        self.assertIsNone(cache_.get('k'))
+        self.assertTrue(cache_.add('k', 'v2'))
+        self.assertEqual(cache_.get('k'), 'v2')
+
+    def test_lru_eviction_and_stats(self):
+        cache_ = self.make_cache(MAX_ENTRIES=10, CULL_FREQUENCY=2)
+        cache_.cull_check_interval = 1
+        cache_.touch_resolution = 0
+        for i in range(10):
+            cache_.set(f'k{i}', i)
+        cache_.get('k0')
+        cache_.set('k10', 10)
+        self.assertEqual(cache_.get('k0'), 0)
+        self.assertIsNone(cache_.get('k1'))
+        stats = cache_.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (2, 1))
+        self.assertEqual(stats['evictions'], 6)
+        self.assertEqual(stats['entries'], 5)
+
+    def test_reads_do_not_write(self):
+        worker_a, worker_b = self.make_cache(), self.make_cache()
+        worker_a.set('k', 'v')
+        conn = worker_a._connection()
+        changes = conn.total_changes
+        for _ in range(3):
+            self.assertEqual(worker_a.get('k'), 'v')
+        self.assertIsNone(worker_a.get('absente'))
+        self.assertEqual(conn.total_changes, changes)
+        self.assertEqual(worker_b.stats()['hits'], 0)
+        # Compteurs écrits en une transaction, au plus tôt après flush_interval
+        worker_a.close()
+        self.assertEqual(worker_b.stats()['hits'], 0)
+        worker_a.flush_interval = 0
+        worker_a.close()
+        self.assertEqual((worker_b.stats()['hits'], worker_b.stats()['misses']), (3, 1))
+
+
+class QueryCountTests(TestCase):
+    """Nombre de requêtes SQL maximal par endpoint de compte (l'authentification passe par le cache)."""
+
+    def setUp(self):
+        cache.clear()
+        self.client_ = authenticated_client(1)
+        self.account = Account.objects.create(user_id=1, solde=100)
+        self.other = Account.objects.create(user_id=2, solde=0)
+        Log.objects.bulk_create([Log(account=self.account, action='depot', montant=1, cible=self.other) for _ in range(20)])
+
+    def test_account_detail(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client_.get(f"/api/{self.account.pk}/").status_code, 200)
+
+    def test_account_logs(self):
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client_.get(f"/api/{self.account.pk}/logs/").status_code, 200)
+
+    def test_balance_update(self):
+        # compte (permission) + SAVEPOINT + nouvelle version + INSERT du log + RELEASE
+        with self.assertNumQueries(5):
+            response = self.client_.post(f"/api/{self.account.pk}/balance/update/", {"action": "deposit", "amount": "5"})
+            self.assertEqual(response.status_code, 200)
+
+    def test_transfer(self):
+        # compte (permission) + SAVEPOINT + SELECT ... FOR UPDATE + réservation + INSERT envoyé + INSERT reçu + RELEASE
+        with self.assertNumQueries(7):
+            response = self.client_.post(f"/api/{self.account.pk}/virement/", {"target_account_id": self.other.pk, "amount": "5"})
+            self.assertEqual(response.status_code, 200)
+
+    def test_other_users_account_is_refused(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client_.get(f"/api/{self.other.pk}/").status_code, 403)
+
+
+@override_settings(METRICS_DIR=None)
+class InstrumentationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.account = Account.objects.create(user_id=1, solde=100)
+
+    def test_server_timing_header(self):
+        response = authenticated_client(1).get(f"/api/{self.account.pk}/")
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertIn('desc="1 queries"', response['Server-Timing'])
+        self.assertIn('auth;desc="cache hit"', response['Server-Timing'])
+
+    def test_metrics_endpoint_exposes_histograms(self):
+        authenticated_client(1).get(f"/api/{self.account.pk}/")
+        body = APIClient().get("/metrics/").content.decode()
+        self.assertIn('# TYPE apiargent_request_duration_seconds histogram', body)
+        self.assertIn('apiargent_db_queries_bucket{view="account-detail",le="1"}', body)
+        self.assertIn('apiargent_auth_cache_total{result="hit"}', body)
+
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=0)
+    def test_slow_query_log(self):
+        with self.assertLogs('apiargent.slow_queries', level='WARNING') as logs:
+            authenticated_client(1).get(f"/api/{self.account.pk}/")
+        self.assertIn('account-detail', logs.output[0])
+
+    def test_files_of_dead_workers_are_dropped(self):
+        from .metrics import registry
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        dead = subprocess.Popen(['true'])
+        dead.wait()
+        with open(os.path.join(directory, f"metrics_{dead.pid}.json"), 'w') as f:
+            json.dump({'stale_total': {'type': 'counter', 'help': '', 'buckets': [], 'samples': [[[], 5]]}}, f)
+        with override_settings(METRICS_DIR=directory):
+            self.assertNotIn('stale_total', registry.collect())
+            self.assertEqual(os.listdir(directory), [f"metrics_{os.getpid()}.json"])
+            registry.discard()
+        self.assertEqual(os.listdir(directory), [])
+
+    def test_worker_dumps_are_summed(self):
+        from .metrics import Histogram, merge_dumps, render_prometheus
+        worker_a, worker_b = Histogram('h', 'aide', (1, 2)), Histogram('h', 'aide', (1, 2))
+        worker_a.observe((('view', 'v'),), 0.5)
+        worker_b.observe((('view', 'v'),), 1.5)
+        worker_b.observe((('view', 'v'),), 3)
+        merged = merge_dumps(merge_dumps({}, {'h': worker_a.dump()}), {'h': worker_b.dump()})
+        text = render_prometheus(merged)
+        self.assertIn('h_bucket{view="v",le="2"} 2', text)
+        self.assertIn('h_bucket{view="v",le="+Inf"} 3', text)
+        self.assertIn('h_count{view="v"} 3', text)
+
+
+@override_settings(ROOT_URLCONF='apiproject.asgi_urls', METRICS_DIR=None)
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.account = Account.objects.create(user_id=1, solde=100)
+        Account.objects.create(user_id=2, solde=5)
+
+    async def test_async_views_match_sync_views(self):
+        cache_user('client-1', {'id': 1, 'user_id': 1, 'role': 'client'})
+        headers = {'AUTHORIZATION': 'Token client-1'}
+        for path in ("/api/", f"/api/{self.account.pk}/", "/api/list/", "/api/?type_compte=courant&limit=1"):
+            async_response = await AsyncClient().get(path, headers=headers)
+            with override_settings(ROOT_URLCONF='apiproject.urls'):
+                sync_response = await AsyncClient().get(path, headers=headers)
+            self.assertEqual(async_response.status_code, 200)
+            self.assertEqual(async_response.content, sync_response.content)
+            self.assertEqual(async_response.get('ETag'), sync_response.get('ETag'))
+
+    async def test_async_detail_permissions(self):
+        cache_user('client-2', {'id': 2, 'user_id': 2, 'role': 'client'})
+        response = await AsyncClient().get(f"/api/{self.account.pk}/", headers={'AUTHORIZATION': 'Token client-2'})
+        self.assertEqual(response.status_code, 403)
+        response = await AsyncClient().get(f"/api/{self.account.pk}/")
+        self.assertEqual(response.status_code, 403)
+
+    async def test_server_timing_counts_queries(self):
+        # L'ORM s'exécute dans le thread de sync_to_async, pas dans celui de la boucle d'événements
+        cache_user('client-1', {'id': 1, 'user_id': 1, 'role': 'client'})
+        response = await AsyncClient().get(f"/api/{self.account.pk}/", headers={'AUTHORIZATION': 'Token client-1'})
+        self.assertEqual(response.status_code, 200)
+        self.assertRegex(response['Server-Timing'], r'desc="[1-9]\d* queries"')
+
+    async def test_slow_auth_does_not_serialize_requests(self):
+        stub = StubAuthServer(delay=0.3)
+        self.addCleanup(stub.close)
+        with override_settings(AUTH_API_URL=stub.url):
+            started = time.monotonic()
+            responses = await asyncio.gather(*[
+                AsyncClient().get("/api/list/", headers={'AUTHORIZATION': f'Token client-{i}'}) for i in range(10)
+            ])
+            elapsed = time.monotonic() - started
+        self.assertEqual([r.status_code for r in responses], [200] * 10)
+        self.assertEqual(stub.calls, 10)
+        self.assertLess(elapsed, 10 * stub.delay / 2)
+
+
+class ValuesSerializerTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.account = Account.objects.create(user_id=1, solde=Decimal('12345678.9'), type_compte='epargne')
+        other = Account.objects.create(user_id=2, solde=0)
+        Log.objects.create(account=self.account, action='depot', montant=Decimal('0.1'))
+        Log.objects.create(account=self.account, action='virement_envoye', montant=Decimal('99999999.99'), cible=other,
+                           libele='Loyer « été »\u2028ligne\t"citée"\x01')
+        Log.objects.create(account=other, action='retrait', montant=5, date_valeur=timezone.now())
+
+    def assertSameJSON(self, serializer_class, values_serializer, queryset):
+        expected = JSONRenderer().render(serializer_class(queryset, many=True).data)
+        self.assertEqual(renderers.FastJSONRenderer().render(values_serializer.serialize(queryset)), expected)
+        # Même sortie sans orjson
+        orjson, renderers.orjson = renderers.orjson, None
+        try:
+            self.assertEqual(renderers.FastJSONRenderer().render(values_serializer.serialize(queryset)), expected)
+        finally:
+            renderers.orjson = orjson
+
+    def test_output_is_byte_identical(self):
+        for tz in ('UTC', 'Europe/Paris'):
+            with timezone.override(tz):
+                self.assertSameJSON(AccountSerializer, account_values_serializer, Account.objects.order_by('id'))
+                self.assertSameJSON(LogSerializer, log_values_serializer, Log.objects.order_by('id'))
+                logs = list(Log.objects.order_by('id'))
+                self.assertEqual(log_values_serializer.serialize_instances(logs), LogSerializer(logs, many=True).data)
+
+    def test_list_endpoints_are_unchanged(self):
+        client = authenticated_client(1, role='banquier')
+        for path, serializer_class, queryset in (
+            ("/api/", AccountSerializer, Account.objects.order_by('id')),
+            (f"/api/{self.account.pk}/logs/", LogSerializer, Log.objects.filter(account=self.account).order_by('-date_action')),
+            ("/api/pending-actions/", LogSerializer,
+             Log.objects.filter(date_valeur__isnull=True).exclude(action='virement_recu').order_by('date_action')),
+        ):
+            response = client.get(path)
+            self.assertEqual(response.content, JSONRenderer().render(serializer_class(queryset, many=True).data))
+
+
+class StatementTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.a = Account.objects.create(user_id=1, solde=50)
+        self.b = Account.objects.create(user_id=2, solde=100)
+        deposit = Log.objects.create(account=self.a, action='depot', montant=25)
+        settle_logs(Log.objects.filter(pk=deposit.pk))
+        Log.objects.create(account=self.a, action='retrait', montant=10)
+        declined, _ = create_transfer(self.a.pk, self.b.pk, Decimal('30'), 'Loyer, "mars"')
+        settle_logs(Log.objects.filter(pk=declined.pk), approve=False)
+        received, _ = create_transfer(self.b.pk, self.a.pk, Decimal('20'))
+        settle_logs(Log.objects.filter(pk=received.pk))
+        self.a.refresh_from_db()
+
+    def test_running_balance_and_statuses(self):
+        rows = list(iter_statement(self.a))
+        self.assertEqual([(r['action'], r['statut'], r['solde']) for r in rows], [
+            ('depot', 'valide', '75.00'),
+            ('retrait', 'en_attente', '75.00'),
+            ('virement_envoye', 'refuse', '75.00'),
+            ('virement_recu', 'valide', '95.00'),
+        ])
+        self.assertEqual(rows[-1]['solde'], '{:f}'.format(self.a.solde))
+        # Le log reçu du virement refusé est refusé avec lui
+        self.assertTrue(Log.objects.get(account=self.b, action='virement_recu').refuse)
+
+    def test_reads_history_in_chunks(self):
+        # Point de contrôle d'archivage, solde d'ouverture puis 3 paquets
+        with self.assertNumQueries(5):
+            self.assertEqual(len(list(iter_statement(self.a, chunk_size=2))), 4)
+
+    def test_csv_endpoint(self):
+        response = authenticated_client(1).get(f"/api/{self.a.pk}/statement/?action=virement_envoye,virement_recu")
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'id,date_action,date_valeur,action,montant,cible,libele,statut,solde')
+        self.assertEqual(len(lines), 3)
+        self.assertIn(',"Loyer, ""mars""",refuse,75.00', lines[1])
+        self.assertEqual(authenticated_client(2).get(f"/api/{self.a.pk}/statement/").status_code, 403)
+        self.assertEqual(authenticated_client(1).get(f"/api/{self.a.pk}/statement/?from=hier").status_code, 400)
+
+    def test_ndjson_command_with_date_range(self):
+        out = StringIO()
+        call_command('export_statement', self.a.pk, '--format', 'ndjson', '--field', 'date_valeur', '--chunk-size', '1', stdout=out)
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([row['statut'] for row in rows], ['valide', 'refuse', 'valide'])
+        out = StringIO()
+        tomorrow = (timezone.localdate() + timedelta(days=1)).isoformat()
+        call_command('export_statement', self.a.pk, '--format', 'ndjson', '--from', tomorrow, stdout=out)
+        self.assertEqual(out.getvalue(), '')
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client_ = authenticated_client(1)
+        self.account = Account.objects.create(user_id=1, solde=100)
+        other = Account.objects.create(user_id=2, solde=0)
+        now = timezone.now()
+        logs = [Log(account=self.account, action='depot' if i % 3 else 'retrait', montant=i + 1, cible=other if i == 4 else None)
+                for i in range(10)]
+        Log.objects.bulk_create(logs)
+        for i, log in enumerate(Log.objects.filter(account=self.account).order_by('id')):
+            # Les 8 premiers logs datent de plus d'un an, seuls les 6 premiers sont réglés
+            date_action = now - timedelta(days=400 - i) if i < 8 else now - timedelta(minutes=10 - i)
+            Log.objects.filter(pk=log.pk).update(date_action=date_action, date_valeur=date_action if i < 6 else None, refuse=i == 1)
+        self.cutoff = now - timedelta(days=365)
+
+    def history(self):
+        return [row["id"] for row in self.client_.get(f"/api/{self.account.pk}/logs/").json()]
+
+    def test_archive_in_resumable_chunks(self):
+        self.assertEqual(archive_logs(self.cutoff, chunk_size=4, max_chunks=1), 4)
+        self.assertEqual(archive_logs(self.cutoff, chunk_size=4), 2)
+        self.assertEqual(archive_logs(self.cutoff, chunk_size=4), 0)
+        self.assertEqual(ArchivedLog.objects.count(), 6)
+        # Les logs anciens encore en attente restent dans la table courante
+        self.assertEqual(Log.objects.filter(account=self.account).count(), 4)
+        checkpoint = BalanceCheckpoint.objects.get(account=self.account)
+        # 3 + 5 + 6 crédités, 1 + 4 retirés, 2 refusé
+        self.assertEqual((checkpoint.archived_count, checkpoint.archived_total), (6, Decimal('9')))
+
+    def test_history_and_statement_merge_archive(self):
+        history = self.history()
+        statement = list(iter_statement(Account.objects.get(pk=self.account.pk)))
+        archive_logs(self.cutoff)
+        self.assertEqual(self.history(), history)
+        self.assertEqual(list(iter_statement(Account.objects.select_related('checkpoint').get(pk=self.account.pk))), statement)
+        response = self.client_.get(f"/api/{self.account.pk}/logs/7/")
+        self.assertEqual([row["id"] for row in response.json()], history[:7])
+
+        seen, url = [], f"/api/{self.account.pk}/logs/?page_size=3"
+        while url:
+            data = self.client_.get(url).json()
+            seen += [row["id"] for row in data["results"]]
+            url = data["next"]
+        self.assertEqual(seen, history)
+
+    def test_chunks_are_deleted_without_per_log_signals(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.assertEqual(archive_logs(self.cutoff, chunk_size=4), 6)
+        # Une invalidation du cache par paquet, aucune par log supprimé
+        self.assertEqual(len(callbacks), 2)
+
+    def test_transfer_legs_are_archived_together(self):
+        other = Account.objects.get(user_id=2)
+        sent, received = create_transfer(self.account.pk, other.pk, Decimal('5'))
+        SettlementJob.objects.create(log=sent, approve=True)
+        process_jobs()
+        Log.objects.filter(pk__in=[sent.pk, received.pk]).update(date_action=self.cutoff - timedelta(days=1))
+        Log.objects.exclude(pk__in=[sent.pk, received.pk]).update(date_valeur=None)
+        # Le log reçu suit le log envoyé même au-delà de la taille du paquet
+        self.assertEqual(archive_logs(self.cutoff, chunk_size=1, max_chunks=1), 2)
+        self.assertEqual(ArchivedLog.objects.get(pk=received.pk).origine_id, sent.pk)
+        self.assertFalse(SettlementJob.objects.exists())
+        self.assertFalse(Log.objects.filter(pk__in=[sent.pk, received.pk]).exists())
+
+    def test_recent_page_does_not_read_archive(self):
+        archive_logs(self.cutoff)
+        with self.assertNumQueries(2):
+            self.client_.get(f"/api/{self.account.pk}/logs/?page_size=2")
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client_ = authenticated_client(1)
+        self.banker = authenticated_client(99, role='banquier')
+        self.account = Account.objects.create(user_id=1, solde=100)
+        self.other = Account.objects.create(user_id=2, solde=0)
+
+    def revalidate(self, path, client=None):
+        client = client or self.client_
+        first = client.get(path)
+        self.assertEqual(first.status_code, 200)
+        with self.assertNumQueries(1):
+            second = client.get(path, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual((second.status_code, second.content), (304, b''))
+        return first['ETag']
+
+    def test_detail_and_logs_return_304_after_one_lookup(self):
+        for path in (f"/api/{self.account.pk}/", f"/api/{self.account.pk}/logs/", "/api/list/"):
+            self.revalidate(path)
+        self.assertNotEqual(self.revalidate(f"/api/{self.account.pk}/logs/?page_size=5"),
+                            self.revalidate(f"/api/{self.account.pk}/logs/"))
+
+    def test_writes_change_the_etag(self):
+        detail = self.revalidate(f"/api/{self.account.pk}/")
+        logs = self.revalidate(f"/api/{self.other.pk}/logs/", self.banker)
+        own = self.revalidate("/api/list/")
+        self.client_.post(f"/api/{self.account.pk}/balance/update/", {"action": "deposit", "amount": "5"})
+        self.assertNotEqual(self.client_.get(f"/api/{self.account.pk}/", HTTP_IF_NONE_MATCH=detail).status_code, 304)
+
+        # Un virement modifie aussi l'historique du compte cible
+        self.client_.post(f"/api/{self.account.pk}/virement/", {"target_account_id": self.other.pk, "amount": "5"})
+        response = self.banker.get(f"/api/{self.other.pk}/logs/", HTTP_IF_NONE_MATCH=logs)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        log = Log.objects.get(account=self.account, action='virement_envoye')
+        self.banker.post(f"/api/validate-action/{log.pk}/")
+        process_jobs()
+        self.assertEqual(self.banker.get(f"/api/{self.other.pk}/logs/", HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        self.banker.post(f"/api/change-account-state/{self.account.pk}/", {"etat": "fermé"})
+        self.assertEqual(self.client_.get("/api/list/", HTTP_IF_NONE_MATCH=own).status_code, 200)
+
+
+
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client_ = authenticated_client(1)
+        self.banker = authenticated_client(99, role='banquier')
+        self.account = Account.objects.create(user_id=1, solde=100, statut='actif')
+        self.other = Account.objects.create(user_id=2, solde=0, statut='en_creation')
+
+    def cached_get(self, path):
+        first = self.banker.get(path)
+        self.assertEqual(first.status_code, 200)
+        with self.assertNumQueries(0):
+            second = self.banker.get(path)
+        self.assertEqual(second.content, first.content)
+        return first.json()
+
+    def test_dashboards_are_served_from_cache(self):
+        self.cached_get("/api/pending-actions/")
+        self.cached_get("/api/pending-actions/?page_size=1")
+        self.assertEqual([row['id'] for row in self.cached_get("/api/list-process-created-accounts/")], [self.other.pk])
+        # L'API navigable n'est pas mise en cache
+        self.assertEqual(self.banker.get("/api/pending-actions/", HTTP_ACCEPT='text/html').status_code, 200)
+
+    def test_writes_invalidate_after_commit(self):
+        self.assertEqual(self.cached_get("/api/pending-actions/"), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client_.post(f"/api/{self.account.pk}/virement/", {"target_account_id": self.other.pk, "amount": "5"})
+        pending = self.cached_get("/api/pending-actions/")
+        self.assertEqual([row['action'] for row in pending], ['virement_envoye'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.banker.post(f"/api/decline-action/{pending[0]['id']}/")
+            process_jobs()
+        self.assertEqual(self.cached_get("/api/pending-actions/"), [])
+
+        self.cached_get("/api/list-process-created-accounts/")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.banker.post(f"/api/change-account-state/{self.other.pk}/", {"etat": "actif"})
+        self.assertEqual(self.cached_get("/api/list-process-created-accounts/"), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client_.post("/api/request-new-account/", {"type_compte": "courant"})
+        self.assertEqual(len(self.cached_get("/api/list-process-created-accounts/")), 1)
+
+    def test_cache_failure_does_not_fail_committed_writes(self):
+        with mock.patch('apiargent.response_cache.cache') as broken:
+            broken.set.side_effect = sqlite3.OperationalError('database is locked')
+            with self.assertLogs('django', level='ERROR'), self.captureOnCommitCallbacks(execute=True):
+                response = self.client_.post(f"/api/{self.account.pk}/virement/", {"target_account_id": self.other.pk, "amount": "5"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Log.objects.count(), 2)
+
+    def test_single_recompute_under_concurrency(self):
+        calls = []
+        results = []
+        start = threading.Barrier(8)
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return b'[]'
+
+        def worker():
+            start.wait()
+            results.append(get_or_compute('test_dogpile', 'variant', compute))
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [b'[]'] * 8)
+
+
+@override_settings(ROOT_URLCONF='apiproject.asgi_urls', METRICS_DIR=None)
+class PendingEventsTests(TestCase):
+    def setUp(self):
+        journal.clear()
+        cache_user('banker-99', {'id': 99, 'user_id': 99, 'role': 'banquier'})
+        self.headers = {'AUTHORIZATION': 'Token banker-99'}
+        self.account = Account.objects.create(user_id=1, solde=100)
+        self.other = Account.objects.create(user_id=2, solde=0)
+
+    def poll(self, cursor, timeout=0):
+        response = async_to_sync(AsyncClient().get)(
+            "/api/pending-actions/events/", {'mode': 'poll', 'last_event_id': cursor, 'timeout': timeout},
+            headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_events_resume_from_last_id(self):
+        start = journal.last_id()
+        with self.captureOnCommitCallbacks(execute=True):
+            create_transfer(self.account.pk, self.other.pk, Decimal('5'))
+        page = self.poll(start)
+        self.assertEqual([(event['event'], event['data']['action']) for event in page['events']],
+                         [('created', 'virement_envoye')])
+        log_id = page['events'][0]['data']['id']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            settle_logs(Log.objects.filter(pk=log_id))
+        events = self.poll(page['last_event_id'])['events']
+        self.assertEqual([(event['event'], event['data']) for event in events], [('validated', {'ids': [log_id]})])
+        # Reprise depuis le début : les deux événements, dans l'ordre
+        self.assertEqual([event['event'] for event in self.poll(start)['events']], ['created', 'validated'])
+        # Id inconnu (journal purgé ou recréé) : le client doit recharger la liste
+        self.assertEqual([event['event'] for event in self.poll(journal.last_id() + 10)['events']], ['reset'])
+
+    def test_journal_failure_does_not_fail_committed_writes(self):
+        client = authenticated_client(1)
+        with mock.patch.object(journal, 'append', side_effect=sqlite3.OperationalError('database is locked')):
+            with self.assertLogs('django', level='ERROR'), self.captureOnCommitCallbacks(execute=True):
+                response = client.post(f"/api/{self.account.pk}/virement/", {"target_account_id": self.other.pk, "amount": "5"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Log.objects.count(), 2)
+
+    def test_permissions_and_parameters(self):
+        cache_user('client-1', {'id': 1, 'user_id': 1, 'role': 'client'})
+        client = AsyncClient()
+        response = async_to_sync(client.get)("/api/pending-actions/events/", headers={'AUTHORIZATION': 'Token client-1'})
+        self.assertEqual(response.status_code, 403)
+        response = async_to_sync(client.get)("/api/pending-actions/events/?last_event_id=x", headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+
+    async def test_sse_stream(self):
+        start = await sync_to_async(journal.last_id)()
+        await sync_to_async(journal.append)('created', [{'id': 1}, {'id': 2}])
+        response = await AsyncClient().get("/api/pending-actions/events/",
+                                           headers={**self.headers, 'Last-Event-ID': str(start + 1)})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        chunks = aiter(response.streaming_content)
+        self.assertEqual(await anext(chunks), b"retry: 3000\n\n")
+        self.assertEqual(await anext(chunks), f'id: {start + 2}\nevent: created\ndata: {{"id":2}}\n\n'.encode())
+        await chunks.aclose()
+
+    async def test_one_journal_read_for_many_waiters(self):
+        start = await sync_to_async(journal.last_id)()
+        reads = []
+        since = journal.since
+
+        def counted(*args, **kwargs):
+            reads.append(1)
+            return since(*args, **kwargs)
+
+        async def publish_later():
+            await asyncio.sleep(0.3)
+            await sync_to_async(journal.append)('created', [{'id': 1}])
+
+        journal.since = counted
+        try:
+            async with broker.subscription():
+                results = await asyncio.gather(
+                    *[broker.wait(start, 5) for _ in range(50)], publish_later())
+        finally:
+            del journal.since
+        self.assertEqual([len(events) for events in results[:-1]], [1] * 50)
+        self.assertLess(len(reads), 5)
+
+
+class BatchOperationsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client_ = authenticated_client(1)
+        self.banker = authenticated_client(99, role='banquier')
+        self.account = Account.objects.create(user_id=1, solde=100)
+        self.other = Account.objects.create(user_id=2, solde=50)
+
+    def submit(self, client, operations):
+        response = client.post("/api/batch/", {"operations": operations}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_partial_failures_are_reported_per_item(self):
+        body = self.submit(self.client_, [
+            {"action": "deposit", "account_id": self.account.pk, "amount": "10"},
+            {"action": "withdraw", "account_id": self.account.pk, "amount": "60"},
+            {"action": "transfer", "account_id": self.account.pk, "target_account_id": self.other.pk, "amount": "50", "libele": "Loyer"},
+            {"action": "withdraw", "account_id": self.account.pk, "amount": "0.01"},
+            {"action": "deposit", "account_id": self.other.pk, "amount": "5"},
+            {"action": "transfer", "account_id": self.account.pk, "target_account_id": 12345, "amount": "1"},
+            {"action": "deposit", "account_id": self.account.pk, "amount": "1.001"},
+            {"action": "refund", "account_id": self.account.pk, "amount": "1"},
+        ])
+        self.assertEqual([item['res'] for item in body['results']], [
+            'created', 'created', 'insufficient_funds', 'created', 'forbidden', 'not_found', 'invalid_amount',
+            'invalid_operation',
+        ])
+        self.assertEqual((body['created'], body['failed']), (3, 5))
+        ids = [item['id'] for item in body['results'] if 'id' in item]
+        self.assertEqual(list(Log.objects.filter(pk__in=ids).order_by('id').values_list('action', 'montant')),
+                         [('depot', Decimal('10')), ('retrait', Decimal('60')), ('retrait', Decimal('0.01'))])
+        self.account.refresh_from_db()
+        # Le dépôt en attente ne compte pas dans le solde disponible
+        self.assertEqual((self.account.debit_en_attente, self.account.version), (Decimal('60.01'), 1))
+
+    def test_banker_batch_uses_bulk_writes(self):
+        accounts = Account.objects.bulk_create([Account(user_id=10 + i, solde=100) for i in range(20)])
+        operations = [{"action": "transfer", "account_id": accounts[i].pk, "target_account_id": accounts[(i + 1) % 20].pk,
+                       "amount": "30"} for i in range(20)] * 3
+        # Verrouillage des comptes, UPDATE groupé, INSERT des logs puis des logs reçus, SAVEPOINT et RELEASE
+        with self.assertNumQueries(6):
+            body = self.submit(self.banker, operations)
+        self.assertEqual([item['res'] for item in body['results']].count('created'), 60)
+        self.assertEqual(Log.objects.filter(action='virement_recu').count(), 60)
+        # Le règlement trouve le log reçu de chaque virement
+        settle_logs(Log.objects.filter(action='virement_envoye'))
+        self.assertEqual(sorted(Account.objects.filter(pk__in=[a.pk for a in accounts]).values_list('solde', flat=True)),
+                         [Decimal('100')] * 20)
+        self.assertFalse(Log.objects.filter(date_valeur__isnull=True).exists())
+
+    def test_rejects_malformed_batches(self):
+        for data in ({}, {"operations": []}, {"operations": "x"}):
+            response = self.client_.post("/api/batch/", data, format='json')
+            self.assertEqual(response.status_code, 400)
+
+    def test_ids_without_bulk_returning(self):
+        operations = [{"action": "transfer", "account_id": self.account.pk, "target_account_id": self.other.pk, "amount": "1"}] * 3
+        # Base sans INSERT ... RETURNING (MySQL) : un INSERT par log, ids exacts même pour des opérations identiques
+        with mock.patch.object(type(connection.features), 'can_return_rows_from_bulk_insert', False):
+            body = self.submit(self.client_, operations)
+        ids = [item['id'] for item in body['results']]
+        self.assertEqual(len(set(ids)), 3)
+        self.assertEqual(list(Log.objects.filter(pk__in=ids).values_list('action', flat=True)), ['virement_envoye'] * 3)
+
+
+class BulkDataTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.account = Account.objects.create(user_id=1, solde=Decimal('100.50'), statut='en_creation', version=3)
+        self.other = Account.objects.create(user_id=2, solde=0, debit_en_attente=Decimal('5'))
+        create_transfer(self.account.pk, self.other.pk, Decimal('12.34'), libele='Loyer « été », "citée"\nligne')
+        Log.objects.create(account=self.other, action='retrait', montant=1, date_valeur=timezone.now(), refuse=True)
+
+    def path(self, name):
+        return os.path.join(self.directory.name, name)
+
+    def snapshot(self):
+        return [list(model.objects.order_by('pk').values()) for model in (Account, Log, ArchivedLog, BalanceCheckpoint)]
+
+    def test_round_trip_preserves_ids_links_and_dates(self):
+        models = ('account', 'log', 'archived_log', 'balance_checkpoint')
+        settle_logs(Log.objects.filter(action='virement_envoye'))
+        archive_logs(timezone.now() + timedelta(days=1))
+        Log.objects.create(account=self.account, action='depot', montant=3)
+        self.assertEqual(ArchivedLog.objects.count(), 3)
+        for fmt in ('csv', 'ndjson'):
+            before = self.snapshot()
+            for model in models:
+                call_command('export_data', model, output=self.path(f'{model}.{fmt}'), chunk_size=2, stderr=StringIO())
+            Log.objects.all().delete()
+            Account.objects.all().delete()
+            for model in models:
+                call_command('import_data', model, self.path(f'{model}.{fmt}'), transaction_size=1, batch_size=1,
+                             stdout=StringIO(), stderr=StringIO())
+            self.assertEqual(self.snapshot(), before)
+
+    def test_round_trip_of_linked_transfers(self):
+        # Ids de logs sans compte correspondant : le lien origine_id est vérifié sur la table des logs
+        Log.objects.all().delete()
+        Log.objects.bulk_create([Log(id=50 + i, account=self.account, action='depot', montant=1) for i in range(2)])
+        create_transfer(self.account.pk, self.other.pk, Decimal('5'))
+        received = Log.objects.get(action='virement_recu')
+        self.assertGreater(received.origine_id, 50)
+        before = self.snapshot()
+        call_command('export_data', 'log', output=self.path('logs.ndjson'), stderr=StringIO())
+        for batch_size in (1, 1000):
+            Log.objects.all().delete()
+            call_command('import_data', 'log', self.path('logs.ndjson'), transaction_size=batch_size, batch_size=batch_size,
+                         stdout=StringIO(), stderr=StringIO())
+            self.assertEqual(self.snapshot(), before)
+
+        # Log envoyé absent de la base et du fichier
+        Log.objects.filter(pk=received.pk).delete()
+        with open(self.path('logs.ndjson')) as f:
+            row = next(row for row in map(json.loads, f) if row['id'] == received.pk)
+        with open(self.path('received.ndjson'), 'w') as f:
+            f.write(json.dumps({**row, 'origine_id': 999}) + '\n')
+        with self.assertRaisesMessage(CommandError, "ligne 1 : log inconnu (origine_id)"):
+            call_command('import_data', 'log', self.path('received.ndjson'), stdout=StringIO(), stderr=StringIO())
+
+    def test_invalid_rows(self):
+        with open(self.path('logs.ndjson'), 'w') as f:
+            f.write('{"id": 100, "account_id": %d, "action": "depot", "montant": "1.00", "date_action": "2024-01-01T00:00:00Z",'
+                    ' "date_valeur": null, "cible_id": null, "libele": null, "refuse": false,'
+                    ' "origine_id": null}\n' % self.account.pk)
+            f.write('{"id": 101, "account_id": 999, "action": "depot", "montant": "1.00", "date_action": "2024-01-01",'
+                    ' "date_valeur": null, "cible_id": null, "libele": null, "refuse": false,'
+                    ' "origine_id": null}\n')
+            f.write('{"id": 102, "account_id": %d, "action": "vol", "montant": "1.001", "date_action": "2024-01-01",'
+                    ' "date_valeur": null, "cible_id": null, "libele": null, "refuse": false,'
+                    ' "origine_id": null}\n' % self.account.pk)
+            f.write('pas du json\n')
+        with self.assertRaisesMessage(CommandError, "ligne 3 : action : Value 'vol' is not a valid choice."):
+            call_command('import_data', 'log', self.path('logs.ndjson'), stdout=StringIO(), stderr=StringIO())
+        self.assertFalse(Log.objects.filter(pk=100).exists())
+
+        stderr = StringIO()
+        call_command('import_data', 'log', self.path('logs.ndjson'), skip_invalid=True, stdout=StringIO(), stderr=stderr)
+        self.assertEqual(Log.objects.get(pk=100).date_action.isoformat(), '2024-01-01T00:00:00+00:00')
+        self.assertFalse(Log.objects.filter(pk__in=[101, 102]).exists())
+        self.assertIn('ligne 2 : compte inconnu (account_id)', stderr.getvalue())
+        self.assertIn('ligne 4 : JSON invalide', stderr.getvalue())
+
+    def test_missing_file(self):
+        with self.assertRaisesMessage(CommandError, "No such file or directory"):
+            call_command('import_data', 'log', self.path('absent.csv'), stdout=StringIO(), stderr=StringIO())
+
+    def test_import_batches_inserts(self):
+        call_command('export_data', 'log', output=self.path('logs.csv'), stderr=StringIO())
+        Log.objects.all().delete()
+        # Vérification des comptes, SAVEPOINT, INSERT des 3 logs, RELEASE
+        with self.assertNumQueries(4):
+            call_command('import_data', 'log', self.path('logs.csv'), stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(Log.objects.count(), 3)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], METRICS_DIR=None)
+class ReplicaRoutingTests(TestCase):
+    """
+    Base principale et réplica : deux bases SQLite distinctes, le réplica
+    n'étant jamais répliqué. L'alias est créé avant la préparation du
+    TestCase (``databases = '__all__'``) pour que ses écritures soient aussi annulées.
+    """
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        connections.settings['replica'] = {**connections.settings['default'],
+                                           'NAME': os.path.join(cls.directory.name, 'replica.sqlite3')}
+        with connections['replica'].schema_editor() as editor:
+            for model in (Account, Log, BalanceCheckpoint, ArchivedLog):
+                editor.create_model(model)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections['replica'].close()
+        del connections['replica']
+        del connections.settings['replica']
+        cls.directory.cleanup()
+
+    def setUp(self):
+        cache.clear()
+        self.client_ = authenticated_client(1)
+        self.account = Account.objects.create(user_id=1, solde=100)
+        # Copie en retard sur la base principale
+        Account.objects.using('replica').create(pk=self.account.pk, user_id=1, solde=1)
+
+    def solde(self, client=None):
+        return (client or self.client_).get(f"/api/{self.account.pk}/").json()['solde']
+
+    def test_reads_use_replica_and_writes_pin_primary(self):
+        self.assertEqual(self.solde(), '1.00')
+        self.assertEqual(Account.objects.get(pk=self.account.pk).solde, 100)
+
+        response = self.client_.post(f"/api/{self.account.pk}/balance/update/", {"action": "withdraw", "amount": "10"})
+        self.assertEqual(response.status_code, 200)
+        # Le retrait a été contrôlé et écrit sur la base principale
+        self.assertEqual(Log.objects.using('replica').count(), 0)
+        self.assertEqual(Log.objects.using('default').get().montant, 10)
+
+        # Le client qui vient d'écrire lit la base principale, les autres le réplica
+        self.assertEqual(self.solde(), '100.00')
+        self.assertEqual(self.solde(authenticated_client(1, token='other-session')), '1.00')
+        # Fin de l'épinglage (REPLICA_PIN_SECONDS écoulées)
+        cache.clear()
+        self.assertEqual(self.solde(authenticated_client(1)), '1.00')
+
+    def test_primary_is_pinned_after_a_write_in_the_same_context(self):
+        from .routers import replica_reads
+        with replica_reads():
+            self.assertEqual(Account.objects.get(pk=self.account.pk).solde, 1)
+            Account.objects.filter(pk=self.account.pk).update(solde=50)
+            self.assertEqual(Account.objects.get(pk=self.account.pk).solde, 50)
+        # Hors requête, tout passe par la base principale
+        self.assertEqual(Account.objects.get(pk=self.account.pk).solde, 50)
+
+
+class RollupTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client_ = authenticated_client(1)
+        self.banker = authenticated_client(99, role='banquier')
+        # Débits en attente du retrait et du virement créés par settle()
+        self.a = Account.objects.create(user_id=1, solde=100, debit_en_attente=70)
+        self.b = Account.objects.create(user_id=2, solde=0, type_compte='epargne')
+
+    def rollups(self):
+        return sorted(MonthlyRollup.objects.values_list('account_id', 'month', 'action', 'count', 'total', 'declined'))
+
+    def settle(self):
+        now = timezone.now()
+        logs = [
+            Log.objects.create(account=self.a, action='depot', montant=20),
+            Log.objects.create(account=self.a, action='retrait', montant=30),
+            Log.objects.create(account=self.a, action='virement_envoye', montant=40, cible=self.b),
+        ]
+        logs += [
+            Log.objects.create(account=self.b, action='virement_recu', montant=40, cible=self.a, origine=logs[2]),
+            Log.objects.create(account=self.a, action='depot', montant=7),
+        ]
+        # Le premier dépôt date du mois précédent
+        Log.objects.filter(pk=logs[0].pk).update(date_action=now - timedelta(days=40))
+        settle_logs(Log.objects.filter(pk__in=[log.pk for log in logs[:3]]))
+        settle_logs(Log.objects.filter(pk=logs[4].pk), approve=False)
+        return month_of(now - timedelta(days=40)), month_of(now)
+
+    def test_settlement_updates_rollups_like_a_rebuild(self):
+        previous, current = self.settle()
+        self.assertEqual(self.rollups(), [
+            (self.a.pk, previous, 'depot', 1, Decimal('20'), 0),
+            (self.a.pk, current, 'depot', 0, Decimal('0'), 1),
+            (self.a.pk, current, 'retrait', 1, Decimal('30'), 0),
+            (self.a.pk, current, 'virement_envoye', 1, Decimal('40'), 0),
+            (self.b.pk, current, 'virement_recu', 1, Decimal('40'), 0),
+        ])
+        incremental = self.rollups()
+        archive_logs(timezone.now() - timedelta(days=30))
+        MonthlyRollup.objects.all().delete()
+        out = StringIO()
+        call_command('rebuild_rollups', '--chunk-size', '1', stdout=out)
+        self.assertIn("2 compte(s)", out.getvalue())
+        self.assertEqual(self.rollups(), incremental)
+
+    def test_account_summary(self):
+        previous, current = self.settle()
+        path = f"/api/{self.a.pk}/summary/"
+        response = self.client_.get(path)
+        self.assertEqual(response.status_code, 200)
+        months = response.json()["months"]
+        self.assertEqual([month["month"] for month in months], [previous.strftime('%Y-%m'), current.strftime('%Y-%m')])
+        self.assertEqual((months[1]["inflow"], months[1]["outflow"], months[1]["net"]), ("0.00", "70.00", "-70.00"))
+        self.assertEqual((months[1]["counts"]["retrait"], months[1]["declined"]), (1, 1))
+
+        path += f"?from={current.strftime('%Y-%m')}"
+        response = self.client_.get(path)
+        self.assertEqual(len(response.json()["months"]), 1)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client_.get(path, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(self.client_.get(f"/api/{self.a.pk}/summary/?to=2024-13").status_code, 400)
+        self.assertEqual(self.client_.get(f"/api/{self.b.pk}/summary/").status_code, 403)
+
+    def test_bank_summary(self):
+        _, current = self.settle()
+        self.assertEqual(self.client_.get("/api/summary/").status_code, 403)
+        data = self.banker.get("/api/summary/", {"from": current.strftime('%Y-%m')}).json()
+        # Les virements internes s'annulent à l'échelle de la banque
+        self.assertEqual([(m["inflow"], m["outflow"], m["net"]) for m in data["months"]], [("40.00", "70.00", "-30.00")])
+        self.assertEqual(data["balances"], [
+            {"type_compte": "courant", "accounts": 1, "solde": "50.00", "debit_en_attente": "0.00"},
+            {"type_compte": "epargne", "accounts": 1, "solde": "40.00", "debit_en_attente": "0.00"},
+        ])
+
+
+class LogSearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.banker = authenticated_client(99, role='banquier')
+        self.a = Account.objects.create(user_id=1, solde=100)
+        self.b = Account.objects.create(user_id=2, solde=0)
+        self.now = timezone.now()
+        rows = [
+            (self.a, 'depot', '20.00', None, "Salaire"),
+            (self.a, 'virement_envoye', '45.50', self.b, "Loyer octobre"),
+            (self.b, 'virement_recu', '45.50', self.a, "Loyer octobre"),
+            (self.a, 'retrait', '45.50', None, None),
+            (self.b, 'depot', '5.00', None, "Loyer remboursé"),
+        ]
+        self.logs = [Log.objects.create(account=account, action=action, montant=Decimal(amount), cible=cible, libele=libele)
+                     for account, action, amount, cible, libele in rows]
+        for days, log in enumerate(reversed(self.logs)):
+            Log.objects.filter(pk=log.pk).update(date_action=self.now - timedelta(days=days))
+
+    def search(self, **params):
+        response = self.banker.get("/api/logs/search/", params)
+        self.assertEqual(response.status_code, 200)
+        return [row["id"] for row in response.json()["results"]]
+
+    def test_combined_filters(self):
+        a, sent, received, withdrawal, refund = [log.pk for log in self.logs]
+        self.assertEqual(self.search(amount="45.5"), [withdrawal, received, sent])
+        self.assertEqual(self.search(amount="45.50", account=self.a.pk, action="virement_envoye"), [sent])
+        self.assertEqual(self.search(cible=self.b.pk), [sent])
+        self.assertEqual(self.search(libele="Loyer"), [refund, received, sent])
+        self.assertEqual(self.search(libele="Loyer o", account=self.b.pk), [received])
+        bazar = Log.objects.create(account=self.a, action='depot', montant=1, libele="Bazar").pk
+        Log.objects.create(account=self.a, action='depot', montant=1, libele="Bb")
+        self.assertEqual(self.search(libele="Baz"), [bazar])
+        self.assertEqual(self.search(min_amount="10", max_amount="30"), [a])
+        since = (self.now - timedelta(days=1, hours=1)).isoformat()
+        self.assertEqual(self.search(**{"from": since, "account": self.b.pk}), [refund])
+
+    def test_pagination_and_errors(self):
+        seen, url = [], "/api/logs/search/?min_amount=1&page_size=2"
+        while url:
+            data = self.banker.get(url).json()
+            seen += [row["id"] for row in data["results"]]
+            url = data["next"]
+        self.assertEqual(seen, [log.pk for log in reversed(self.logs)])
+        for params in ({"amount": "abc"}, {"action": "vol"}, {"account": "x"}, {"from": "hier"}):
+            response = self.banker.get("/api/logs/search/", params)
+            self.assertEqual((response.status_code, response.json()), (400, {"res": "Invalid search parameters"}))
+        self.assertEqual(authenticated_client(1).get("/api/logs/search/").status_code, 403)
+
+    @unittest.skipUnless(connection.vendor == 'sqlite', "format des plans d'exécution propre à SQLite")
+    def test_every_filter_combination_uses_an_index(self):
+        values = {
+            'account': self.a.pk, 'cible': self.b.pk, 'actions': {'depot'}, 'amount': Decimal('5'),
+            'min_amount': Decimal('1'), 'max_amount': Decimal('50'), 'start': self.now - timedelta(days=2),
+            'end': self.now, 'libele': "Loyer",
+        }
+        names = list(values)
+        for mask in range(1 << len(names)):
+            filters = {name: values[name] for i, name in enumerate(names) if mask & (1 << i)}
+            plan = search_logs(**filters).order_by('-date_action', '-id')[:51].explain()
+            # Une lecture de la table sans index apparaît comme « SCAN apiargent_log » seul
+            self.assertNotRegex(plan, r'SCAN apiargent_log(?! USING)', filters)
+            self.assertRegex(plan, r'USING (COVERING )?INDEX log_', filters)
+
+
+@unittest.skipIf(compact_ledger(), "base de test déjà au format compact")
+class CompactLedgerTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.client_ = authenticated_client(1)
+        self.banker = authenticated_client(99, role='banquier')
+        self.a = Account.objects.create(user_id=1, solde=100, debit_en_attente=Decimal('12.34'))
+        self.b = Account.objects.create(user_id=2, solde=0)
+        create_transfer(self.a.pk, self.b.pk, Decimal('12.34'), libele="Loyer")
+        Log.objects.create(account=self.a, action='depot', montant=Decimal('0.05'))
+        settle_logs(Log.objects.filter(action='virement_envoye'))
+        Log.objects.filter(action='depot').update(date_action=timezone.now() - timedelta(days=400))
+        settle_logs(Log.objects.filter(action='depot'), approve=False)
+        archive_logs(timezone.now() - timedelta(days=365))
+        # Retour au format décimal même si le test échoue
+        self.addCleanup(call_command, 'compact_ledger', '--revert', stdout=StringIO())
+
+    def responses(self):
+        paths = [f"/api/{self.a.pk}/logs/", f"/api/{self.b.pk}/logs/", f"/api/{self.a.pk}/statement/?output=ndjson",
+                 "/api/logs/search/?amount=12.34&action=virement_envoye,virement_recu", "/api/summary/"]
+        return [b''.join(response) if response.streaming else response.content
+                for response in (self.banker.get(path) for path in paths)]
+
+    def test_startup_refuses_a_mismatched_setting(self):
+        ensure_ledger_storage()
+        with override_settings(COMPACT_LEDGER=True):
+            with self.assertRaisesMessage(ImproperlyConfigured, "apiargent_log (decimal)"):
+                ensure_ledger_storage()
+            with self.assertRaises(ImproperlyConfigured):
+                call_command('settlement_worker', '--once', stdout=StringIO())
+        call_command('compact_ledger', stdout=StringIO())
+        with override_settings(COMPACT_LEDGER=True):
+            ensure_ledger_storage()
+        with self.assertRaisesMessage(ImproperlyConfigured, "apiargent_archivedlog (compact)"):
+            ensure_ledger_storage()
+
+    def test_online_conversion_keeps_values_and_json(self):
+        before = self.responses()
+        call_command('compact_ledger', '--backfill-only', stdout=StringIO())
+        self.assertEqual(storage(Log), DECIMAL)
+        # Log écrit pendant le remplissage en ligne : converti au remplacement des colonnes
+        late = Log.objects.create(account=self.b, action='retrait', montant=Decimal('7.10'))
+
+        out = StringIO()
+        call_command('compact_ledger', stdout=out)
+        self.assertIn("COMPACT_LEDGER = True", out.getvalue())
+        self.assertEqual((storage(Log), storage(ArchivedLog)), (COMPACT, COMPACT))
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT action, montant FROM apiargent_log WHERE id = %s", [late.pk])
+            self.assertEqual(tuple(cursor.fetchone()), (2, 710))
+
+        with override_settings(COMPACT_LEDGER=True):
+            self.assertEqual(Log.objects.get(pk=late.pk).montant, Decimal('7.10'))
+            Log.objects.filter(pk=late.pk).delete()
+            self.assertEqual(self.responses(), before)
+            self.assertEqual(self.client_.post(f"/api/{self.a.pk}/balance/update/", {"action": "deposit", "amount": "2.50"}).status_code, 200)
+            self.assertEqual(Log.objects.filter(action='depot', montant__gt=Decimal('2.49')).values_list('montant', flat=True).get(),
+                             Decimal('2.50'))
+
+        call_command('compact_ledger', '--revert', stdout=StringIO())
+        self.assertEqual(storage(Log), DECIMAL)
+        self.assertEqual(Log.objects.get(action='depot').montant, Decimal('2.50'))
+
+
+class SettlementQueueTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.banker = authenticated_client(99, role='banquier')
+        self.a = Account.objects.create(user_id=1, solde=50, debit_en_attente=70)
+
+    def test_http_validation_is_queued_then_settled_by_the_worker(self):
+        deposit = Log.objects.create(account=self.a, action='depot', montant=25)
+        withdrawal = Log.objects.create(account=self.a, action='retrait', montant=70)
+        response = self.banker.post(f"/api/validate-action/{deposit.pk}/")
+        self.assertEqual((response.status_code, response.data["res"]), (202, "Action queued"))
+        job_url = f"/api/settlement-jobs/{response.data['job']}/"
+        self.assertEqual(self.banker.get(job_url).data["status"], "pending")
+        response = self.banker.post("/api/process-pending-actions/", {"decision": "validate", "ids": [withdrawal.pk, 12345]}, format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data["results"], [{"id": withdrawal.pk, "res": "queued"}, {"id": 12345, "res": "not_found"}])
+        # Rien n'est réglé avant le passage du worker
+        self.assertIsNone(Log.objects.get(pk=deposit.pk).date_valeur)
+
+        out = StringIO()
+        call_command('settlement_worker', '--once', '--batch-size', '1', stdout=out)
+        self.assertIn("2 demande(s) traitée(s)", out.getvalue())
+        self.assertEqual(self.banker.get(job_url).data, {"id": int(job_url.split('/')[-2]), "log": deposit.pk,
+                                                         "decision": "validate", "status": "done", "res": "validated"})
+        self.assertEqual(SettlementJob.objects.get(log=withdrawal).outcome, 'validated')
+        self.a.refresh_from_db()
+        self.assertEqual((self.a.solde, self.a.debit_en_attente), (Decimal('5'), Decimal('0')))
+
+    def test_worker_settlement_reaches_the_web_workers(self):
+        # Le worker écrit invalidations et événements dans les fichiers lus par les workers web
+        project_settings = importlib.import_module('apiproject.settings')
+        locations = [config['LOCATION'] for config in project_settings.CACHES.values()] + [project_settings.EVENTS_LOCATION]
+        self.assertEqual({os.path.dirname(path) for path in locations}, {project_settings.SHARED_STATE_DIR})
+        self.assertEqual(journal.path, settings.EVENTS_LOCATION)
+
+        log = Log.objects.create(account=self.a, action='retrait', montant=70)
+        self.assertEqual([row['id'] for row in self.banker.get("/api/pending-actions/").json()], [log.pk])
+        generation, start = current_generation(PENDING_ACTIONS), journal.last_id()
+        self.banker.post(f"/api/decline-action/{log.pk}/")
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('settlement_worker', '--once', stdout=StringIO())
+        self.assertNotEqual(current_generation(PENDING_ACTIONS), generation)
+        self.assertEqual(self.banker.get("/api/pending-actions/").json(), [])
+        self.assertEqual([(event.kind, json.loads(event.data)) for event in journal.since(start)],
+                         [('declined', {'ids': [log.pk]})])
+
+    def test_first_request_wins_whatever_the_batch_size(self):
+        for batch_size in (1, 10):
+            log = Log.objects.create(account=self.a, action='depot', montant=5)
+            self.banker.post(f"/api/validate-action/{log.pk}/")
+            self.banker.post(f"/api/decline-action/{log.pk}/")
+            while process_jobs(batch_size):
+                pass
+            jobs = SettlementJob.objects.filter(log=log).order_by('id')
+            self.assertEqual([job.outcome for job in jobs], ['validated', 'not_found'])
+            self.assertFalse(Log.objects.get(pk=log.pk).refuse)
+
+    def test_duplicate_and_settled_requests(self):
+        log = Log.objects.create(account=self.a, action='depot', montant=5)
+        self.banker.post(f"/api/decline-action/{log.pk}/")
+        self.banker.post(f"/api/validate-action/{log.pk}/")
+        self.assertEqual(process_jobs(), 2)
+        # Le refus passe avant la validation du même paquet
+        self.assertEqual(list(SettlementJob.objects.order_by('id').values_list('outcome', flat=True)), ['declined', 'not_found'])
+        self.assertEqual(self.banker.post(f"/api/validate-action/{log.pk}/").status_code, 404)
+        self.assertEqual(process_jobs(), 0)
+
+    @override_settings(AUTO_APPROVAL_RULES=[{'action': 'depot', 'max_amount': '100'}])
+    def test_auto_approval_rules(self):
+        small = [Log.objects.create(account=self.a, action='depot', montant=10) for _ in range(3)]
+        large = Log.objects.create(account=self.a, action='depot', montant=500)
+        withdrawal = Log.objects.create(account=self.a, action='retrait', montant=1)
+        self.assertEqual(auto_approve(batch_size=2), (2, (small[1].date_action, small[1].pk)))
+        self.assertEqual(auto_approve(batch_size=2, after=(small[1].date_action, small[1].pk)), (1, None))
+        self.assertEqual(auto_approve(batch_size=2), (0, None))
+        pending = set(Log.objects.filter(date_valeur__isnull=True).values_list('id', flat=True))
+        self.assertEqual(pending, {large.pk, withdrawal.pk})
+        self.a.refresh_from_db()
+        self.assertEqual(self.a.solde, Decimal('80'))
+        with override_settings(AUTO_APPROVAL_RULES=[{'max_amount': '100'}]):
+            with self.assertRaises(ImproperlyConfigured):
+                auto_approve()
+
+
+class IdempotencyTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        caches['idempotency'].clear()
+        self.client_ = authenticated_client(1)
+        self.account = Account.objects.create(user_id=1, solde=100)
+        self.other = Account.objects.create(user_id=2, solde=0)
+
+    def post(self, url, data, key, client=None):
+        return (client or self.client_).post(url, data, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_the_stored_response(self):
+        url = f"/api/{self.account.pk}/virement/"
+        data = {"target_account_id": self.other.pk, "amount": "30"}
+        first = self.post(url, data, 'retry-1')
+        retry = self.post(url, data, 'retry-1')
+        self.assertEqual((first.status_code, retry.status_code), (200, 200))
+        self.assertEqual(retry.data, first.data)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Log.objects.filter(account=self.account).count(), 1)
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.debit_en_attente, Decimal('30'))
+
+        # Une autre clé, ou une requête sans clé, s'exécute de nouveau
+        self.post(url, data, 'retry-2')
+        self.client_.post(url, data, format='json')
+        self.assertEqual(Log.objects.filter(account=self.account).count(), 3)
+
+    def test_keys_are_scoped_and_checked(self):
+        url = f"/api/{self.account.pk}/balance/update/"
+        self.assertEqual(self.post(url, {"action": "deposit", "amount": "10"}, 'k').status_code, 200)
+        response = self.post(url, {"action": "deposit", "amount": "20"}, 'k')
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(self.post(url, {"action": "deposit", "amount": "10"}, 'x' * 256).status_code, 400)
+        # Les réponses d'erreur client sont rejouées elles aussi
+        self.assertEqual(self.post(url, {"action": "bogus", "amount": "10"}, 'bad').status_code, 400)
+        self.assertEqual(self.post(url, {"action": "bogus", "amount": "10"}, 'bad')['Idempotent-Replayed'], 'true')
+        # Même clé pour un autre utilisateur : requête distincte
+        other_client = authenticated_client(2)
+        self.post("/api/request-new-account/", {"type_compte": "courant"}, 'k', client=other_client)
+        self.post("/api/request-new-account/", {"type_compte": "courant"}, 'k', client=other_client)
+        self.post("/api/request-new-account/", {"type_compte": "courant"}, 'k')
+        self.assertEqual(Account.objects.filter(statut='en_creation').count(), 2)
+        self.assertEqual(Log.objects.filter(account=self.account).count(), 1)
+
+    def test_concurrent_duplicates_wait_for_the_first_request(self):
+        calls = []
+        results = []
+        start = threading.Barrier(8)
+
+        def execute():
+            calls.append(1)
+            time.sleep(0.2)
+            return 200, {"res": "Transfer successful"}
+
+        def worker():
+            start.wait()
+            results.append(run_once('concurrent', b'fp', execute)[:2])
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [(200, {"res": "Transfer successful"})] * 8)
+
+    def test_in_progress_and_failed_requests(self):
+        store = caches['idempotency']
+        store.add('idempotency_busy_lock', 1, 30)
+        wait, idempotency.IDEMPOTENCY_WAIT = idempotency.IDEMPOTENCY_WAIT, 0
+        try:
+            with self.assertRaises(KeyInProgress):
+                run_once('busy', b'fp', lambda: (200, {}))
+        finally:
+            idempotency.IDEMPOTENCY_WAIT = wait
+        # Une erreur serveur n'est pas conservée : la requête suivante s'exécute
+        self.assertEqual(run_once('flaky', b'fp', lambda: (503, {}))[2], False)
+        self.assertEqual(run_once('flaky', b'fp', lambda: (200, {"ok": 1})), (200, {"ok": 1}, False))
+        self.assertEqual(run_once('flaky', b'fp', lambda: (500, {})), (200, {"ok": 1}, True))
@@ -3,18 +3,26 @@ from django.urls import path
 from . import views
 
 urlpatterns = [
-    path('api/', views.AccountView.as_view()),
-    path("api/<int:id>/", views.AccountDetailView.as_view()),
-    path("api/list/", views.UserAccountsView.as_view()),
-    path("api/list/<int:id>/", views.UserAccountsViewById.as_view()),
-    path("api/<int:id>/balance/update/", views.AccountBalanceUpdateView.as_view()),
-    path("api/<int:id>/logs/", views.AccountLogView.as_view()),
-    path("api/<int:id>/logs/<int:nombre>/", views.AccountLogView.as_view()),
-    path("api/<int:id>/virement/", views.AccountVirementView.as_view()),
-    path("api/pending-actions/", views.PendingActionsView.as_view()),
-    path("api/validate-action/<int:id>/", views.ValidateActionView.as_view()),
-    path("api/decline-action/<int:id>/", views.DeclineActionView.as_view()),
-    path("api/change-account-state/<int:id>/", views.ChangeAccountStateView.as_view()),
-    path("api/list-process-created-accounts/", views.ListCreatedProcessAccountsView.as_view()),
-    path("api/request-new-account/", views.RequestNewAccountView.as_view()),
+    path('api/', views.AccountView.as_view(), name='account-list'),
+    path("api/<int:id>/", views.AccountDetailView.as_view(), name='account-detail'),
+    path("api/list/", views.UserAccountsView.as_view(), name='user-accounts'),
+    path("api/list/<int:id>/", views.UserAccountsViewById.as_view(), name='user-accounts-by-id'),
+    path("api/<int:id>/balance/update/", views.AccountBalanceUpdateView.as_view(), name='account-balance-update'),
+    path("api/<int:id>/logs/", views.AccountLogView.as_view(), name='account-logs'),
+    path("api/<int:id>/logs/<int:nombre>/", views.AccountLogView.as_view(), name='account-logs-limited'),
+    path("api/<int:id>/statement/", views.AccountStatementView.as_view(), name='account-statement'),
+    path("api/<int:id>/summary/", views.AccountSummaryView.as_view(), name='account-summary'),
+    path("api/<int:id>/virement/", views.AccountVirementView.as_view(), name='account-transfer'),
+    path("api/logs/search/", views.LogSearchView.as_view(), name='log-search'),
+    path("api/batch/", views.BatchOperationsView.as_view(), name='batch-operations'),
+    path("api/summary/", views.BankSummaryView.as_view(), name='bank-summary'),
+    path("api/pending-actions/", views.PendingActionsView.as_view(), name='pending-actions'),
+    path("api/validate-action/<int:id>/", views.ValidateActionView.as_view(), name='validate-action'),
+    path("api/decline-action/<int:id>/", views.DeclineActionView.as_view(), name='decline-action'),
+    path("api/process-pending-actions/", views.ProcessPendingActionsView.as_view(), name='process-pending-actions'),
+    path("api/settlement-jobs/<int:id>/", views.SettlementJobView.as_view(), name='settlement-job'),
+    path("api/change-account-state/<int:id>/", views.ChangeAccountStateView.as_view(), name='change-account-state'),
+    path("api/list-process-created-accounts/", views.ListCreatedProcessAccountsView.as_view(), name='list-created-accounts'),
+    path("api/request-new-account/", views.RequestNewAccountView.as_view(), name='request-new-account'),
+    path("metrics/", views.MetricsView.as_view(), name='metrics'),
 ]
\ No newline at end of file
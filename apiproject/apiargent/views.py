@@ -1,13 +1,42 @@
 from decimal import Decimal
 
+from django.conf import settings
+from django.db.models import F
+from django.http import HttpResponse
 from django.shortcuts import render
 from rest_framework import status, permissions
 from rest_framework.authentication import TokenAuthentication
+from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from .Serializer import AccountSerializer, LogSerializer
-from .models import Account, Log
+from .Serializer import AccountSerializer, account_values_serializer, log_values_serializer
+from .archive import get_checkpoint, merge_history
+from .conditional import account_versions, conditional
+from .idempotency import idempotent
+from .models import Account, ArchivedLog, Log, SettlementJob
+from .loaders import account_loader
+from .metrics import registry, render_prometheus
+from .pagination import AccountLogPagination, LogSearchPagination, PendingActionsPagination
+from .renderers import FastJSONRenderer
+from .response_cache import CREATED_ACCOUNTS, PENDING_ACTIONS, cached_response, invalidate
+from .rollups import account_summary, balances_by_type, bank_summary, parse_month
+from .search import search_logs, search_options
+from .settlement import enqueue, enqueue_one, queue_enabled
+from .services import (
+    CREATED,
+    INSUFFICIENT_FUNDS,
+    INVALID_ACTION,
+    NOT_FOUND,
+    InsufficientFunds,
+    create_deposit,
+    create_transfer,
+    create_withdrawal,
+    settle_logs,
+    submit_batch,
+)
+from .statements import STATEMENT_FIELDS, iter_statement, statement_options
+from .streaming import serialize_iter, streaming_response
 
 class PermissionSelfOrBanquier(permissions.BasePermission):
     def has_permission(self, request, view):
@@ -25,7 +54,7 @@ class PermissionSelfAccount(permissions.BasePermission):
     def has_permission(self, request, view):
         account_id = view.kwargs.get('id')
         try:
-            account = Account.objects.get(pk=account_id)
+            account = account_loader(request).get(account_id)
             return request.user.id == account.user_id
         except Account.DoesNotExist:
             return False
@@ -34,58 +63,111 @@ class PermissionSelfAccountOrBanquier(permissions.BasePermission):
     def has_permission(self, request, view):
         account_id = view.kwargs.get('id')
         try:
-            account = Account.objects.get(pk=account_id)
+            account = account_loader(request).get(account_id)
             return request.user.id == account.user_id or request.user.role == 'banquier' or request.user.role == 'administrateur'
         except Account.DoesNotExist:
             return False
 
+ACCOUNT_FILTER_FIELDS = ('user_id', 'type_compte', 'statut')
+
+# Vues de liste : sérialisation par ValuesSerializer et rendu JSON rapide
+LIST_RENDERER_CLASSES = [FastJSONRenderer, BrowsableAPIRenderer]
+
+# Nombre maximal d'opérations par lot (BatchOperationsView)
+BATCH_MAX_OPERATIONS = getattr(settings, 'BATCH_MAX_OPERATIONS', 10000)
+
+def account_list_filter(params):
+    """
+    Comptes filtrés (?user_id=..., ?type_compte=..., ?statut=...) et paginés
+    par id (?after_id=...&limit=...) : retourne (queryset trié sur l'id,
+    limite ou None). La limite est appliquée par l'appelant, le mode flux
+    lisant les comptes par paquets d'ids. Lève ValueError si un paramètre est invalide.
+    """
+    accounts = Account.objects.all().order_by('id')
+
+    filters = {field: params[field] for field in ACCOUNT_FILTER_FIELDS if field in params}
+    if filters:
+        accounts = accounts.filter(**filters)
+
+    after_id = params.get("after_id")
+    if after_id is not None:
+        accounts = accounts.filter(id__gt=int(after_id))
+    limit = params.get("limit")
+    if limit is not None:
+        limit = max(int(limit), 0)
+    return accounts, limit
+
 class AccountView(APIView):
+    renderer_classes = LIST_RENDERER_CLASSES
+
     def get(self, request, *args, **kwargs):
-        users = Account.objects.all()
-        serializer = AccountSerializer(users, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        try:
+            users, limit = account_list_filter(request.query_params)
+        except ValueError:
+            return Response({"res": "Invalid filter or paging parameters"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        # Mode flux : ?stream=json (tableau JSON) ou ?stream=ndjson (un compte par ligne)
+        stream = request.query_params.get("stream")
+        if stream in ('json', 'ndjson'):
+            return streaming_response(serialize_iter(users, AccountSerializer, limit=limit), fmt=stream)
+
+        if limit is not None:
+            users = users[:limit]
+
+        return Response(account_values_serializer.serialize(users), status=status.HTTP_200_OK)
 
 class UserAccountsView(APIView):
     permission_classes = [permissions.IsAuthenticated]
+    renderer_classes = LIST_RENDERER_CLASSES
 
     def get(self, request, *args, **kwargs):
         id = request.user.id
-        accounts = Account.objects.filter(user_id=id)
-        serializer = AccountSerializer(accounts, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        accounts = list(account_values_serializer.values(Account.objects.filter(user_id=id), 'version'))
+
+        etag, not_modified = conditional(request, account_versions(accounts))
+        if not_modified:
+            return not_modified
+        return Response(account_values_serializer.serialize(accounts), status=status.HTTP_200_OK, headers={'ETag': etag})
 
 class UserAccountsViewById(APIView):
     permission_classes = [permissions.IsAuthenticated, PermissionBanquier]
+    renderer_classes = LIST_RENDERER_CLASSES
 
     def get(self, request, id, *args, **kwargs):
         try:
-            accounts = Account.objects.filter(user_id=id).exclude(action="virement_recu")
+            accounts = Account.objects.filter(user_id=id)
         except Account.DoesNotExist:
             return Response({"res": "Object with id does not exist"},
                             status=status.HTTP_400_BAD_REQUEST)
 
-        serializer = AccountSerializer(accounts, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return Response(account_values_serializer.serialize(accounts), status=status.HTTP_200_OK)
 
 class AccountDetailView(APIView):
     permission_classes = [permissions.IsAuthenticated, PermissionSelfAccountOrBanquier]
 
     def get(self, request, id, *args, **kwargs):
         try:
-            account = Account.objects.get(pk=id)
+            account = account_loader(request).get(id)
         except Account.DoesNotExist:
             return Response({"res": "Object with id does not exist"},
                             status=status.HTTP_400_BAD_REQUEST)
 
+        # Compte déjà chargé par la permission : un client à jour reçoit 304 sans autre requête
+        etag, not_modified = conditional(request, account.version)
+        if not_modified:
+            return not_modified
+
         serializer = AccountSerializer(account)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return Response(serializer.data, status=status.HTTP_200_OK, headers={'ETag': etag})
 
 class AccountBalanceUpdateView(APIView):
     permission_classes = [permissions.IsAuthenticated, PermissionSelfAccount]
 
+    @idempotent
     def post(self, request, id, *args, **kwargs):
         try:
-            account = Account.objects.get(pk=id)
+            account = account_loader(request).get(id)
         except Account.DoesNotExist:
             return Response({"res": "Object with id does not exist"},
                             status=status.HTTP_400_BAD_REQUEST)
@@ -93,57 +175,196 @@ class AccountBalanceUpdateView(APIView):
         action = request.data.get("action")
         amount = Decimal(request.data.get("amount", 0))
 
+        # Un montant négatif fausserait les fonds réservés
+        if amount <= 0:
+            return Response({"res": "Le montant doit être positif"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
         if action == "deposit":
             # Création d'un log pour le dépôt
-            Log.objects.create(
-                account=account,
-                action='depot',
-                montant=amount
-            )
+            create_deposit(account.pk, amount)
         elif action == "withdraw":
-            if account.solde < amount:
+            # Réservation du montant sur le solde disponible et création du log de retrait
+            try:
+                create_withdrawal(account.pk, amount)
+            except InsufficientFunds:
                 return Response({"res": "Insufficient funds"},
                                 status=status.HTTP_400_BAD_REQUEST)
-            # Création d'un log pour le retrait
-            Log.objects.create(
-                account=account,
-                action='retrait',
-                montant=amount
-            )
         else:
             return Response({"res": "Invalid action"},
                             status=status.HTTP_400_BAD_REQUEST)
 
-        account.save()
         serializer = AccountSerializer(account)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
+class BatchOperationsView(APIView):
+    """
+    Dépôts, retraits et virements en lot : {"operations": [{"action":
+    "deposit" | "withdraw" | "transfer", "account_id": 1, "amount": "10.00",
+    "target_account_id": 2, "libele": "..."}, ...]}.
+
+    Chaque opération reçoit son propre résultat (``created`` avec l'id du log,
+    ou la raison du refus) ; les opérations valides sont enregistrées même si
+    d'autres sont refusées. Un client ne peut débiter ou créditer que ses
+    propres comptes, un banquier tous les comptes.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    @idempotent
+    def post(self, request, *args, **kwargs):
+        operations = request.data.get("operations") if isinstance(request.data, dict) else None
+        if not isinstance(operations, list) or not operations:
+            return Response({"res": "Provide a list of operations"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if len(operations) > BATCH_MAX_OPERATIONS:
+            return Response({"res": f"At most {BATCH_MAX_OPERATIONS} operations per batch"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        owner_id = None if request.user.role in ('banquier', 'administrateur') else request.user.id
+        results = []
+        created = 0
+        for index, (outcome, log) in enumerate(submit_batch(operations, owner_id=owner_id)):
+            if outcome == CREATED:
+                created += 1
+                results.append({"index": index, "res": outcome, "id": log.pk})
+            else:
+                results.append({"index": index, "res": outcome})
+
+        return Response({"res": "Batch processed", "created": created, "failed": len(results) - created,
+                         "results": results}, status=status.HTTP_200_OK)
+
+
 class AccountLogView(APIView):
     permission_classes = [permissions.IsAuthenticated, PermissionSelfAccountOrBanquier]
+    renderer_classes = LIST_RENDERER_CLASSES
 
     def get(self, request, id, nombre=None, *args, **kwargs):
         try:
-            # Vérifier si le compte existe
-            account = Account.objects.get(pk=id)
+            # Vérifier si le compte existe (déjà chargé par la permission)
+            account = account_loader(request).get(id)
+
+            etag, not_modified = conditional(request, account.version)
+            if not_modified:
+                return not_modified
 
             # Récupérer tous les logs du compte triés par date (du plus récent au plus ancien)
-            logs = Log.objects.filter(account=account).order_by('-date_action')
+            logs = log_values_serializer.values(Log.objects.filter(account_id=account.pk).order_by('-date_action', '-id'))
+
+            # Historique archivé, lu seulement quand les logs demandés l'atteignent
+            checkpoint = get_checkpoint(account)
+            archived_until = checkpoint.archived_until if checkpoint else None
+            archived = log_values_serializer.values(
+                ArchivedLog.objects.filter(account_id=account.pk).order_by('-date_action', '-id')
+            )
+
+            # Pagination par curseur si le client la demande (?cursor=... ou ?page_size=...)
+            paginator = AccountLogPagination()
+            if paginator.is_requested(request):
+                page = paginator.paginate_queryset(logs, request, view=self, archive=archived, archived_until=archived_until)
+                response = paginator.get_paginated_response(log_values_serializer.serialize(page))
+                response['ETag'] = etag
+                return response
 
             # Limiter le nombre de résultats si un nombre est spécifié
-            if nombre and isinstance(nombre, int) and nombre > 0:
-                logs = logs[:nombre]
+            limit = nombre if nombre and isinstance(nombre, int) and nombre > 0 else None
+            if limit is not None:
+                logs = logs[:limit]
+
+            rows = merge_history(list(logs), archived, limit, archived_until)
+            return Response(log_values_serializer.serialize(rows), status=status.HTTP_200_OK, headers={'ETag': etag})
 
-            serializer = LogSerializer(logs, many=True)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+        except Account.DoesNotExist:
+            return Response({"res": "Compte introuvable"},
+                            status=status.HTTP_404_NOT_FOUND)
+
+class LogSearchView(APIView):
+    """Recherche paginée dans les logs courants (filtres combinables, voir apiargent/search.py)."""
+    permission_classes = [permissions.IsAuthenticated, PermissionBanquier]
+    renderer_classes = LIST_RENDERER_CLASSES
+
+    def get(self, request, *args, **kwargs):
+        try:
+            options = search_options(request.query_params)
+        except ValueError:
+            return Response({"res": "Invalid search parameters"},
+                            status=status.HTTP_400_BAD_REQUEST)
 
+        logs = log_values_serializer.values(search_logs(**options))
+        paginator = LogSearchPagination()
+        page = paginator.paginate_queryset(logs, request, view=self)
+        return paginator.get_paginated_response(log_values_serializer.serialize(page))
+
+class AccountStatementView(APIView):
+    permission_classes = [permissions.IsAuthenticated, PermissionSelfAccountOrBanquier]
+
+    def get(self, request, id, *args, **kwargs):
+        try:
+            account = account_loader(request).get(id)
+        except Account.DoesNotExist:
+            return Response({"res": "Compte introuvable"},
+                            status=status.HTTP_404_NOT_FOUND)
+
+        # ?output=csv|ndjson, ?field=date_action|date_valeur, ?from=..., ?to=..., ?action=depot,retrait
+        output = request.query_params.get("output", "csv")
+        try:
+            if output not in ('csv', 'ndjson'):
+                raise ValueError(output)
+            options = statement_options(request.query_params)
+        except ValueError:
+            return Response({"res": "Invalid statement parameters"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        response = streaming_response(iter_statement(account, **options), fmt=output, fields=STATEMENT_FIELDS)
+        response['Content-Disposition'] = f'attachment; filename="releve_{account.pk}.{output}"'
+        return response
+
+def summary_period(params):
+    """Mois de début et de fin (?from=AAAA-MM&to=AAAA-MM, inclus). Lève ValueError si un paramètre est invalide."""
+    return parse_month(params.get("from")), parse_month(params.get("to"))
+
+class AccountSummaryView(APIView):
+    """Entrées, sorties et nombre d'actions du compte mois par mois, lus sur les agrégats mensuels."""
+    permission_classes = [permissions.IsAuthenticated, PermissionSelfAccountOrBanquier]
+
+    def get(self, request, id, *args, **kwargs):
+        try:
+            account = account_loader(request).get(id)
         except Account.DoesNotExist:
             return Response({"res": "Compte introuvable"},
                             status=status.HTTP_404_NOT_FOUND)
+        try:
+            start, end = summary_period(request.query_params)
+        except ValueError:
+            return Response({"res": "Invalid summary parameters"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        # Chaque règlement incrémente la version du compte avec ses agrégats
+        etag, not_modified = conditional(request, account.version)
+        if not_modified:
+            return not_modified
+
+        return Response({"account": account.pk, "months": account_summary(account.pk, start, end)},
+                        status=status.HTTP_200_OK, headers={'ETag': etag})
+
+class BankSummaryView(APIView):
+    """Totaux mensuels de la banque (agrégats mensuels) et soldes par type de compte."""
+    permission_classes = [permissions.IsAuthenticated, PermissionBanquier]
+
+    def get(self, request, *args, **kwargs):
+        try:
+            start, end = summary_period(request.query_params)
+        except ValueError:
+            return Response({"res": "Invalid summary parameters"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({"months": bank_summary(start, end), "balances": balances_by_type()},
+                        status=status.HTTP_200_OK)
 
 class AccountVirementView(APIView):
     permission_classes = [permissions.IsAuthenticated, PermissionSelfAccountOrBanquier]
 
+    @idempotent
     def post(self, request, id, *args, **kwargs):
         source_account_id = id
         target_account_id = request.data.get("target_account_id")
@@ -155,131 +376,154 @@ class AccountVirementView(APIView):
             return Response({"res": "Le montant doit être positif"},
                             status=status.HTTP_400_BAD_REQUEST)
 
-        try:
-            source_account = Account.objects.get(pk=source_account_id)
-            target_account = Account.objects.get(pk=target_account_id)
+        # Utiliser abs() pour garantir que le montant est positif (sécurité supplémentaire)
+        amount = abs(amount)
 
-            if source_account.solde < amount:
-                return Response({"res": "Insufficient funds"},
-                                status=status.HTTP_400_BAD_REQUEST)
-
-            # Utiliser abs() pour garantir que le montant est positif (sécurité supplémentaire)
-            amount = abs(amount)
-
-            # Enregistrer les logs pour les deux comptes
-            Log.objects.create(
-                account=source_account,
-                action='virement_envoye',
-                montant=amount,
-                cible=target_account,
-                libele=libele
-            )
-            Log.objects.create(
-                account=target_account,
-                action='virement_recu',
-                montant=amount,
-                cible=source_account,
-                libele=libele
-            )
-
-            source_account.save()
-            target_account.save()
-
-            return Response({"res": "Transfer successful"}, status=status.HTTP_200_OK)
-
-        except Account.DoesNotExist:
+        try:
+            target_account_id = int(target_account_id)
+            # Verrouillage des deux comptes, contrôle du solde et écriture des deux logs en une transaction
+            create_transfer(source_account_id, target_account_id, amount, libele)
+        except (Account.DoesNotExist, TypeError, ValueError):
             return Response({"res": "One or both accounts do not exist"},
                             status=status.HTTP_404_NOT_FOUND)
+        except InsufficientFunds:
+            return Response({"res": "Insufficient funds"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({"res": "Transfer successful"}, status=status.HTTP_200_OK)
 
 class PendingActionsView(APIView):
     permission_classes = [permissions.IsAuthenticated, PermissionBanquier]
+    renderer_classes = LIST_RENDERER_CLASSES
 
     def get(self, request, *args, **kwargs):
-        pending_logs = Log.objects.filter(date_valeur__isnull=True).exclude(action="virement_recu").order_by('date_action')
-        serializer = LogSerializer(pending_logs, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return cached_response(PENDING_ACTIONS, self, request, lambda: self.build(request))
+
+    def build(self, request):
+        pending_logs = log_values_serializer.values(
+            Log.objects.filter(date_valeur__isnull=True).exclude(action="virement_recu").order_by('date_action')
+        )
+
+        paginator = PendingActionsPagination()
+        if paginator.is_requested(request):
+            page = paginator.paginate_queryset(pending_logs, request, view=self)
+            return paginator.get_paginated_response(log_values_serializer.serialize(page))
+
+        return Response(log_values_serializer.serialize(pending_logs), status=status.HTTP_200_OK)
+
+def queued_response(job):
+    """Réponse d'une validation ou d'un refus mis en file (``job`` None : log introuvable ou déjà réglé)."""
+    if job is None:
+        return Response({"res": "Log not found or already processed"},
+                        status=status.HTTP_404_NOT_FOUND)
+    return Response({"res": "Action queued", "job": job.pk}, status=status.HTTP_202_ACCEPTED)
 
 class ValidateActionView(APIView):
     permission_classes = [permissions.IsAuthenticated, PermissionBanquier]
 
     def post(self, request, id, *args, **kwargs):
-        try:
-            log = Log.objects.get(pk=id, date_valeur__isnull=True)
-        except Log.DoesNotExist:
-            return Response({"res": "Log not found or already processed"},
-                            status=status.HTTP_404_NOT_FOUND)
-
-        type_action = log.action
+        if queue_enabled():
+            return queued_response(enqueue_one(id, approve=True, requested_by=request.user.id))
 
-        if type_action == "virement_envoye":
-            source_account = log.account
-            target_account = log.cible
-            amount = log.montant
+        outcome = settle_logs(Log.objects.filter(pk=id), approve=True).get(id)
 
-            if source_account.solde < amount:
-                return Response({"res": "Insufficient funds for the transfer"},
-                                status=status.HTTP_400_BAD_REQUEST)
-
-            source_account.solde -= amount
-            target_account.solde += amount
+        if outcome is None:
+            return Response({"res": "Log not found or already processed"},
+                            status=status.HTTP_404_NOT_FOUND)
+        if outcome == INSUFFICIENT_FUNDS:
+            operation = "transfer" if Log.objects.filter(pk=id, action="virement_envoye").exists() else "withdrawal"
+            return Response({"res": f"Insufficient funds for the {operation}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if outcome == INVALID_ACTION:
+            return Response({"res": "Transfer target account no longer exists, action refused"},
+                            status=status.HTTP_400_BAD_REQUEST)
 
-            log.date_valeur = log.date_action
+        return Response({"res": "Action validated successfully"}, status=status.HTTP_200_OK)
 
-        elif type_action == "depot":
-            account = log.account
-            amount = log.montant
+class DeclineActionView(APIView):
+    permission_classes = [permissions.IsAuthenticated, PermissionBanquier]
 
-            account.solde += amount
+    def post(self, request, id, *args, **kwargs):
+        if queue_enabled():
+            return queued_response(enqueue_one(id, approve=False, requested_by=request.user.id))
 
-            log.date_valeur = log.date_action
+        outcome = settle_logs(Log.objects.filter(pk=id), approve=False).get(id)
 
-        elif type_action == "retrait":
-            account = log.account
-            amount = log.montant
+        if outcome is None:
+            return Response({"res": "Log not found or already processed"},
+                            status=status.HTTP_404_NOT_FOUND)
 
-            if account.solde < amount:
-                return Response({"res": "Insufficient funds for the withdrawal"},
-                                status=status.HTTP_400_BAD_REQUEST)
+        return Response({"res": "Action refused and date set to current date"}, status=status.HTTP_200_OK)
 
-            account.solde -= amount
+class ProcessPendingActionsView(APIView):
+    """
+    Validation ou refus groupé des actions en attente.
 
-            log.date_valeur = log.date_action
+    Corps attendu : {"decision": "validate" | "decline"} et soit {"ids": [...]},
+    soit un filtre {"action": "depot", "max_amount": "100"}.
+    Avec la file de règlement (``SETTLEMENT_QUEUE``), les logs sont mis en file
+    et la réponse 202 donne "queued" ou "not_found" pour chacun.
+    """
+    permission_classes = [permissions.IsAuthenticated, PermissionBanquier]
 
-        else:
-            return Response({"res": "Invalid action type"},
+    def post(self, request, *args, **kwargs):
+        decision = request.data.get("decision")
+        if decision not in ("validate", "decline"):
+            return Response({"res": "Invalid decision"},
                             status=status.HTTP_400_BAD_REQUEST)
 
+        ids = request.data.get("ids")
         try:
-            source_account.save()
-        except:
-            pass
-        try:
-            target_account.save()
-        except:
-            pass
-        try:
-            account.save()
-        except:
-            pass
-        log.save()
+            if ids is not None:
+                ids = [int(pk) for pk in ids]
+                # Un virement reçu se règle avec son virement envoyé : son id est "not_found"
+                logs = Log.objects.filter(pk__in=ids).exclude(action="virement_recu")
+            else:
+                logs = Log.objects.filter(date_valeur__isnull=True).exclude(action="virement_recu")
+                action = request.data.get("action")
+                if action:
+                    logs = logs.filter(action=action)
+                max_amount = request.data.get("max_amount")
+                if max_amount is not None:
+                    logs = logs.filter(montant__lte=Decimal(str(max_amount)))
+                if not action and max_amount is None:
+                    return Response({"res": "Provide ids or a filter"},
+                                    status=status.HTTP_400_BAD_REQUEST)
+        except (TypeError, ValueError, ArithmeticError):
+            return Response({"res": "Invalid ids or filter"},
+                            status=status.HTTP_400_BAD_REQUEST)
 
-        return Response({"res": "Action validated successfully"}, status=status.HTTP_200_OK)
+        if queue_enabled():
+            queued = set(enqueue(logs, approve=decision == "validate", requested_by=request.user.id))
+            pks = ids if ids is not None else sorted(queued)
+            results = [{"id": pk, "res": "queued" if pk in queued else NOT_FOUND} for pk in pks]
+            return Response({"res": "Actions queued", "results": results}, status=status.HTTP_202_ACCEPTED)
 
-class DeclineActionView(APIView):
+        outcomes = settle_logs(logs, approve=decision == "validate")
+        if ids is not None:
+            for pk in ids:
+                outcomes.setdefault(pk, NOT_FOUND)
+
+        results = [{"id": pk, "res": outcome} for pk, outcome in outcomes.items()]
+        return Response({"res": "Actions processed", "results": results}, status=status.HTTP_200_OK)
+
+class SettlementJobView(APIView):
+    """État d'une validation ou d'un refus mis en file, et résultat une fois traité par le worker."""
     permission_classes = [permissions.IsAuthenticated, PermissionBanquier]
 
-    def post(self, request, id, *args, **kwargs):
+    def get(self, request, id, *args, **kwargs):
         try:
-            log = Log.objects.get(pk=id, date_valeur__isnull=True)
-        except Log.DoesNotExist:
-            return Response({"res": "Log not found or already processed"},
+            job = SettlementJob.objects.get(pk=id)
+        except SettlementJob.DoesNotExist:
+            return Response({"res": "Job not found"},
                             status=status.HTTP_404_NOT_FOUND)
-
-        log.date_valeur = log.date_action
-
-        log.save()
-
-        return Response({"res": "Action refused and date set to current date"}, status=status.HTTP_200_OK)
+        return Response({
+            "id": job.pk,
+            "log": job.log_id,
+            "decision": "validate" if job.approve else "decline",
+            "status": job.status,
+            "res": job.outcome,
+        }, status=status.HTTP_200_OK)
 
 class ChangeAccountStateView(APIView):
     permission_classes = [permissions.IsAuthenticated, PermissionBanquier]
@@ -296,8 +540,10 @@ class ChangeAccountStateView(APIView):
             return Response({"res": "Invalid account type"},
                             status=status.HTTP_400_BAD_REQUEST)
 
+        # UPDATE ciblé : un save() complet écraserait un solde modifié entre-temps
+        Account.objects.filter(pk=account.pk).update(statut=new_state, version=F('version') + 1)
+        invalidate(CREATED_ACCOUNTS)
         account.statut = new_state
-        account.save()
 
         serializer = AccountSerializer(account)
         return Response(serializer.data, status=status.HTTP_200_OK)
@@ -306,6 +552,9 @@ class ListCreatedProcessAccountsView(APIView):
     permission_classes = [permissions.IsAuthenticated, PermissionBanquier]
 
     def get(self, request, *args, **kwargs):
+        return cached_response(CREATED_ACCOUNTS, self, request, self.build)
+
+    def build(self):
         accounts = Account.objects.filter(statut='en_creation')
         serializer = AccountSerializer(accounts, many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
@@ -313,6 +562,7 @@ class ListCreatedProcessAccountsView(APIView):
 class RequestNewAccountView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
+    @idempotent
     def post(self, request, *args, **kwargs):
         user_id = request.user.id
         data = {
@@ -324,4 +574,11 @@ class RequestNewAccountView(APIView):
         if serializer.is_valid():
             serializer.save()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+class MetricsView(APIView):
+    """Histogrammes et compteurs de l'instrumentation, au format texte de Prometheus."""
+
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(render_prometheus(registry.collect()),
+                            content_type="text/plain; version=0.0.4; charset=utf-8")
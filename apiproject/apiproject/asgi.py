@@ -3,14 +3,35 @@ ASGI config for apiproject project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Requests served through ASGI use ``settings.ASGI_ROOT_URLCONF`` so the hot
+read endpoints run as native async views. Run it with e.g.::
+
+    uvicorn apiproject.asgi:application --host 0.0.0.0 --port 8000 --workers 4
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'apiproject.settings')
 
-application = get_asgi_application()
+django.setup(set_prefix=False)
+
+from apiargent.compaction import ensure_ledger_storage  # noqa: E402
+
+# Refuse de servir si COMPACT_LEDGER ne correspond pas au format des tables de logs
+ensure_ledger_storage(close_connection=True)
+
+
+class AsyncURLConfHandler(ASGIHandler):
+    async def get_response_async(self, request):
+        request.urlconf = getattr(settings, 'ASGI_ROOT_URLCONF', settings.ROOT_URLCONF)
+        return await super().get_response_async(request)
+
+
+application = AsyncURLConfHandler()
@@ -0,0 +1,13 @@
+"""
+URL configuration used by the ASGI entry point (apiproject/asgi.py).
+
+The read endpoints listed in apiargent/async_urls.py are served by native
+async views; every other route falls through to the regular URLconf.
+"""
+from django.urls import include, path
+
+from .urls import urlpatterns as wsgi_urlpatterns
+
+urlpatterns = [
+    path("", include("apiargent.async_urls")),
+] + wsgi_urlpatterns
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -51,10 +52,14 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'apiargent.middleware.AsyncWhiteNoiseMiddleware',
+    'apiargent.routers.ReplicaRoutingMiddleware',
+    'apiargent.middleware.InstrumentationMiddleware',
 ]
 
 ROOT_URLCONF = 'apiproject.urls'
+# Sous ASGI, les endpoints de lecture les plus sollicités passent par des vues asynchrones
+ASGI_ROOT_URLCONF = 'apiproject.asgi_urls'
 
 TEMPLATES = [
     {
@@ -88,6 +93,26 @@ DATABASES = {
     }
 }
 
+# Lectures des requêtes GET sur des réplicas (alias de DATABASES), écritures
+# sur 'default' ; vide : tout passe par 'default'. Voir apiargent/routers.py.
+DATABASE_REPLICAS = []
+DATABASE_ROUTERS = ['apiargent.routers.ReplicaRouter']
+# Durée (secondes) pendant laquelle un client qui vient d'écrire lit la base principale
+REPLICA_PIN_SECONDS = 5
+# Logs stockés au format compact (montants en centimes, actions en codes entiers) ;
+# une base existante se convertit avec la commande compact_ledger
+COMPACT_LEDGER = False
+
+# Validation et refus mis en file et traités par le worker (manage.py settlement_worker) ;
+# False : règlement pendant la requête HTTP
+SETTLEMENT_QUEUE = True
+# Logs validés par le worker sans intervention d'un banquier, ex. [{'action': 'depot', 'max_amount': '100'}]
+AUTO_APPROVAL_RULES = []
+# Réponses des requêtes d'écriture avec en-tête Idempotency-Key, rejouées pendant
+# IDEMPOTENCY_TTL secondes (voir apiargent/idempotency.py)
+IDEMPOTENCY_CACHE = 'idempotency'
+IDEMPOTENCY_TTL = 24 * 3600
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -140,6 +165,9 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Ajoutez ceci à votre settings.py
 
 AUTH_API_URL = 'http://172.17.0.1:8000/api/validate-token/'
+AUTH_CACHE_TTL = 300  # secondes pendant lesquelles un token validé est frais
+AUTH_CACHE_STALE_TTL = 60  # un token expiré est encore servi pendant son rafraîchissement
+AUTH_NEGATIVE_CACHE_TTL = 30  # mise en cache des tokens refusés (401)
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
@@ -148,9 +176,39 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Instrumentation (apiargent/middleware.py) : fichiers de métriques partagés par les
+# workers gunicorn pour que /metrics/ agrège tous les processus.
+METRICS_DIR = '/tmp/apiargent_metrics'
+# Seuil (ms) au-delà duquel une requête SQL est journalisée dans 'apiargent.slow_queries' (None = désactivé)
+SLOW_QUERY_THRESHOLD_MS = None
+
+# Répertoire des fichiers SQLite partagés par tous les processus de l'API : cache,
+# idempotence et journal des événements. Le worker de règlement y écrit les
+# invalidations et les événements lus par les workers web : avec docker compose,
+# le même volume est monté dans les deux services (voir docker-compose.yml).
+SHARED_STATE_DIR = os.environ.get('APIARGENT_SHARED_DIR', '/tmp')
+EVENTS_LOCATION = os.path.join(SHARED_STATE_DIR, 'apiargent_events.sqlite3')
+
+# Cache partagé entre les workers gunicorn d'une même machine (voir apiargent/cache.py).
+# `python manage.py cache_stats` affiche les hits/misses pour le dimensionner.
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'unique-snowflake',
-    }
+        'BACKEND': 'apiargent.cache.SQLiteCache',
+        'LOCATION': os.path.join(SHARED_STATE_DIR, 'apiargent_cache.sqlite3'),
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'MAX_ENTRIES': 50000,
+            'CULL_FREQUENCY': 4,
+        },
+    },
+    # Séparé du cache par défaut : les réponses conservées n'évincent pas les tokens
+    'idempotency': {
+        'BACKEND': 'apiargent.cache.SQLiteCache',
+        'LOCATION': os.path.join(SHARED_STATE_DIR, 'apiargent_idempotency.sqlite3'),
+        'TIMEOUT': 24 * 3600,
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+            'CULL_FREQUENCY': 4,
+        },
+    },
 }
\ No newline at end of file
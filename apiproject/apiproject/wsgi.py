@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'apiproject.settings')
 
 application = get_wsgi_application()
+
+from apiargent.compaction import ensure_ledger_storage  # noqa: E402
+
+# Refuse de servir si COMPACT_LEDGER ne correspond pas au format des tables de logs
+ensure_ledger_storage(close_connection=True)